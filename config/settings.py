@@ -48,31 +48,85 @@ INSTALLED_APPS = [
     "corsheaders",
     'ecom',
     'rest_framework',
+    'django_filters',
     'drf_spectacular',
 ]
 
+# Opt-in: authenticate from access-token claims (id, username, role) instead of
+# loading the user row on every request. Deactivation and role changes are read
+# from a cache that lives AUTH_USER_CACHE_TTL seconds (ecom/authentication.py).
+JWT_STATELESS_AUTH = getenv('JWT_STATELESS_AUTH', '').lower() in ('1', 'true', 'yes')
+AUTH_USER_CACHE_TTL = int(getenv('AUTH_USER_CACHE_TTL', 30))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'ecom.authentication.StatelessJWTAuthentication'
+        if JWT_STATELESS_AUTH else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # JSON unless the client asks for MessagePack (internal service clients).
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'ecom.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'ecom.parsers.MessagePackParser',
+    ],
     
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'ecom.throttling.UserRateThrottle',
+        'ecom.throttling.AnonRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'user': '500/min', 
-        'anon': '200/min', 
+        'user': getenv('API_USER_THROTTLE_RATE', '500/min'),
+        'anon': getenv('API_ANON_THROTTLE_RATE', '200/min'),
     },
     
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # 'PAGE_SIZE': 1,
 }
 
+# Where the throttles keep their sliding-window counters (ecom/throttling.py):
+# 'memory' (per process), 'sqlite' (a file shared by the workers of one host)
+# or 'cache' (THROTTLE_CACHE_ALIAS, shared across hosts with Redis/memcached).
+THROTTLE_STORE = getenv('THROTTLE_STORE', 'memory')
+THROTTLE_SQLITE_PATH = getenv('THROTTLE_SQLITE_PATH', str(BASE_DIR / 'throttle.sqlite3'))
+THROTTLE_CACHE_ALIAS = getenv('THROTTLE_CACHE_ALIAS', 'default')
+
+# Keyset pagination used by the order and product list endpoints (ecom/pagination.py).
+# Clients may ask for a smaller or larger page with ?page_size=, capped at the maximum.
+PAGINATION_PAGE_SIZE = int(getenv('PAGINATION_PAGE_SIZE', 50))
+PAGINATION_MAX_PAGE_SIZE = int(getenv('PAGINATION_MAX_PAGE_SIZE', 500))
+
+# Product and order list/retrieve are serialized from `.values()` rows
+# (ecom.serializers.ValuesSerializer) rather than through ModelSerializer.
+FAST_READ_SERIALIZERS = getenv('FAST_READ_SERIALIZERS', '1').lower() in ('1', 'true', 'yes')
+
+
+# Request metrics (ecom/metrics.py): per-route timing, query and response
+# size histograms served at /api/v1/metrics/, and a Server-Timing header on
+# responses to admins (to everyone under DEBUG) unless SERVER_TIMING is off.
+METRICS_ENABLED = getenv('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+SERVER_TIMING = getenv('SERVER_TIMING', '1').lower() in ('1', 'true', 'yes')
+
+# Response compression (ecom/compression.py): bodies of COMPRESSION_MIN_SIZE
+# bytes or more go out with the first of COMPRESSION_ENCODINGS the client
+# accepts (zstd only with the zstandard package installed). Below ~1 KiB a
+# response fits in one packet anyway.
+COMPRESSION_ENABLED = getenv('COMPRESSION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_SIZE = int(getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_ENCODINGS = [name.strip() for name in getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')]
+COMPRESSION_GZIP_LEVEL = int(getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(getenv('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_ZSTD_LEVEL = int(getenv('COMPRESSION_ZSTD_LEVEL', 3))
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -85,6 +139,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
+if COMPRESSION_ENABLED:
+    # Ahead of every middleware that reads or changes the body on the way out.
+    MIDDLEWARE.insert(0, 'ecom.compression.CompressionMiddleware')
+if METRICS_ENABLED:
+    # Outermost, so the timings cover the whole stack and the sizes are
+    # those sent.
+    MIDDLEWARE.insert(0, 'ecom.metrics.MetricsMiddleware')
 
 ROOT_URLCONF = 'config.urls'
 
@@ -121,6 +182,117 @@ DATABASES = {
     )
 }
 
+# The concurrency tests need real file locking: the default in-memory SQLite
+# test database raises "table is locked" instead of waiting for the writer.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Read replicas (ecom/routers.py): comma-separated database URLs, added as
+# replica1, replica2, ... GET list/retrieve of categories, products and
+# orders read from one of them; writes and everything else use the primary.
+# A user who wrote in the last READ_YOUR_WRITES_SECONDS (set it above the
+# replication lag) reads from the primary. The marker is kept in the
+# READ_YOUR_WRITES_CACHE_ALIAS cache, the catalog cache by default since
+# deployments share it between workers.
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=600, conn_health_checks=True)
+    # Tests read the replica through a second connection to the test database.
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['ecom.routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+READ_YOUR_WRITES_SECONDS = float(getenv('READ_YOUR_WRITES_SECONDS', 5))
+READ_YOUR_WRITES_CACHE_ALIAS = getenv('READ_YOUR_WRITES_CACHE_ALIAS', 'catalog')
+
+# Connection pooling (PostgreSQL, psycopg 3): each worker process keeps a
+# psycopg_pool of DATABASE_POOL_MIN_SIZE to DATABASE_POOL_MAX_SIZE
+# connections per database, shared by its threads, and a request waits up
+# to DATABASE_POOL_TIMEOUT seconds for one. Pooled connections are handed
+# out without a health-check query: the pool drops broken ones when they
+# come back. Other databases keep persistent per-thread connections.
+DATABASE_POOL = getenv('DATABASE_POOL', '1').lower() in ('1', 'true', 'yes')
+DATABASE_POOL_MIN_SIZE = int(getenv('DATABASE_POOL_MIN_SIZE', 2))
+DATABASE_POOL_MAX_SIZE = int(getenv('DATABASE_POOL_MAX_SIZE', 10))
+DATABASE_POOL_TIMEOUT = float(getenv('DATABASE_POOL_TIMEOUT', 10))
+for config in DATABASES.values():
+    if DATABASE_POOL and config['ENGINE'].startswith('django.db.backends.postgresql'):
+        # Django refuses persistent connections on top of a pool.
+        config['CONN_MAX_AGE'] = 0
+        config['CONN_HEALTH_CHECKS'] = False
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+        }
+
+# Under gunicorn (gunicorn.conf.py) each worker opens its database
+# connections, loads the URLconf and builds the API schema before it
+# accepts requests (ecom/warmup.py), so the first ones after a deploy don't
+# pay for it.
+WORKER_WARMUP = getenv('WORKER_WARMUP', '1').lower() in ('1', 'true', 'yes')
+
+# The OpenAPI schema is generated once per code version (ecom/schema.py).
+# Set CODE_VERSION (e.g. to the deployed commit) to name the version instead
+# of hashing the source at startup.
+CODE_VERSION = getenv('CODE_VERSION', '')
+
+# Serve catalog GET list/retrieve from async views (ecom/async_views.py). Only
+# worth it under an ASGI server (see README); under WSGI every request would
+# pay for an event loop.
+ASYNC_CATALOG_VIEWS = getenv('ASYNC_CATALOG_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Product search (ecom/search.py): 'postgres' uses full-text and trigram
+# indexes, 'local' an in-process index; 'auto' picks by database vendor.
+PRODUCT_SEARCH_BACKEND = getenv('PRODUCT_SEARCH_BACKEND', 'auto')
+# The local index follows other processes' writes through the catalog cache
+# when it is shared; with a per-process cache it is rebuilt after this many
+# seconds instead.
+SEARCH_INDEX_MAX_AGE = int(getenv('SEARCH_INDEX_MAX_AGE', 60))
+
+# Background jobs (ecom/jobs.py), run by `manage.py run_jobs`. A failed job is
+# retried after JOBS_RETRY_BACKOFF * 2**(attempt - 1) seconds, capped at
+# JOBS_RETRY_BACKOFF_MAX, until it has run JOBS_MAX_ATTEMPTS times. A job
+# whose worker stops answering is handed to another worker after
+# JOBS_LEASE_SECONDS. Finished jobs are deleted after JOBS_RETENTION_DAYS.
+JOBS_MAX_ATTEMPTS = int(getenv('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_BACKOFF = float(getenv('JOBS_RETRY_BACKOFF', 10))
+JOBS_RETRY_BACKOFF_MAX = float(getenv('JOBS_RETRY_BACKOFF_MAX', 3600))
+JOBS_LEASE_SECONDS = int(getenv('JOBS_LEASE_SECONDS', 300))
+JOBS_RETENTION_DAYS = int(getenv('JOBS_RETENTION_DAYS', 7))
+
+# Products at or below this stock trigger a low-stock alert to admins and
+# are the default for the analytics low-stock report.
+LOW_STOCK_THRESHOLD = int(getenv('LOW_STOCK_THRESHOLD', 5))
+
+# Order notifications and stock alerts are sent by the job worker.
+EMAIL_BACKEND = getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = getenv('DEFAULT_FROM_EMAIL', 'shop@localhost')
+
+# Registers the trigram lookups used by the PostgreSQL search backend.
+if DATABASES['default']['ENGINE'].startswith('django.db.backends.postgresql'):
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+
+# Caches
+# The catalog cache holds serialized category/product responses. Local memory
+# is per process; point it at a shared backend (e.g. CATALOG_CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache, CATALOG_CACHE_LOCATION=redis://...)
+# so that every worker sees the same entries and invalidations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': getenv('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+    },
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TTL = int(getenv('CATALOG_CACHE_TTL', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +313,27 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (ecom.hashers). New passwords are hashed with
+# PASSWORD_HASHER (argon2, scrypt or pbkdf2); the others stay listed so
+# existing hashes still verify, and are rehashed at the next login. The
+# default costs are OWASP's minimums: Argon2id t=2, m=19 MiB, p=1 and
+# scrypt N=2**14, r=8, p=5.
+PASSWORD_HASHER = getenv('PASSWORD_HASHER', 'argon2')
+_PASSWORD_HASHERS = {
+    'argon2': 'ecom.hashers.Argon2PasswordHasher',
+    'scrypt': 'ecom.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'ecom.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+PASSWORD_ARGON2_TIME_COST = int(getenv('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(getenv('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(getenv('PASSWORD_ARGON2_PARALLELISM', 1))
+PASSWORD_SCRYPT_WORK_FACTOR = int(getenv('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_PARALLELISM = int(getenv('PASSWORD_SCRYPT_PARALLELISM', 5))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -176,5 +369,6 @@ SIMPLE_JWT = {
     "AUTH_COOKIE_SECURE": False,   
     "AUTH_COOKIE_SAMESITE": "None",  
     "AUTH_COOKIE_HTTP_ONLY": True, 
+    "TOKEN_USER_CLASS": "ecom.authentication.ClaimsUser",
 }
 
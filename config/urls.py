@@ -16,13 +16,13 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from ecom.views import api_home
+from drf_spectacular.views import SpectacularSwaggerView
+from ecom.views import SchemaView, api_home
 
 urlpatterns = [
     path('', api_home),
     path('admin/', admin.site.urls),
     path('api/v1/', include('ecom.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/schema/', SchemaView.as_view(), name='schema'),
     path('api/docs/',   SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 ]
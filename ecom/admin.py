@@ -1,8 +1,15 @@
 from django.contrib import admin
-from .models import User, Product, Category, Order
+from .models import User, Product, Category, Order, OrderItem, Job
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Product)
 admin.site.register(Category)
-admin.site.register(Order)
\ No newline at end of file
+admin.site.register(Order)
+admin.site.register(OrderItem)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'updated_at']
+    list_filter = ['status', 'name']
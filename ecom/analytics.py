@@ -0,0 +1,227 @@
+"""
+Sales and order-status rollups.
+
+Orders feed per-day rows: units, revenue and order counts per category and
+per product, and order counts per status. The rows are incremented in the
+transaction that places, cancels or re-statuses an order, with one upsert
+per table however many orders are involved, so the analytics endpoints
+read rollups instead of aggregating orders.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    Category, DailyCategorySales, DailyOrderStatus, DailyProductSales, Order, OrderItem, Product,
+)
+
+
+def order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def sales_totals():
+    return {'orders': 0, 'units': 0, 'revenue': Decimal(0)}
+
+
+def upsert_increments(model, key_fields, rows):
+    """
+    Add `rows` ({key tuple: {field: delta}}) to `model`'s counters with a
+    single INSERT ... ON CONFLICT DO UPDATE, creating missing rows.
+    """
+    if not rows:
+        return
+    table = model._meta.db_table
+    value_fields = list(next(iter(rows.values())))
+    fields = [model._meta.get_field(name) for name in key_fields + value_fields]
+    columns = [field.column for field in fields]
+    keys = ', '.join(columns[:len(key_fields)])
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(rows))
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in columns[len(key_fields):])
+    params = []
+    for key, values in rows.items():
+        row = [*key, *(values[name] for name in value_fields)]
+        params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders} '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+            params,
+        )
+
+
+def record_sales(orders, items, sign=1):
+    """
+    Add the sales of `orders` to the rollups, or take them out with
+    `sign=-1`. `items` are the orders' OrderItems, with `product` loaded.
+    """
+    days = {order.pk: order_day(order) for order in orders}
+    categories, products = defaultdict(sales_totals), defaultdict(sales_totals)
+    category_orders, product_orders = set(), set()
+
+    for item in items:
+        day = days[item.order_id]
+        revenue = item.quantity * item.unit_price
+        for rollup, seen, key in (
+            (categories, category_orders, (day, item.product.category_id)),
+            (products, product_orders, (day, item.product_id)),
+        ):
+            rollup[key]['units'] += sign * item.quantity
+            rollup[key]['revenue'] += sign * revenue
+            if (key, item.order_id) not in seen:
+                seen.add((key, item.order_id))
+                rollup[key]['orders'] += sign
+
+    upsert_increments(DailyCategorySales, ['day', 'category'], categories)
+    upsert_increments(DailyProductSales, ['day', 'product'], products)
+
+
+def record_statuses(orders, sign=1):
+    counts = defaultdict(lambda: {'orders': 0})
+    for order in orders:
+        counts[(order_day(order), order.status)]['orders'] += sign
+    upsert_increments(DailyOrderStatus, ['day', 'status'], counts)
+
+
+def order_placed(orders, items):
+    """Count newly created `orders`, whose OrderItems are `items`."""
+    record_statuses(orders)
+    placed = [order for order in orders if order.status != Order.STATUS_CANCELLED]
+    placed_ids = {order.pk for order in placed}
+    record_sales(placed, [item for item in items if item.order_id in placed_ids])
+
+
+def order_removed(order):
+    """Take a deleted order back out of the rollups."""
+    record_statuses([order], sign=-1)
+    if order.status != Order.STATUS_CANCELLED:
+        record_sales([order], order_items(order), sign=-1)
+
+
+def change_status(order, status):
+    """
+    Move `order` to `status` and update the rollups. The status is changed
+    with a conditional UPDATE, so if a concurrent request changed it first
+    nothing happens and False is returned.
+    """
+    previous = order.status
+    now = timezone.now()
+    with transaction.atomic():
+        changed = Order.objects.filter(pk=order.pk, status=previous).update(status=status, updated_at=now)
+        if not changed:
+            return False
+
+        counts = defaultdict(lambda: {'orders': 0})
+        counts[(order_day(order), previous)]['orders'] -= 1
+        counts[(order_day(order), status)]['orders'] += 1
+        upsert_increments(DailyOrderStatus, ['day', 'status'], counts)
+
+        if Order.STATUS_CANCELLED in (previous, status) and previous != status:
+            sign = -1 if status == Order.STATUS_CANCELLED else 1
+            record_sales([order], order_items(order), sign=sign)
+
+    order.status = status
+    order.updated_at = now
+    return True
+
+
+def order_items(order):
+    return list(OrderItem.objects.filter(order=order).select_related('product'))
+
+
+def rebuild_rollups(apps=global_apps, batch_size=5000):
+    """Recompute every rollup from the orders, in SQL aggregates."""
+    Order = apps.get_model('ecom', 'Order')
+    OrderItem = apps.get_model('ecom', 'OrderItem')
+    models = {
+        name: apps.get_model('ecom', name)
+        for name in ('DailyCategorySales', 'DailyProductSales', 'DailyOrderStatus')
+    }
+
+    with transaction.atomic():
+        for model in models.values():
+            model.objects.all().delete()
+
+        sold = (
+            OrderItem.objects
+            .exclude(order__status='cancelled')
+            .annotate(day=TruncDate('order__created_at'))
+        )
+        totals = {
+            'orders': Count('order_id', distinct=True),
+            'units': Sum('quantity'),
+            'revenue': Sum(F('quantity') * F('unit_price')),
+        }
+        for model, key in ((models['DailyCategorySales'], 'product__category'), (models['DailyProductSales'], 'product')):
+            field = key.rsplit('__', 1)[-1]
+            rows = sold.values('day', key).annotate(**totals).order_by().iterator(chunk_size=batch_size)
+            model.objects.bulk_create(
+                (model(**{'day': row['day'], f'{field}_id': row[key], 'orders': row['orders'],
+                          'units': row['units'], 'revenue': row['revenue'] or Decimal(0)})
+                 for row in rows),
+                batch_size=batch_size,
+            )
+
+        statuses = (
+            Order.objects.annotate(day=TruncDate('created_at'))
+            .values('day', 'status').annotate(orders=Count('id')).order_by()
+            .iterator(chunk_size=batch_size)
+        )
+        models['DailyOrderStatus'].objects.bulk_create(
+            (models['DailyOrderStatus'](day=row['day'], status=row['status'], orders=row['orders']) for row in statuses),
+            batch_size=batch_size,
+        )
+
+
+def sales_report(start, end, group_by='day', limit=100):
+    """
+    Orders, units and revenue between `start` and `end` (inclusive) per day,
+    or for the top `limit` categories or products by revenue. Reads only the
+    rollups, so the cost depends on the range, not on the number of orders.
+    """
+    totals = {'units_sum': Sum('units'), 'revenue_sum': Sum('revenue')}
+    in_range = {'day__range': (start, end)}
+
+    if group_by == 'day':
+        orders = dict(
+            DailyOrderStatus.objects.filter(**in_range).exclude(status=Order.STATUS_CANCELLED)
+            .values('day').annotate(orders_sum=Sum('orders')).values_list('day', 'orders_sum')
+        )
+        rows = DailyCategorySales.objects.filter(**in_range).values('day').annotate(**totals).order_by('day')
+        return [
+            {'day': row['day'], 'orders': orders.get(row['day'], 0), 'units': row['units_sum'],
+             'revenue': row['revenue_sum']}
+            for row in rows if row['units_sum']
+        ]
+
+    model, key, names = {
+        'category': (DailyCategorySales, 'category', Category.objects),
+        'product': (DailyProductSales, 'product', Product.objects),
+    }[group_by]
+    rows = list(
+        model.objects.filter(**in_range).values(key)
+        .annotate(orders_sum=Sum('orders'), **totals).filter(units_sum__gt=0)
+        .order_by('-revenue_sum', key)[:limit]
+    )
+    names = dict(names.filter(pk__in=[row[key] for row in rows]).values_list('pk', 'name'))
+    return [
+        {key: row[key], 'name': names.get(row[key], ''), 'orders': row['orders_sum'],
+         'units': row['units_sum'], 'revenue': row['revenue_sum']}
+        for row in rows
+    ]
+
+
+def status_counts(start, end):
+    """Orders placed between `start` and `end` (inclusive), by current status."""
+    counts = dict.fromkeys((value for value, _ in Order.STATUS_CHOICES), 0)
+    counts.update(
+        DailyOrderStatus.objects.filter(day__range=(start, end))
+        .values('status').annotate(orders_sum=Sum('orders')).values_list('status', 'orders_sum')
+    )
+    return counts
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class EcomConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecom'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+
+        from . import metrics, signals, tasks  # noqa: F401
+
+        if settings.METRICS_ENABLED:
+            connection_created.connect(metrics.install_query_recorder)
@@ -0,0 +1,131 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+
+class ClaimsUser(TokenUser):
+    """
+    Stand-in for `User` built from access-token claims. It carries the id,
+    username and role that the permissions and viewsets read. The id is
+    converted back from the claim's string, so it compares equal to foreign
+    keys such as `Order.customer_id`.
+    """
+    ROLE_ADMIN    = User.ROLE_ADMIN
+    ROLE_CUSTOMER = User.ROLE_CUSTOMER
+
+    def __init__(self, token):
+        super().__init__(token)
+        self.role = token.get('role', User.ROLE_CUSTOMER)
+
+    @cached_property
+    def id(self):
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def is_admin(self):
+        return self.role == self.ROLE_ADMIN
+
+
+def user_state_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_user_state(user_id):
+    """
+    `(is_active, role)` for a user, cached for `AUTH_USER_CACHE_TTL` seconds.
+    A missing user is cached as inactive.
+    """
+    key = user_state_cache_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('is_active', 'role').first()
+        state = tuple(row) if row else (False, None)
+        cache.set(key, state, settings.AUTH_USER_CACHE_TTL)
+    return state
+
+
+async def aget_user_state(user_id):
+    key = user_state_cache_key(user_id)
+    state = await cache.aget(key)
+    if state is None:
+        row = await User.objects.filter(pk=user_id).values_list('is_active', 'role').afirst()
+        state = tuple(row) if row else (False, None)
+        await cache.aset(key, state, settings.AUTH_USER_CACHE_TTL)
+    return state
+
+
+def forget_user_state(sender, instance, **kwargs):
+    cache.delete(user_state_cache_key(instance.pk))
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication without loading the user row. Deactivations and role
+    changes are picked up from `get_user_state()`, so they take effect within
+    `AUTH_USER_CACHE_TTL` seconds (immediately in the process that saved
+    them, or everywhere with a shared cache).
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        return self.apply_state(user, get_user_state(user.id))
+
+    async def aget_user(self, validated_token):
+        user = super().get_user(validated_token)
+        return self.apply_state(user, await aget_user_state(user.id))
+
+    def apply_state(self, user, state):
+        is_active, role = state
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        user.role = role
+        return user
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of DRF's `Request._authenticate()`. JWT validation runs
+    inline; the user lookup goes through `aget_user()` where the
+    authenticator has one and a worker thread otherwise. `request.user` and
+    `request.auth` are set, so `APIView.initial()` doesn't authenticate again.
+    """
+    for authenticator in request.authenticators:
+        try:
+            if isinstance(authenticator, JWTAuthentication):
+                user_auth_tuple = await ajwt_authenticate(authenticator, request)
+            else:
+                user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+
+        if user_auth_tuple is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth_tuple
+            return
+
+    request._not_authenticated()
+
+
+async def ajwt_authenticate(authenticator, request):
+    header = authenticator.get_header(request)
+    if header is None:
+        return None
+    raw_token = authenticator.get_raw_token(header)
+    if raw_token is None:
+        return None
+
+    validated_token = authenticator.get_validated_token(raw_token)
+    if hasattr(authenticator, 'aget_user'):
+        return await authenticator.aget_user(validated_token), validated_token
+    return await sync_to_async(authenticator.get_user)(validated_token), validated_token
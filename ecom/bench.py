@@ -0,0 +1,388 @@
+"""
+Helpers shared by the benchmark management commands: a throwaway database,
+a seeded dataset, query capture and latency statistics.
+"""
+import asyncio
+import math
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from .analytics import rebuild_rollups
+from .models import User, Category, Product, Order, OrderItem
+
+BENCH_PASSWORD = 'bench-password'
+LARGE_TABLES = ('ecom_order', 'ecom_orderitem', 'ecom_product')
+
+
+@contextmanager
+def benchmark_database(keepdb=False, verbosity=0):
+    """
+    Run against a separate database, built like the test database, so
+    benchmarks never touch real data. With `keepdb` a seeded database is
+    kept for the next run.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+        teardown_test_environment()
+
+
+@contextmanager
+def benchmark_environment(catalog_cache=False):
+    """
+    Measure the database, not the rate limits or, unless `catalog_cache`,
+    the catalog cache.
+    """
+    catalog_backend = 'locmem.LocMemCache' if catalog_cache else 'dummy.DummyCache'
+    throttle_classes = APIView.throttle_classes
+    APIView.throttle_classes = []
+    try:
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'catalog': {'BACKEND': f'django.core.cache.backends.{catalog_backend}', 'LOCATION': 'bench-catalog'},
+        }):
+            yield
+    finally:
+        APIView.throttle_classes = throttle_classes
+
+
+def seed_dataset(customers=100, categories=50, products=10_000, orders=100_000, batch_size=5000, log=None):
+    """
+    Bulk-insert a dataset of the given size, unless one is already there.
+    Returns the admin and one customer for driving requests.
+    """
+    log = log or (lambda message: None)
+    admin = User.objects.filter(username='bench-admin').first()
+    if admin is not None:
+        log('Reusing seeded dataset.')
+        return admin, User.objects.filter(role=User.ROLE_CUSTOMER).order_by('id').first()
+
+    rng = random.Random(42)
+    password = make_password(BENCH_PASSWORD)
+
+    log(f'Seeding {customers} customers, {categories} categories, {products} products, {orders} orders...')
+    admin = User.objects.create(username='bench-admin', password=password, role=User.ROLE_ADMIN)
+    User.objects.bulk_create(
+        (User(username=f'bench-customer-{i}', password=password) for i in range(customers)),
+        batch_size=batch_size,
+    )
+    customer_ids = list(User.objects.filter(role=User.ROLE_CUSTOMER).values_list('id', flat=True))
+
+    Category.objects.bulk_create(
+        (Category(name=f'Category {i}', description='Seeded') for i in range(categories)),
+        batch_size=batch_size,
+    )
+    category_ids = list(Category.objects.values_list('id', flat=True))
+
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f'Product {i}',
+                category_id=category_ids[i % len(category_ids)],
+                stock=rng.randint(0, 500),
+                price=Decimal(rng.randint(100, 100_000)) / 100,
+                is_active=rng.random() > 0.1,
+            )
+            for i in range(products)
+        ),
+        batch_size=batch_size,
+    )
+    prices = dict(Product.objects.values_list('id', 'price'))
+    product_ids = list(prices)
+
+    statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+    for start in range(0, orders, batch_size):
+        batch = []
+        for _ in range(min(batch_size, orders - start)):
+            product_id, quantity = rng.choice(product_ids), rng.randint(1, 5)
+            batch.append(Order(
+                customer_id=rng.choice(customer_ids),
+                product_id=product_id,
+                quantity=quantity,
+                total_price=quantity * prices[product_id],
+                status=rng.choice(statuses),
+            ))
+        Order.objects.bulk_create(batch)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=order.product_id, quantity=order.quantity,
+                      unit_price=prices[order.product_id])
+            for order in batch
+        )
+    # bulk_create skips the analytics hooks, so build the rollups in one go.
+    rebuild_rollups()
+    return admin, User.objects.get(pk=customer_ids[0])
+
+
+class QueryRecorder:
+    """Execute wrapper keeping the raw SQL and parameters of every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder.queries
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def full_scans(sql, plan, tables):
+    """
+    Plan lines that read all of one of `tables`: a sequential scan on
+    PostgreSQL, a filtered table scan or a sort of unindexed rows on SQLite.
+    """
+    names = '|'.join(re.escape(table) for table in tables)
+    if connection.vendor == 'postgresql':
+        pattern = re.compile(rf'Seq Scan on ({names})\b')
+        return [line for line in plan if pattern.search(line)]
+
+    # An unfiltered SQLite SCAN in rowid order is how a primary-key range is
+    # read, and sorting rows found through an index search, or rows of other
+    # tables such as the analytics rollups, is fine.
+    scan = re.compile(rf'^SCAN ({names})\b(?!.*USING)')
+    any_scan = re.compile(rf'^SCAN ({names})\b')
+    search = re.compile(rf'^SEARCH ({names})\b')
+    filtered = ' WHERE ' in sql
+    searched = any(search.search(line.strip()) for line in plan)
+    scanned = any(any_scan.search(line.strip()) for line in plan)
+    return [
+        line for line in plan
+        if (filtered and scan.search(line.strip()))
+        or ('USE TEMP B-TREE FOR ORDER BY' in line and scanned and not searched)
+    ]
+
+
+def time_calls(call, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies):
+    """Latency statistics in milliseconds."""
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting queries."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def find_regressions(report, baseline, threshold, noise_ms=0.5):
+    """
+    Compare scenario results with a baseline report. A scenario regresses
+    when it runs more queries per request, or when its p50 latency grows,
+    or its throughput falls, by more than `threshold` (a fraction), unless
+    the p50 difference is within `noise_ms`. Returns one line per problem.
+    """
+    previous = {entry['scenario']: entry for entry in baseline['scenarios']}
+    regressions = []
+    for entry in report['scenarios']:
+        before = previous.pop(entry['scenario'], None)
+        if before is None:
+            continue
+        name = entry['scenario']
+        if entry['queries']['max'] > before['queries']['max']:
+            regressions.append(f"{name}: {entry['queries']['max']} queries per request, was {before['queries']['max']}")
+        p50, p50_before = entry['latency']['p50_ms'], before['latency']['p50_ms']
+        if p50 - p50_before <= noise_ms:
+            continue
+        if p50 > p50_before * (1 + threshold):
+            regressions.append(f'{name}: p50 {p50:.2f} ms, was {p50_before:.2f} ms')
+        rps, rps_before = entry['requests_per_second'], before['requests_per_second']
+        if rps < rps_before * (1 - threshold):
+            regressions.append(f'{name}: {rps:.1f} req/s, was {rps_before:.1f} req/s')
+    regressions += [f'{name}: in the baseline but not run' for name in previous]
+    return regressions
+
+
+def bench_endpoint(name, user, url, iterations):
+    """
+    GET `url` as `user`: explain every query of one request, then time
+    `iterations` more. Raises RuntimeError unless the response is a 200.
+    """
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with record_queries() as queries:
+        response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f'{name}: GET {url} returned {response.status_code}')
+
+    plans, scans = [], []
+    for sql, params in queries:
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        plan = explain(sql, params)
+        plans.append({'sql': sql, 'plan': plan})
+        scans += full_scans(sql, plan, LARGE_TABLES)
+
+    return {
+        'endpoint': name,
+        'url': url,
+        'queries': len(queries),
+        'latency': summarize(time_calls(lambda: client.get(url), iterations)),
+        'plans': plans,
+        'full_scans': scans,
+    }
+
+
+def check_full_scans(report):
+    """Raise CommandError listing every endpoint whose plan reads a whole table."""
+    regressions = [(entry['endpoint'], line) for entry in report for line in entry['full_scans']]
+    if regressions:
+        raise CommandError('Full table scans:\n' + '\n'.join(f'  {name}: {line}' for name, line in regressions))
+
+
+def database_url():
+    """A DATABASE_URL pointing other processes at the benchmark database."""
+    db = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        return f"sqlite:///{db['NAME']}"
+    if connection.vendor == 'postgresql':
+        credentials = f"{quote(db['USER'] or '')}:{quote(db['PASSWORD'] or '')}@" if db['USER'] else ''
+        return f"postgres://{credentials}{db['HOST'] or 'localhost'}:{db['PORT'] or 5432}/{db['NAME']}"
+    raise CommandError(f'Cannot point a server process at a {connection.vendor} database.')
+
+
+@contextmanager
+def run_server(args, env, host, port, timeout=30):
+    """Run a server command from the project directory until it accepts connections."""
+    process = subprocess.Popen([sys.executable, '-m', *args], cwd=settings.BASE_DIR, env=env)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise CommandError(f'{args[0]} exited with status {process.returncode}')
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise CommandError(f'{args[0]} did not start listening on {host}:{port}')
+                time.sleep(0.2)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns the status and whether the connection stays open."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+
+    keep_alive = status_line.startswith('HTTP/1.1') and headers.get('connection', '').lower() != 'close'
+    return int(status_line.split()[1]), keep_alive
+
+
+async def http_load(host, port, paths, headers, concurrency, duration):
+    """
+    GET `paths` round-robin from `concurrency` connections for `duration`
+    seconds over keep-alive HTTP/1.1, reconnecting whenever the server
+    closes. Latencies include connecting. Returns latencies and a count of
+    responses per status (or 'error').
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    extra = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    requests = [
+        f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n{extra}\r\n'.encode('latin-1') for path in paths
+    ]
+    latencies, statuses = [], Counter()
+
+    async def client(offset):
+        reader = writer = None
+        sent = offset
+        while loop.time() < deadline:
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(requests[sent % len(requests)])
+                sent += concurrency
+                status, keep_alive = await read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                statuses['error'] += 1
+                keep_alive = False
+            else:
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return latencies, statuses
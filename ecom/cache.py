@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    """
+    The current catalog version. Every key embeds it, so bumping it retires
+    all cached catalog responses at once without having to find them.
+    """
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+async def aget_catalog_version():
+    cache = get_catalog_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(CATALOG_VERSION_KEY, version, timeout=None):
+            version = await cache.aget(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def invalidate_catalog(**kwargs):
+    # A timestamp rather than a counter, so that a version lost with a
+    # restarted local-memory cache is never handed out again.
+    get_catalog_cache().set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def catalog_cache_key(request, scope, version=None):
+    if version is None:
+        version = get_catalog_version()
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'catalog:{version}:{scope}:{path}'
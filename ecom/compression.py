@@ -0,0 +1,178 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses bodies of at least COMPRESSION_MIN_SIZE
+bytes with the first of COMPRESSION_ENCODINGS that the client accepts and
+this install supports: zstd needs the `zstandard` package, br `brotli`,
+gzip is always there. Streaming responses (the exports) are compressed as
+they are sent. Responses that already have a Content-Encoding, such as
+the precomputed schema, WhiteNoise's static files, which it serves
+precompressed, and responses marked `Cache-Control: no-transform` are left
+alone. So is HTML (the browsable API): it reflects request input next to
+the CSRF token, which compression would expose to BREACH.
+
+Every response is compressed as it goes out, so the default levels favour
+speed over the last few percent of size; `manage.py bench_compression`
+measures the trade-off.
+"""
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import cc_delim_re, patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level, wbits=31)
+
+    def start(self):
+        """The `compress(chunk)` and `finish()` functions of a stream."""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self, quality):
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def start(self):
+        compressor = brotli.Compressor(quality=self.quality)
+        return compressor.process, compressor.finish
+
+
+class Zstd:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def start(self):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return compressor.compress, compressor.flush
+
+
+def available_encodings():
+    """COMPRESSION_ENCODINGS this install supports, at their configured levels."""
+    encodings = {
+        'gzip': lambda: Gzip(settings.COMPRESSION_GZIP_LEVEL),
+        'br': lambda: Brotli(settings.COMPRESSION_BROTLI_QUALITY) if brotli else None,
+        'zstd': lambda: Zstd(settings.COMPRESSION_ZSTD_LEVEL) if zstandard else None,
+    }
+    return [encoding for encoding in (encodings[name]() for name in settings.COMPRESSION_ENCODINGS) if encoding]
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q > 0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress_stream(encoding, chunks):
+    compress, finish = encoding.start()
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(encoding, chunks):
+    compress, finish = encoding.start()
+    async for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """Runs as sync or async middleware to match the stack."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encodings = available_encodings()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.has_header('Content-Encoding') or isinstance(response, FileResponse):
+            return response
+        if 'no-transform' in cc_delim_re.split(response.get('Cache-Control', '').lower()):
+            return response
+        if response.get('Content-Type', '').startswith('text/html'):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((encoding for encoding in self.encodings if encoding.name in accepted), None)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(encoding, response.streaming_content)
+            else:
+                response.streaming_content = compress_stream(encoding, response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = encoding.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed bytes differ, but the representation is the same.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = f'W/{etag}'
+        response.headers['Content-Encoding'] = encoding.name
+        return response
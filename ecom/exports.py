@@ -0,0 +1,119 @@
+"""
+Streaming CSV and NDJSON exports.
+
+Records are read with QuerySet.iterator(chunk_size=...) (a server-side
+cursor on PostgreSQL, chunked fetches on SQLite, prefetches done once per
+chunk) and written to the response as they are read, so memory use stays
+flat whatever the number of rows.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .models import OrderItem
+
+CHUNK_SIZE = 2000
+# Response bodies are sent in pieces of about this many bytes.
+BUFFER_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+ORDER_FIELDS = ['id', 'created_at', 'status', 'customer_id', 'customer', 'quantity', 'total_price']
+ORDER_ITEM_FIELDS = ['product_id', 'product', 'category', 'quantity', 'unit_price', 'line_total']
+PRODUCT_FIELDS = ['id', 'name', 'category_id', 'category', 'price', 'stock', 'is_active', 'updated_at']
+
+
+def order_records(queryset, chunk_size=CHUNK_SIZE):
+    """Each order with its customer and items, two queries per chunk."""
+    queryset = queryset.select_related('customer').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product__category').order_by('id')),
+    )
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': order.pk,
+            'created_at': order.created_at.isoformat(),
+            'status': order.status,
+            'customer_id': order.customer_id,
+            'customer': order.customer.username,
+            'quantity': order.quantity,
+            'total_price': order.total_price,
+            'items': [
+                {
+                    'product_id': item.product_id,
+                    'product': item.product.name,
+                    'category': item.product.category.name,
+                    'quantity': item.quantity,
+                    'unit_price': item.unit_price,
+                    'line_total': item.line_total,
+                }
+                for item in order.items.all()
+            ],
+        }
+
+
+def product_records(queryset, chunk_size=CHUNK_SIZE):
+    """Products joined with their category name, as plain dicts."""
+    rows = queryset.values(
+        'id', 'name', 'category_id', 'category__name', 'price', 'stock', 'is_active', 'updated_at',
+    ).iterator(chunk_size=chunk_size)
+    for row in rows:
+        row['category'] = row.pop('category__name')
+        row['updated_at'] = row['updated_at'].isoformat()
+        yield row
+
+
+class Echo:
+    """A file-like object whose write() returns what it was given."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(records, fields, item_fields=None):
+    """
+    A header and one line per record, or with `item_fields`, one line per
+    item of the record's 'items' with the record's fields repeated.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields + [f'item_{field}' for field in item_fields or []])
+    for record in records:
+        values = [record[field] for field in fields]
+        if item_fields is None:
+            yield writer.writerow(values)
+        else:
+            for item in record['items']:
+                yield writer.writerow(values + [item[field] for field in item_fields])
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """Join lines into chunks of about `size` characters."""
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream(records, output, filename, fields, item_fields=None):
+    """A StreamingHttpResponse with `records` as CSV or NDJSON."""
+    if output == 'ndjson':
+        lines = ndjson_lines(records)
+    else:
+        lines = csv_lines(records, fields, item_fields)
+    response = StreamingHttpResponse(buffered(lines), content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,41 @@
+import django_filters
+
+from .models import Order, Product
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Every filter here is backed by an index: (category, id), (price, id),
+    stock, the partial active/inactive product indexes and the
+    case-insensitive name prefix index created in migration 0007.
+    """
+    # A plain number, so an unknown category is an empty page, not a lookup.
+    category  = django_filters.NumberFilter(field_name='category_id')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    in_stock  = django_filters.BooleanFilter(method='filter_in_stock')
+    is_active = django_filters.BooleanFilter(method='filter_is_active')
+    search    = django_filters.CharFilter(field_name='name', lookup_expr='istartswith')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock__gt=0) if value else queryset.filter(stock=0)
+
+    def filter_is_active(self, queryset, name, value):
+        # Customers only ever see active products.
+        if not self.request.user.is_admin:
+            return queryset
+        return queryset.filter(is_active=value)
+
+
+class OrderFilter(django_filters.FilterSet):
+    status         = django_filters.ChoiceFilter(choices=Order.STATUS_CHOICES)
+    created_after  = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Order
+        fields = []
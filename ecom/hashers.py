@@ -0,0 +1,41 @@
+"""
+Password hashers with their cost taken from settings.
+
+A password hash is meant to be expensive: about 25 ms of a core for
+Argon2id at the default PASSWORD_ARGON2_* cost, over 250 ms for Django's
+PBKDF2 default. The algorithm names are Django's, so hashes stay
+interchangeable with the stock hashers.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def load_hasher():
+    """
+    Hash once with the default hasher, so the first login doesn't pay for
+    loading its library (argon2-cffi's bindings).
+    """
+    hasher = hashers.get_hasher()
+    hasher.encode('warm-up', hasher.salt())
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id; needs argon2-cffi."""
+
+    def __init__(self):
+        self.time_cost = settings.PASSWORD_ARGON2_TIME_COST
+        self.memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+        self.parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    def __init__(self):
+        self.work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+        self.parallelism = settings.PASSWORD_SCRYPT_PARALLELISM
+        # OpenSSL refuses to use over 32 MiB unless allowed; scrypt needs
+        # 128 * block_size * work_factor bytes.
+        self.maxmem = 256 * self.block_size * self.work_factor
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    pass
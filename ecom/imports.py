@@ -0,0 +1,213 @@
+"""
+Bulk catalog import, used by `manage.py import_catalog` and the admin
+`POST /products/import/` endpoint.
+
+Rows are read from CSV, NDJSON or a JSON array and written in chunks, each
+in its own transaction and at a fixed number of queries whatever its size:
+one `in_bulk` for the categories it names, one to tell new products from
+existing ones, and an INSERT ... ON CONFLICT DO UPDATE on the (category,
+name) constraint. Rows are checked against the model fields in Python,
+without the per-row lookups of ProductSerializer, and a bad row is
+reported with its line number instead of failing the import.
+
+`bulk_create()` sends no signals, so each committed chunk bumps the catalog
+cache and search index versions itself.
+"""
+import csv
+import itertools
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import invalidate_catalog
+from .models import Category, Product
+from .search import bump_search_version
+
+FORMATS = ('csv', 'json')
+# Columns that only overwrite an existing product's value when given.
+OPTIONAL_FIELDS = ('stock', 'is_active')
+BOOLEANS = {'true': True, 'yes': True, '1': True, 't': True, 'false': False, 'no': False, '0': False, 'f': False}
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line number, row dict) from a text stream. 'json' is one object
+    per line (NDJSON) or, when the input starts with '[', a JSON array,
+    which is read whole.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    first = stream.read(1)
+    while first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        for number, row in enumerate(json.loads(first + stream.read()), start=1):
+            yield number, row
+        return
+
+    lines = itertools.chain([first + stream.readline()], stream)
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                yield number, exc
+
+
+def clean_row(row):
+    """
+    Check a row against the Product fields. Returns the cleaned values and
+    a list of errors; the category is left as given, by 'category' (name)
+    or 'category_id'.
+    """
+    if not isinstance(row, dict):
+        return None, ['Expected an object with name, category and price.']
+
+    values, errors = {}, []
+    for name in ('name', 'price', *OPTIONAL_FIELDS):
+        raw = row.get(name)
+        if raw in (None, ''):
+            if name in OPTIONAL_FIELDS:
+                continue
+            errors.append(f'{name}: This field is required.')
+            continue
+        if isinstance(raw, str):
+            raw = raw.strip()
+            if name == 'is_active':
+                raw = BOOLEANS.get(raw.lower(), raw)
+        try:
+            values[name] = Product._meta.get_field(name).clean(raw, None)
+        except ValidationError as exc:
+            errors += [f'{name}: {message}' for message in exc.messages]
+
+    category = row.get('category_id') or row.get('category')
+    if category in (None, ''):
+        errors.append('category: This field is required.')
+    elif row.get('category_id'):
+        try:
+            values['category_id'] = int(category)
+        except (TypeError, ValueError):
+            errors.append('category_id: A valid integer is required.')
+    else:
+        values['category_name'] = str(category).strip()
+    return values, errors
+
+
+class CatalogImport:
+    """
+    Upserts rows into the catalog chunk by chunk. Counts and the first
+    `max_errors` row errors are kept in `report`; `progress`, if given, is
+    called with it after each chunk.
+    """
+
+    def __init__(self, chunk_size=1000, create_categories=False, max_errors=1000, progress=None):
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.max_errors = max_errors
+        self.progress = progress
+        # (category_id, name) of every row imported so far: a product given
+        # twice is imported once and the repeat reported.
+        self.seen = {}
+        self.report = {'processed': 0, 'created': 0, 'updated': 0, 'rejected': 0, 'errors': []}
+
+    def run(self, rows):
+        chunk = []
+        for number, row in rows:
+            chunk.append((number, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self.report
+
+    def reject(self, number, errors):
+        self.report['rejected'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'row': number, 'errors': errors})
+
+    def import_chunk(self, chunk):
+        cleaned = []
+        for number, row in chunk:
+            if isinstance(row, Exception):
+                self.reject(number, [f'Invalid JSON: {row}'])
+                continue
+            values, errors = clean_row(row)
+            if errors:
+                self.reject(number, errors)
+            else:
+                cleaned.append((number, values))
+
+        with transaction.atomic():
+            by_name, by_id = self.resolve_categories(cleaned)
+
+            products = []
+            for number, values in cleaned:
+                if 'category_name' in values:
+                    category = by_name.get(values.pop('category_name'))
+                else:
+                    category = by_id.get(values.pop('category_id'))
+                if category is None:
+                    self.reject(number, ['category: Category does not exist.'])
+                    continue
+                key = (category.pk, values['name'])
+                if key in self.seen:
+                    self.reject(number, [f'Duplicate of row {self.seen[key]}.'])
+                    continue
+                self.seen[key] = number
+                given = tuple(name for name in OPTIONAL_FIELDS if name in values)
+                products.append((given, Product(category=category, **values)))
+
+            self.upsert(products)
+            if products:
+                transaction.on_commit(invalidate_catalog)
+                transaction.on_commit(bump_search_version)
+
+        self.report['processed'] += len(chunk)
+        if self.progress:
+            self.progress(self.report)
+
+    def resolve_categories(self, cleaned):
+        """Categories named in the chunk: one `in_bulk` by name, one by id."""
+        names = {values['category_name'] for _, values in cleaned if 'category_name' in values}
+        ids = {values['category_id'] for _, values in cleaned if 'category_id' in values}
+
+        by_name = Category.objects.in_bulk(names, field_name='name') if names else {}
+        missing = names - set(by_name)
+        if missing and self.create_categories:
+            Category.objects.bulk_create([Category(name=name) for name in sorted(missing)], ignore_conflicts=True)
+            by_name.update(Category.objects.in_bulk(missing, field_name='name'))
+        by_id = Category.objects.in_bulk(ids) if ids else {}
+        return by_name, by_id
+
+    def upsert(self, products):
+        """Insert or update `(given optional fields, product)` pairs."""
+        if not products:
+            return
+        existing = set(
+            Product.objects
+            .filter(category__in={product.category_id for _, product in products},
+                    name__in={product.name for _, product in products})
+            .values_list('category_id', 'name')
+        )
+        created = sum((product.category_id, product.name) not in existing for _, product in products)
+        self.report['created'] += created
+        self.report['updated'] += len(products) - created
+
+        # Optional columns a row leaves out keep their current value, so
+        # rows are upserted in groups by the columns they give.
+        groups = {}
+        for given, product in products:
+            groups.setdefault(given, []).append(product)
+        for given, group in groups.items():
+            Product.objects.bulk_create(
+                group,
+                update_conflicts=True,
+                unique_fields=['category', 'name'],
+                update_fields=['price', *given, 'updated_at'],
+            )
@@ -0,0 +1,75 @@
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    """Stock read for an order was taken by another checkout before the UPDATE."""
+
+    def __init__(self, lines):
+        super().__init__('Stock was taken by another checkout.')
+        self.lines = lines
+
+
+def reserve_stock(product, quantity):
+    """
+    Take `quantity` units of `product` out of stock.
+
+    The check and the decrement are one conditional UPDATE, so concurrent
+    checkouts can neither oversell nor lose each other's writes, and only the
+    product's row is locked. Returns False, leaving stock untouched, when the
+    product is inactive or has fewer than `quantity` units left.
+    """
+    reserved = (
+        Product.objects
+        .filter(pk=product.pk, is_active=True, stock__gte=quantity)
+        .update(stock=F('stock') - quantity, updated_at=timezone.now())
+    )
+    if reserved:
+        # Product responses include stock, and update() sends no signals.
+        transaction.on_commit(invalidate_catalog)
+    return reserved == 1
+
+
+def reserve_stock_lines(lines):
+    """
+    Reserve stock for several `(product, quantity)` lines with one UPDATE.
+
+    The products must have been read with `select_for_update()` inside the
+    caller's transaction. Lines are allocated in order: a line that no longer
+    fits is left out without affecting the others, and each product's
+    in-memory `stock` is decremented as it is allocated. Returns one boolean
+    per line.
+
+    The UPDATE re-checks each product's stock, as reserve_stock() does,
+    since SQLite ignores the row locks. If another checkout took the stock
+    meanwhile, InsufficientStock is raised; the caller's transaction must
+    then roll back the rows that were updated.
+    """
+    reserved, taken = [], {}
+    for product, quantity in lines:
+        fits = product.is_active and product.stock >= quantity
+        if fits:
+            product.stock -= quantity
+            taken[product.pk] = taken.get(product.pk, 0) + quantity
+        reserved.append(fits)
+
+    if taken:
+        fits = reduce(or_, (Q(pk=pk, stock__gte=quantity) for pk, quantity in taken.items()))
+        updated = Product.objects.filter(fits, is_active=True).update(
+            stock=F('stock') - Case(
+                *[When(pk=pk, then=Value(quantity)) for pk, quantity in taken.items()],
+                output_field=PositiveIntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(taken):
+            raise InsufficientStock(lines)
+        transaction.on_commit(invalidate_catalog)
+    return reserved
@@ -0,0 +1,221 @@
+"""
+A job queue on the Job table, so no broker is needed.
+
+Handlers are registered with `@job('name')`. `enqueue()` inserts a row in
+the caller's transaction: a job exists if, and only if, the change that
+asked for it was committed. `manage.py run_jobs` runs a Worker, which
+claims due jobs, runs them on a thread pool and retries failures with
+exponential backoff.
+
+A claim is a conditional UPDATE from pending to running, so any number of
+workers, on SQLite or PostgreSQL, can share the table: each job is claimed
+by one of them. A claim is a lease; if the worker dies, the job is claimed
+again when the lease runs out, so handlers must tolerate running twice. A
+job that has used up its attempts is marked failed instead, so one that
+crashes its worker is not retried forever.
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name, max_attempts=None):
+    """Register the decorated function as the handler for jobs called `name`."""
+    def register(func):
+        func.job_name = name
+        func.max_attempts = max_attempts or settings.JOBS_MAX_ATTEMPTS
+        registry[name] = func
+        return func
+    return register
+
+
+def build(name, payload=None, delay=0):
+    if name not in registry:
+        raise LookupError(f"No handler is registered for job '{name}'.")
+    return Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=registry[name].max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue(name, payload=None, delay=0):
+    """Insert one job, due in `delay` seconds. `payload` must be JSON-serializable."""
+    new_job = build(name, payload, delay)
+    new_job.save()
+    return new_job
+
+
+def enqueue_many(jobs):
+    """Insert `(name, payload)` jobs with a single INSERT."""
+    return Job.objects.bulk_create(build(name, payload) for name, payload in jobs)
+
+
+def backoff(attempts):
+    """Seconds before retrying after `attempts` failed runs, with jitter."""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOBS_RETRY_BACKOFF_MAX)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(limit, lease=None):
+    """
+    Claim up to `limit` due jobs: pending ones whose run_at has passed and
+    running ones whose lease expired with attempts left. Returns the claimed
+    Job objects.
+    """
+    now = timezone.now()
+    lease = lease or settings.JOBS_LEASE_SECONDS
+    abandoned = Job.objects.filter(
+        status=Job.STATUS_RUNNING, lease_until__lt=now, attempts__gte=F('max_attempts'),
+    ).update(
+        status=Job.STATUS_FAILED,
+        claimed_by='',
+        lease_until=None,
+        last_error='The lease expired on the last attempt: the worker stopped responding.',
+        updated_at=now,
+    )
+    if abandoned:
+        logger.error('%s job(s) failed for good: their lease expired on the last attempt.', abandoned)
+
+    expired = list(
+        Job.objects.filter(status=Job.STATUS_RUNNING, lease_until__lt=now, attempts__lt=F('max_attempts'))
+        .values_list('id', flat=True)[:limit]
+    )
+    due = list(
+        Job.objects.filter(status=Job.STATUS_PENDING, run_at__lte=now)
+        .order_by('run_at', 'id').values_list('id', flat=True)[:limit - len(expired)]
+    ) if len(expired) < limit else []
+
+    token = uuid.uuid4().hex
+    claimed = 0
+    # Another worker may claim some of the same rows first: the conditional
+    # UPDATEs then skip them.
+    for status, ids, condition in (
+        (Job.STATUS_RUNNING, expired, {'lease_until__lt': now, 'attempts__lt': F('max_attempts')}),
+        (Job.STATUS_PENDING, due, {}),
+    ):
+        if ids:
+            claimed += Job.objects.filter(pk__in=ids, status=status, **condition).update(
+                status=Job.STATUS_RUNNING,
+                claimed_by=token,
+                lease_until=now + timedelta(seconds=lease),
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(claimed_by=token, status=Job.STATUS_RUNNING).order_by('run_at', 'id'))
+
+
+def execute(claimed_job):
+    """
+    Run a claimed job and record the outcome. A failed job is retried after
+    `backoff()` until it has used up its attempts, then marked failed.
+    """
+    handler = registry.get(claimed_job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler is registered for job '{claimed_job.name}'.")
+        handler(**claimed_job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if claimed_job.attempts >= claimed_job.max_attempts:
+            logger.error('Job %s (%s) failed for good:\n%s', claimed_job.pk, claimed_job.name, error)
+            outcome = {'status': Job.STATUS_FAILED}
+        else:
+            logger.warning('Job %s (%s) failed, will retry:\n%s', claimed_job.pk, claimed_job.name, error)
+            outcome = {
+                'status': Job.STATUS_PENDING,
+                'run_at': timezone.now() + timedelta(seconds=backoff(claimed_job.attempts)),
+            }
+        outcome['last_error'] = error
+    else:
+        outcome = {'status': Job.STATUS_DONE}
+
+    # Only while we still hold the claim: after a lost lease the job is
+    # another worker's.
+    updated = Job.objects.filter(pk=claimed_job.pk, claimed_by=claimed_job.claimed_by).update(
+        lease_until=None, updated_at=timezone.now(), **outcome,
+    )
+    return outcome['status'] if updated else None
+
+
+def purge(days=None):
+    """Delete jobs that finished successfully more than `days` days ago."""
+    days = settings.JOBS_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    # updated_at is when the job finished; run_at is only when it was due.
+    deleted, _ = Job.objects.filter(status=Job.STATUS_DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """
+    Claims due jobs and runs up to `concurrency` of them at a time on a
+    thread pool, polling every `poll_interval` seconds when idle.
+    """
+    purge_interval = 3600
+
+    def __init__(self, concurrency=4, poll_interval=1.0, lease=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.counts = {Job.STATUS_DONE: 0, Job.STATUS_PENDING: 0, Job.STATUS_FAILED: 0}
+
+    def stop(self):
+        """Stop claiming jobs; run() returns once the running ones finish."""
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Work until stop() is called or, with `once`, until no job is due."""
+        running = set()
+        next_purge = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job') as pool:
+            while not self.stopping.is_set():
+                if time.monotonic() >= next_purge:
+                    purge()
+                    next_purge = time.monotonic() + self.purge_interval
+
+                free = self.concurrency - len(running)
+                if free:
+                    running |= {pool.submit(self.execute, claimed) for claimed in claim(free, self.lease)}
+                close_old_connections()
+
+                if running:
+                    # Claim again as soon as a slot frees up, or after a
+                    # poll interval to pick up newly due jobs.
+                    _, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif once:
+                    break
+                else:
+                    self.stopping.wait(self.poll_interval)
+        return self.counts
+
+    def execute(self, claimed_job):
+        try:
+            status = execute(claimed_job)
+            if status:
+                with self.lock:
+                    self.counts[status] += 1
+        finally:
+            # Each pool thread has its own connection.
+            close_old_connections()
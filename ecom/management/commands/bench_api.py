@@ -0,0 +1,271 @@
+import itertools
+import json
+import platform
+import time
+import uuid
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+
+from ecom import urls as ecom_urls
+from ecom.bench import (
+    BENCH_PASSWORD, QueryCounter, benchmark_database, benchmark_environment, find_regressions, seed_dataset,
+    summarize,
+)
+from ecom.models import Category, Order, Product
+from ecom.serializers import MyTokenObtainPairSerializer
+
+
+class Scenario:
+    """
+    One request, repeated: `prepare(i)` runs untimed before the i-th request
+    and returns its URL and body. Requests that hash a password or read a
+    whole table are `slow` and run fewer times.
+    """
+
+    def __init__(self, name, route, method, user, prepare, expect=200, slow=False, format='json'):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.user = user
+        self.prepare = prepare
+        self.expect = expect
+        self.slow = slow
+        self.format = format
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, then drive every API route in-process "
+        "(auth, catalog CRUD, orders, analytics, exports) and record throughput, "
+        "latency percentiles and queries per request. With --baseline, fail if "
+        "a scenario regressed past --threshold; with --update-baseline, save "
+        "the run as the new baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--orders', type=int, default=50_000)
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--slow-iterations', type=int, default=5,
+                            help="Iterations of scenarios that hash passwords or export whole tables.")
+        parser.add_argument('--warmup', type=int, default=3, help="Unrecorded requests per scenario.")
+        parser.add_argument('--output', default='bench_api.json', help="Where to write the JSON report.")
+        parser.add_argument('--baseline', help="A previous report to compare with.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write this run to --baseline instead of comparing.")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Relative slowdown counted as a regression (0.2 = 20%%).")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        if options['update_baseline'] and not options['baseline']:
+            raise CommandError('--update-baseline needs --baseline.')
+        baseline = None
+        if options['baseline'] and not options['update_baseline']:
+            try:
+                with open(options['baseline']) as fh:
+                    baseline = json.load(fh)
+            except FileNotFoundError:
+                raise CommandError(f"No baseline at {options['baseline']}; create one with --update-baseline.")
+
+        dataset = {name: options[name] for name in ('customers', 'categories', 'products', 'orders')}
+        with benchmark_database(keepdb=options['keepdb']), benchmark_environment(catalog_cache=True):
+            admin, customer = seed_dataset(**dataset, log=self.stdout.write)
+            scenarios = self.get_scenarios(admin, customer)
+            self.check_coverage(scenarios)
+
+            results = []
+            for scenario in scenarios:
+                iterations = options['slow_iterations'] if scenario.slow else options['iterations']
+                entry = self.run_scenario(scenario, iterations, options['warmup'])
+                latency = entry['latency']
+                self.stdout.write(
+                    f"{scenario.name:34} {entry['requests_per_second']:9.1f} req/s"
+                    f"  p50 {latency['p50_ms']:8.2f} ms  p99 {latency['p99_ms']:8.2f} ms"
+                    f"  {entry['queries']['max']:3} queries"
+                )
+                results.append(entry)
+
+        report = {
+            'dataset': dataset,
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'scenarios': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+        elif baseline is not None:
+            self.compare(report, baseline, options['threshold'])
+
+    def compare(self, report, baseline, threshold):
+        if baseline['dataset'] != report['dataset'] or baseline['environment'] != report['environment']:
+            self.stdout.write(self.style.WARNING(
+                'The baseline was recorded with a different dataset or environment; timings may not compare.'
+            ))
+        regressions = find_regressions(report, baseline, threshold)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(f'  {line}' for line in regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {threshold:.0%} of the baseline.'))
+
+    def check_coverage(self, scenarios):
+        """Warn about named API routes no scenario requests."""
+        resolver = get_resolver(ecom_urls)
+        names = {name for name in resolver.reverse_dict if isinstance(name, str)}
+        missing = names - {scenario.route for scenario in scenarios}
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Routes without a scenario: {', '.join(sorted(missing))}"))
+
+    def run_scenario(self, scenario, iterations, warmup):
+        client = APIClient()
+        if scenario.user is not None:
+            token = MyTokenObtainPairSerializer.get_token(scenario.user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        request = getattr(client, scenario.method)
+
+        def call(i):
+            url, data = scenario.prepare(i)
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = request(url, data, format=scenario.format)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if response.status_code != scenario.expect:
+                raise CommandError(
+                    f'{scenario.name}: {scenario.method.upper()} {url} returned {response.status_code}, '
+                    f'expected {scenario.expect}'
+                )
+            return elapsed, counter.count
+
+        for i in range(warmup):
+            call(-1 - i)
+        latencies, queries = zip(*(call(i) for i in range(iterations)))
+        return {
+            'scenario': scenario.name,
+            'route': scenario.route,
+            'method': scenario.method.upper(),
+            'iterations': iterations,
+            'requests_per_second': round(iterations / sum(latencies), 1),
+            'latency': summarize(latencies),
+            'queries': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)},
+        }
+
+    def get_scenarios(self, admin, customer):
+        # Unique per run, so a kept database can be benchmarked again.
+        run = uuid.uuid4().hex[:8]
+        category = Category.objects.order_by('id').first()
+        product = Product.objects.filter(is_active=True).order_by('id').first()
+        # Orders are placed against one product with stock to spare.
+        stocked = Product.objects.create(name=f'Bench stock {run}', category=category, price='9.99',
+                                         stock=10 ** 9)
+        import_rows = [
+            {'name': name, 'category': category_name, 'price': str(price)}
+            for name, category_name, price in Product.objects.order_by('id')
+            .values_list('name', 'category__name', 'price')[:50]
+        ]
+        refresh_token = str(MyTokenObtainPairSerializer.get_token(customer))
+        statuses = itertools.cycle([Order.STATUS_CONFIRMED, Order.STATUS_PENDING])
+
+        client = APIClient()
+        client.force_authenticate(customer)
+
+        def place_order():
+            return client.post(reverse('order-list'), {'product': stocked.pk, 'quantity': 1}, format='json').data['id']
+
+        order = Order.objects.get(pk=place_order())
+
+        def new_category(i):
+            return Category.objects.create(name=f'Bench {run} {i}')
+
+        def new_product(i):
+            return Product.objects.create(name=f'Bench {run} {i}', category=category, price='1.00', stock=1)
+
+        fixed = lambda url, data=None: lambda i: (url, data)
+
+        return [
+            Scenario('register', 'register', 'post', None, lambda i: (
+                reverse('register'),
+                {'username': f'bench-{run}-{i}', 'email': f'bench-{run}-{i}@example.com', 'password': BENCH_PASSWORD},
+            ), expect=201, slow=True),
+            Scenario('login', 'token_obtain_pair', 'post', None, fixed(
+                reverse('token_obtain_pair'), {'username': customer.username, 'password': BENCH_PASSWORD},
+            ), slow=True),
+            Scenario('token refresh', 'token_refresh', 'post', None, fixed(
+                reverse('token_refresh'), {'refresh': refresh_token},
+            )),
+            Scenario('api root', 'api-root', 'get', customer, fixed(reverse('api-root'))),
+
+            Scenario('category list', 'category-list', 'get', customer, fixed(reverse('category-list'))),
+            Scenario('category detail', 'category-detail', 'get', customer,
+                     fixed(reverse('category-detail', args=[category.pk]))),
+            Scenario('category create', 'category-list', 'post', admin, lambda i: (
+                reverse('category-list'), {'name': f'Created {run} {i}', 'description': 'Bench'},
+            ), expect=201),
+            Scenario('category update', 'category-detail', 'patch', admin, lambda i: (
+                reverse('category-detail', args=[category.pk]), {'description': f'Updated {i}'},
+            )),
+            Scenario('category delete', 'category-detail', 'delete', admin, lambda i: (
+                reverse('category-detail', args=[new_category(i).pk]), None,
+            ), expect=204),
+
+            Scenario('product list', 'product-list', 'get', customer, fixed(reverse('product-list'))),
+            Scenario('product list (filtered)', 'product-list', 'get', customer, fixed(
+                f"{reverse('product-list')}?category={category.pk}&min_price=10&ordering=price",
+            )),
+            Scenario('product detail', 'product-detail', 'get', customer,
+                     fixed(reverse('product-detail', args=[product.pk]))),
+            Scenario('product search', 'product-search', 'get', customer, fixed(f"{reverse('product-search')}?q=product")),
+            Scenario('product create', 'product-list', 'post', admin, lambda i: (
+                reverse('product-list'),
+                {'name': f'Created {run} {i}', 'category_id': category.pk, 'price': '5.00', 'stock': 10},
+            ), expect=201),
+            Scenario('product update', 'product-detail', 'patch', admin, lambda i: (
+                reverse('product-detail', args=[product.pk]), {'stock': 100 + i},
+            )),
+            Scenario('product delete', 'product-detail', 'delete', admin, lambda i: (
+                reverse('product-detail', args=[new_product(i).pk]), None,
+            ), expect=204),
+            Scenario('product import (50 rows)', 'product-import', 'post', admin,
+                     fixed(reverse('product-import'), import_rows)),
+            Scenario('product export', 'product-export', 'get', admin, fixed(reverse('product-export')), slow=True),
+
+            Scenario('order list (customer)', 'order-list', 'get', customer, fixed(reverse('order-list'))),
+            Scenario('order list (admin)', 'order-list', 'get', admin, fixed(reverse('order-list'))),
+            Scenario('order detail', 'order-detail', 'get', customer, fixed(reverse('order-detail', args=[order.pk]))),
+            Scenario('order create', 'order-list', 'post', customer, fixed(
+                reverse('order-list'), {'product': stocked.pk, 'quantity': 1},
+            ), expect=201),
+            Scenario('order bulk create (5)', 'order-bulk', 'post', customer, fixed(
+                reverse('order-bulk'), {'items': [{'product': stocked.pk, 'quantity': 1}] * 5},
+            ), expect=201),
+            Scenario('order cancel', 'order-cancel', 'post', customer, lambda i: (
+                reverse('order-cancel', args=[place_order()]), None,
+            )),
+            Scenario('order change status', 'order-change-status', 'post', admin, lambda i: (
+                reverse('order-change-status', args=[order.pk]), {'status': next(statuses)},
+            )),
+            Scenario('order export', 'order-export', 'get', admin, fixed(reverse('order-export')), slow=True),
+
+            Scenario('analytics sales', 'analytics-sales', 'get', admin, fixed(reverse('analytics-sales'))),
+            Scenario('analytics order status', 'analytics-order-status', 'get', admin,
+                     fixed(reverse('analytics-order-status'))),
+            Scenario('analytics low stock', 'analytics-low-stock', 'get', admin,
+                     fixed(reverse('analytics-low-stock'))),
+            Scenario('metrics', 'metrics', 'get', admin, fixed(reverse('metrics'))),
+        ]
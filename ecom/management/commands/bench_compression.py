@@ -0,0 +1,84 @@
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ecom import compression
+from ecom.bench import benchmark_database, seed_dataset, summarize, time_calls
+from ecom.models import Order, Product
+from ecom.renderers import MessagePackRenderer
+from ecom.serializers import OrderValuesSerializer, ProductValuesSerializer
+
+RENDERERS = (('json', JSONRenderer), ('msgpack', MessagePackRenderer))
+
+
+class Command(BaseCommand):
+    help = (
+        "Render product and order list pages of typical sizes as JSON and "
+        "MessagePack, then compress each with gzip, Brotli and (when installed) "
+        "zstd at several levels: bytes on the wire against milliseconds of CPU, "
+        "to choose COMPRESSION_ENCODINGS and the levels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[20, 50, 500], help="Rows per page.")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', default='bench_compression.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        encodings = [compression.Gzip(level) for level in (1, 6, 9)]
+        if compression.brotli:
+            encodings += [compression.Brotli(quality) for quality in (1, 4, 6, 11)]
+        if compression.zstandard:
+            encodings += [compression.Zstd(level) for level in (1, 3, 9)]
+        else:
+            self.stdout.write('zstandard is not installed; skipping zstd.')
+
+        report = []
+        with benchmark_database(keepdb=options['keepdb']):
+            seed_dataset(customers=10, categories=50, products=max(*options['rows'], 1000),
+                         orders=max(*options['rows'], 1000), log=self.stdout.write)
+            resources = [
+                ('products', ProductValuesSerializer, Product.objects.order_by('id')),
+                ('orders', OrderValuesSerializer, Order.objects.order_by('-created_at', '-id')),
+            ]
+            for name, serializer_class, queryset in resources:
+                for rows in options['rows']:
+                    data = serializer_class(list(queryset.values(*serializer_class.values_fields)[:rows]),
+                                            many=True).data
+                    for format, renderer_class in RENDERERS:
+                        report.append(self.bench(name, rows, format, renderer_class(), data, encodings, options))
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def bench(self, name, rows, format, renderer, data, encodings, options):
+        body = renderer.render(data)
+        render = summarize(time_calls(lambda: renderer.render(data), options['iterations']))
+        entry = {
+            'resource': name,
+            'rows': rows,
+            'format': format,
+            'bytes': len(body),
+            'render': render,
+            'encodings': [],
+        }
+        self.stdout.write(f"{name} x{rows} {format}: {len(body)} bytes, rendered in {render['p50_ms']:.3f} ms")
+        for encoding in encodings:
+            level = getattr(encoding, 'level', getattr(encoding, 'quality', None))
+            size = len(encoding.compress(body))
+            latency = summarize(time_calls(lambda: encoding.compress(body), options['iterations']))
+            entry['encodings'].append({
+                'encoding': encoding.name,
+                'level': level,
+                'bytes': size,
+                'ratio': round(len(body) / size, 2),
+                'compress': latency,
+            })
+            self.stdout.write(
+                f"  {encoding.name:4} {level:2}: {size:8} bytes ({len(body) / size:5.1f}x)"
+                f"  {latency['p50_ms']:7.3f} ms"
+            )
+        return entry
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from ecom.bench import benchmark_database, benchmark_environment, bench_endpoint, check_full_scans, seed_dataset
+from ecom.models import Category
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database (1M products by default) and report the "
+        "p50/p95 latency and query plan of every product and order list "
+        "filter. Fails if a filter reads a whole orders or products table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=500)
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--output', default='bench_filters.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(keepdb=options['keepdb']), benchmark_environment():
+            admin, customer = seed_dataset(
+                customers=options['customers'],
+                categories=options['categories'],
+                products=options['products'],
+                orders=options['orders'],
+                log=self.stdout.write,
+            )
+            report = []
+            for name, user, url in self.get_endpoints(admin, customer):
+                try:
+                    entry = bench_endpoint(name, user, url, options['iterations'])
+                except RuntimeError as exc:
+                    raise CommandError(exc)
+                latency = entry['latency']
+                self.stdout.write(
+                    f"{name:40} p50 {latency['p50_ms']:8.2f} ms  p95 {latency['p95_ms']:8.2f} ms"
+                    + (self.style.ERROR('  FULL SCAN') if entry['full_scans'] else '')
+                )
+                report.append(entry)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+        check_full_scans(report)
+
+    def get_endpoints(self, admin, customer):
+        products = reverse('product-list')
+        orders = reverse('order-list')
+        category = Category.objects.order_by('id').first()
+
+        return [
+            ('products ?category', customer, f'{products}?category={category.id}'),
+            ('products ?min_price&max_price', customer, f'{products}?min_price=10&max_price=12'),
+            ('products ?ordering=price', customer, f'{products}?ordering=price'),
+            ('products ?ordering=-price&max_price', customer, f'{products}?ordering=-price&max_price=50'),
+            ('products ?in_stock=false', customer, f'{products}?in_stock=false'),
+            ('products ?search (prefix)', customer, f'{products}?search=product%2099'),
+            ('products ?is_active=false (admin)', admin, f'{products}?is_active=false'),
+            ('orders ?status', admin, f'{orders}?status=shipped'),
+            ('orders ?created_after&created_before', admin,
+             f'{orders}?created_after=2000-01-01T00:00:00Z&created_before=2100-01-01T00:00:00Z'),
+            ('orders ?status (customer)', customer, f'{orders}?status=pending'),
+        ]
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ecom import hashers
+from ecom.bench import benchmark_database, benchmark_environment, summarize, time_calls
+from ecom.models import User
+
+PASSWORD = 'correct horse battery staple'
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a login's password check with each hasher at its configured cost: "
+        "Django's PBKDF2 default (the previous setting), scrypt and Argon2id. "
+        "Then time whole POST /login/ requests with each, against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Password checks and logins per hasher.")
+        parser.add_argument('--output', default='bench_hashing.json', help="Where to write the JSON report.")
+
+    def handle(self, *args, **options):
+        candidates = [
+            ('pbkdf2 (django default)', hashers.PBKDF2PasswordHasher()),
+            ('scrypt', hashers.ScryptPasswordHasher()),
+            ('argon2id', hashers.Argon2PasswordHasher()),
+        ]
+        report = []
+        available = []
+        for name, hasher in candidates:
+            try:
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+            except ValueError as exc:
+                # Argon2 without argon2-cffi installed.
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, {exc}'))
+                continue
+            latency = summarize(time_calls(lambda: hasher.verify(PASSWORD, encoded), options['iterations']))
+            per_core = round(1000 / latency['mean_ms'], 1)
+            self.stdout.write(
+                f"{name:24} {latency['mean_ms']:8.1f} ms per login  {per_core:7.1f} logins/sec per core"
+            )
+            report.append({
+                'hasher': name, 'encoded_prefix': encoded.rsplit('$', 2)[0],
+                'latency': latency, 'logins_per_second_per_core': per_core,
+            })
+            available.append((report[-1], hasher))
+
+        with benchmark_database(), benchmark_environment():
+            for entry, hasher in available:
+                entry['login'] = self.bench_login(hasher, options['iterations'])
+                self.stdout.write(f"{entry['hasher']:24} {entry['login']['mean_ms']:8.1f} ms per POST /login/")
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def bench_login(self, hasher, iterations):
+        """Latency of the login endpoint when the user's hash is `hasher`'s."""
+        hasher_path = f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+        user = User.objects.create(username=f'bench-{hasher.algorithm}',
+                                   password=hasher.encode(PASSWORD, hasher.salt()))
+        client = APIClient()
+        url = reverse('token_obtain_pair')
+        data = {'username': user.username, 'password': PASSWORD}
+
+        def login():
+            response = client.post(url, data, format='json')
+            if response.status_code != 200:
+                raise CommandError(f'Login with {hasher.algorithm} returned {response.status_code}.')
+
+        # Only this hasher listed, so the hash isn't upgraded on the first login.
+        with override_settings(PASSWORD_HASHERS=[hasher_path]):
+            return summarize(time_calls(login, iterations))
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.pagination import Cursor
+
+from ecom.bench import benchmark_database, benchmark_environment, bench_endpoint, check_full_scans, seed_dataset
+from ecom.models import Order, Product
+from ecom.pagination import OrderPagination
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, then record the query plans and latencies "
+        "of the order and catalog endpoints. Fails if a query reads a whole "
+        "orders or products table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=100)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=500_000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--output', default='bench_queries.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(keepdb=options['keepdb']), benchmark_environment():
+            admin, customer = seed_dataset(
+                customers=options['customers'],
+                categories=options['categories'],
+                products=options['products'],
+                orders=options['orders'],
+                log=self.stdout.write,
+            )
+            report = []
+            for name, user, url in self.get_endpoints(admin, customer):
+                try:
+                    entry = bench_endpoint(name, user, url, options['iterations'])
+                except RuntimeError as exc:
+                    raise CommandError(exc)
+                latency = entry['latency']
+                self.stdout.write(
+                    f"{name:32} {entry['queries']:3} queries"
+                    f"  p50 {latency['p50_ms']:8.2f} ms  p95 {latency['p95_ms']:8.2f} ms"
+                    + (self.style.ERROR('  FULL SCAN') if entry['full_scans'] else '')
+                )
+                report.append(entry)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+        check_full_scans(report)
+
+    def get_endpoints(self, admin, customer):
+        order = Order.objects.filter(customer=customer).order_by('-id').first()
+        middle = Order.objects.order_by('-created_at', '-id')[Order.objects.count() // 2]
+        paginator = OrderPagination()
+        paginator.base_url = 'http://testserver' + reverse('order-list')
+        deep_page = paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=[str(middle.created_at), str(middle.id)])
+        )
+        product = Product.objects.filter(is_active=True).order_by('-id').first()
+
+        return [
+            ('order-list (admin)', admin, reverse('order-list')),
+            ('order-list (admin, deep page)', admin, deep_page),
+            ('order-list (customer)', customer, reverse('order-list')),
+            ('order-detail', customer, reverse('order-detail', args=[order.id])),
+            ('product-list (admin)', admin, reverse('product-list')),
+            ('product-list (customer)', customer, reverse('product-list')),
+            ('product-detail', customer, reverse('product-detail', args=[product.id])),
+            ('category-list', customer, reverse('category-list')),
+            ('analytics-sales (by day)', admin, reverse('analytics-sales')),
+            ('analytics-sales (by product)', admin, f"{reverse('analytics-sales')}?group_by=product"),
+            ('analytics-order-status', admin, reverse('analytics-order-status')),
+            ('analytics-low-stock', admin, reverse('analytics-low-stock')),
+        ]
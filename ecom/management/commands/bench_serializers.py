@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from ecom.bench import benchmark_database, seed_dataset, summarize, time_calls
+from ecom.models import Order, Product
+from ecom.serializers import OrderReadSerializer, OrderValuesSerializer, ProductSerializer, ProductValuesSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/sec of the product and order list representations built "
+        "through ModelSerializer (model instances, select_related/prefetch) with "
+        "the `.values()` serializers: query, serialization and JSON rendering of a "
+        "page, and serialization alone. Fails if the rendered bytes differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help="Rows per page (the maximum page size).")
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--output', default='bench_serializers.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        report = []
+        with benchmark_database(keepdb=options['keepdb']):
+            seed_dataset(customers=10, categories=50, products=max(rows, 1000), orders=max(rows, 1000),
+                         log=self.stdout.write)
+            products = Product.objects.order_by('id')[:rows]
+            orders = Order.objects.order_by('-created_at', '-id')[:rows]
+            resources = [
+                ('products', ProductSerializer, ProductValuesSerializer, products),
+                ('orders', OrderReadSerializer, OrderValuesSerializer, orders),
+            ]
+            for name, model_serializer, values_serializer, queryset in resources:
+                entries = [
+                    self.bench(name, 'ModelSerializer', model_serializer, self.with_related(queryset, model_serializer),
+                               options),
+                    self.bench(name, 'values', values_serializer, queryset.values(*values_serializer.values_fields),
+                               options),
+                ]
+                if entries[0].pop('body') != entries[1].pop('body'):
+                    raise CommandError(f'{name}: the two representations render differently.')
+                speedup = entries[1]['page_rows_per_second'] / entries[0]['page_rows_per_second']
+                self.stdout.write(f'{name}: {speedup:.1f}x rows/sec with the values serializer')
+                report += entries
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    @staticmethod
+    def with_related(queryset, serializer_class):
+        queryset = queryset.select_related(*getattr(serializer_class, 'select_related_fields', ()))
+        return queryset.prefetch_related(*getattr(serializer_class, 'prefetch_related_fields', ()))
+
+    def bench(self, name, mode, serializer_class, queryset, options):
+        renderer = JSONRenderer()
+
+        def page():
+            # A fresh queryset each time, so nothing is served from its cache.
+            return renderer.render(serializer_class(list(queryset.all()), many=True).data)
+
+        body = page()
+        loaded = list(queryset.all())
+        if mode == 'values':
+            # Copies, since the order serializer keeps the items it reads
+            # (with one query) on the rows.
+            serialize = lambda: serializer_class([dict(row) for row in loaded], many=True).data
+        else:
+            serialize = lambda: serializer_class(loaded, many=True).data
+
+        page_latency = summarize(time_calls(page, options['iterations']))
+        serialize_latency = summarize(time_calls(serialize, options['iterations']))
+        rows = len(loaded)
+        entry = {
+            'resource': name,
+            'mode': mode,
+            'rows': rows,
+            'page': page_latency,
+            'page_rows_per_second': round(rows / page_latency['mean_ms'] * 1000),
+            'serialize': serialize_latency,
+            'serialize_rows_per_second': round(rows / serialize_latency['mean_ms'] * 1000),
+            'body': body,
+        }
+        self.stdout.write(
+            f"{name:9} {mode:16} page {page_latency['mean_ms']:7.2f} ms ({entry['page_rows_per_second']:7} rows/s)"
+            f"  serialize {serialize_latency['mean_ms']:7.2f} ms ({entry['serialize_rows_per_second']:7} rows/s)"
+        )
+        return entry
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from rest_framework import throttling as drf_throttling
+
+from ecom import throttling
+from ecom.bench import summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the per-request cost of the throttle check: DRF's UserRateThrottle "
+        "on the default cache against the sliding-window throttle on each store."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', default='1000/min', help="Throttle rate; DRF keeps up to this many timestamps per client.")
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=20_000)
+        parser.add_argument('--output', default='bench_throttle.json', help="Where to write the JSON report.")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            caches['default'].clear()
+            candidates = [
+                ('drf (default cache)', drf_throttling.UserRateThrottle, {'cache': caches['default']}),
+                ('sliding (memory)', throttling.UserRateThrottle, {'store': throttling.MemoryStore()}),
+                ('sliding (sqlite)', throttling.UserRateThrottle,
+                 {'store': throttling.SQLiteStore(os.path.join(directory, 'throttle.sqlite3'))}),
+                ('sliding (default cache)', throttling.UserRateThrottle, {'store': throttling.CacheStore('default')}),
+            ]
+
+            report = []
+            for name, base, attrs in candidates:
+                throttle_class = type('BenchThrottle', (base,), {'rate': options['rate'], **attrs})
+                entry = self.bench(name, throttle_class, options)
+                latency = entry['latency']
+                self.stdout.write(
+                    f"{name:26} mean {latency['mean_ms'] * 1000:8.1f} us"
+                    f"  p50 {latency['p50_ms'] * 1000:8.1f} us  p99 {latency['p99_ms'] * 1000:8.1f} us"
+                    f"  throttled {entry['throttled']}"
+                )
+                report.append(entry)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def bench(self, name, throttle_class, options):
+        requests = [
+            SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=client), META={})
+            for client in range(options['clients'])
+        ]
+        state = {'sent': 0, 'throttled': 0}
+
+        def check():
+            # DRF instantiates the throttles for every request, so do we.
+            request = requests[state['sent'] % len(requests)]
+            state['sent'] += 1
+            if not throttle_class().allow_request(request, None):
+                state['throttled'] += 1
+
+        latencies = time_calls(check, options['iterations'])
+        return {
+            'throttle': name,
+            'rate': options['rate'],
+            'clients': options['clients'],
+            'latency': summarize(latencies),
+            'throttled': state['throttled'],
+        }
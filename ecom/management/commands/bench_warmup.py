@@ -0,0 +1,117 @@
+import http.client
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from ecom.bench import BENCH_PASSWORD, benchmark_database, database_url, percentile, run_server, seed_dataset
+from ecom.models import Order, Product
+from ecom.serializers import MyTokenObtainPairSerializer
+
+MODES = (('cold', ''), ('warm', '1'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, then start fresh gunicorn servers with and "
+        "without the worker warm-up (WORKER_WARMUP, see gunicorn.conf.py) and "
+        "time the first request to each route against the requests after it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trials', type=int, default=3, help="Fresh servers per mode.")
+        parser.add_argument('--repeat', type=int, default=5, help="Requests per route after the first.")
+        parser.add_argument('--settle', type=float, default=5,
+                            help="Seconds to let the worker boot (and warm up) before the first request.")
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--output', default='bench_warmup.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        report = {}
+        with benchmark_database(keepdb=options['keepdb']):
+            _, customer = seed_dataset(customers=10, categories=50, products=2000, orders=2000,
+                                       log=self.stdout.write)
+            requests = self.get_requests(customer)
+            env = dict(
+                os.environ,
+                DATABASE_URL=database_url(),
+                DEBUG='',
+                DJANGO_ALLOWED_HOSTS='127.0.0.1,localhost',
+                # Measure the servers, not the rate limits.
+                API_USER_THROTTLE_RATE='1000000/s',
+                API_ANON_THROTTLE_RATE='1000000/s',
+            )
+            for mode, warmup in MODES:
+                trials = [self.run_trial({**env, 'WORKER_WARMUP': warmup}, requests, options)
+                          for _ in range(options['trials'])]
+                report[mode] = {
+                    name: {
+                        'first_ms': [round(trial[name]['first'] * 1000, 2) for trial in trials],
+                        'first_p50_ms': round(percentile([trial[name]['first'] for trial in trials], 50) * 1000, 2),
+                        'later_p50_ms': round(
+                            percentile([t for trial in trials for t in trial[name]['later']], 50) * 1000, 2,
+                        ),
+                    }
+                    for name, *_ in requests
+                }
+
+        self.stdout.write(f"{'route':16} {'first (cold)':>13} {'first (warm)':>13} {'later':>9}")
+        for name, *_ in requests:
+            cold, warm = report['cold'][name], report['warm'][name]
+            self.stdout.write(
+                f"{name:16} {cold['first_p50_ms']:10.1f} ms {warm['first_p50_ms']:10.1f} ms"
+                f" {warm['later_p50_ms']:6.1f} ms"
+            )
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def get_requests(self, customer):
+        """(name, method, path, body) in the order a fresh server receives them."""
+        product = Product.objects.filter(is_active=True).order_by('id').first()
+        order = Order.objects.filter(customer=customer).order_by('id').first()
+        login = json.dumps({'username': customer.username, 'password': BENCH_PASSWORD})
+        self.headers = {
+            'Authorization': f'Bearer {MyTokenObtainPairSerializer.get_token(customer).access_token}',
+            'Content-Type': 'application/json',
+        }
+        return [
+            ('product list', 'GET', reverse('product-list'), None),
+            ('product detail', 'GET', reverse('product-detail', args=[product.pk]), None),
+            ('category list', 'GET', reverse('category-list'), None),
+            ('order list', 'GET', reverse('order-list'), None),
+            ('order detail', 'GET', reverse('order-detail', args=[order.pk]), None),
+            ('login', 'POST', reverse('token_obtain_pair'), login),
+            ('schema', 'GET', reverse('schema'), None),
+        ]
+
+    def run_trial(self, env, requests, options):
+        host, port = '127.0.0.1', options['port']
+        args = [
+            'gunicorn', 'config.wsgi:application',
+            '--bind', f'{host}:{port}', '--workers', '1', '--log-level', 'warning',
+        ]
+        with run_server(args, env, host, port):
+            # gunicorn listens before its worker is ready.
+            time.sleep(options['settle'])
+            timings = {name: {'first': self.send(host, port, *request)} for name, *request in requests}
+            for name, *request in requests:
+                timings[name]['later'] = [self.send(host, port, *request) for _ in range(options['repeat'])]
+        return timings
+
+    def send(self, host, port, method, path, body):
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        try:
+            start = time.perf_counter()
+            connection.request(method, path, body=body, headers=self.headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise CommandError(f'{method} {path} returned {response.status}')
+        return elapsed
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ecom import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema for the current code and write it, with "
+        "its gzip and Brotli variants, to STATIC_ROOT/schema/ for every "
+        "process to load at startup. Run it after collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Directory to write to (default: STATIC_ROOT/schema).")
+
+    def handle(self, *args, **options):
+        directory = Path(options['output']) if options['output'] else schema.schema_dir()
+        version = schema.code_version()
+        if schema.load(version, directory) is not None:
+            self.stdout.write(f'The schema for code version {version} is up to date.')
+            return
+
+        built = schema.generate(version)
+        schema.write(built, directory)
+        sizes = ', '.join(
+            f"{format}{f' ({encoding})' if encoding else ''} {len(body) // 1024} KiB"
+            for (format, encoding), body in built.bodies.items()
+        )
+        self.stdout.write(f'Wrote the schema for code version {version} to {directory}: {sizes}')
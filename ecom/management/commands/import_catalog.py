@@ -0,0 +1,64 @@
+import io
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecom.imports import FORMATS, CatalogImport, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products from a CSV, NDJSON or JSON-array feed with "
+        "name, category (name) or category_id, price and optionally stock and "
+        "is_active columns. Existing products, matched on (category, name), "
+        "are updated. Rows are streamed and written in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed to import, or - for stdin.")
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--create-categories', action='store_true', help="Create categories the feed names.")
+        parser.add_argument('--errors', help="Write the rejected rows to this JSON file.")
+        parser.add_argument('--max-errors', type=int, default=10_000, help="Rejected rows to keep for the report.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading stdin.')
+
+        importer = CatalogImport(
+            chunk_size=options['chunk_size'],
+            create_categories=options['create_categories'],
+            max_errors=options['max_errors'],
+            progress=self.progress,
+        )
+        try:
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='') if path == '-' else \
+                open(path, encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream:
+            try:
+                report = importer.run(read_rows(stream, fmt))
+            except ValueError as exc:
+                raise CommandError(f'Could not read {path}: {exc}')
+
+        for error in report['errors'][:20]:
+            self.stderr.write(f"Row {error['row']}: {'; '.join(error['errors'])}")
+        if options['errors']:
+            with open(options['errors'], 'w') as fh:
+                json.dump(report['errors'], fh, indent=2)
+            self.stdout.write(f"Rejected rows written to {options['errors']}")
+        self.stdout.write(self.style.SUCCESS(self.summary(report)))
+
+    def progress(self, report):
+        self.stdout.write(self.summary(report))
+
+    def summary(self, report):
+        return (
+            f"{report['processed']} rows: {report['created']} created, "
+            f"{report['updated']} updated, {report['rejected']} rejected"
+        )
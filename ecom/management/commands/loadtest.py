@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from ecom.bench import benchmark_database, database_url, http_load, run_server, seed_dataset, summarize
+from ecom.models import Category, Product
+from ecom.serializers import MyTokenObtainPairSerializer
+
+# Each mode is a gunicorn command line and the settings it runs with.
+MODES = {
+    'wsgi': (['config.wsgi:application'], {'ASYNC_CATALOG_VIEWS': ''}),
+    'asgi': (['-k', 'uvicorn_worker.UvicornWorker', 'config.asgi:application'], {'ASYNC_CATALOG_VIEWS': '1'}),
+    'asgi-sync': (['-k', 'uvicorn_worker.UvicornWorker', 'config.asgi:application'], {'ASYNC_CATALOG_VIEWS': ''}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, serve it with gunicorn sync workers (wsgi), "
+        "uvicorn workers with the async catalog views (asgi) or uvicorn workers "
+        "with the sync views (asgi-sync), and compare requests/sec and latency "
+        "of catalog reads under concurrent load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='wsgi,asgi', help=f"Comma-separated, from {', '.join(MODES)}.")
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=15, help="Seconds of load per mode.")
+        parser.add_argument('--warmup', type=float, default=2, help="Seconds of unrecorded load per mode.")
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--no-cache', action='store_true', help="Disable the catalog cache in the servers.")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--output', default='loadtest.json', help="Where to write the JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+
+        report = []
+        with benchmark_database(keepdb=options['keepdb']):
+            _, customer = seed_dataset(
+                customers=10, categories=options['categories'], products=options['products'], orders=0,
+                log=self.stdout.write,
+            )
+            paths = self.get_paths()
+            headers = {'Authorization': f'Bearer {MyTokenObtainPairSerializer.get_token(customer).access_token}'}
+            env = self.get_env(options['no_cache'])
+
+            for mode in modes:
+                entry = self.run_mode(mode, env, paths, headers, options)
+                latency = entry['latency']
+                self.stdout.write(
+                    f"{mode:10} {entry['requests_per_second']:9.1f} req/s"
+                    f"  p50 {latency['p50_ms']:8.2f} ms  p99 {latency['p99_ms']:8.2f} ms"
+                    f"  statuses {entry['statuses']}"
+                )
+                report.append(entry)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+    def get_paths(self):
+        rng = random.Random(42)
+        product_ids = list(Product.objects.filter(is_active=True).values_list('id', flat=True)[:1000])
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        paths = [reverse('category-list'), reverse('product-list'), f"{reverse('product-list')}?page_size=20"]
+        paths += [f"{reverse('product-list')}?category={rng.choice(category_ids)}" for _ in range(20)]
+        paths += [reverse('product-detail', args=[rng.choice(product_ids)]) for _ in range(77)]
+        rng.shuffle(paths)
+        return paths
+
+    def get_env(self, no_cache):
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url(),
+            DEBUG='',
+            DJANGO_ALLOWED_HOSTS='127.0.0.1,localhost',
+            # Measure the servers, not the rate limits.
+            API_USER_THROTTLE_RATE='1000000/s',
+            API_ANON_THROTTLE_RATE='1000000/s',
+        )
+        if no_cache:
+            env['CATALOG_CACHE_BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
+        return env
+
+    def run_mode(self, mode, env, paths, headers, options):
+        server_args, server_env = MODES[mode]
+        host, port = '127.0.0.1', options['port']
+        args = [
+            'gunicorn', *server_args,
+            '--bind', f'{host}:{port}', '--workers', str(options['workers']), '--log-level', 'warning',
+        ]
+
+        with run_server(args, {**env, **server_env}, host, port):
+            load = lambda duration: asyncio.run(
+                http_load(host, port, paths, headers, options['concurrency'], duration)
+            )
+            if options['warmup']:
+                load(options['warmup'])
+            latencies, statuses = load(options['duration'])
+
+        if not latencies:
+            raise CommandError(f'{mode}: no successful responses ({dict(statuses)})')
+        return {
+            'mode': mode,
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'duration_s': options['duration'],
+            'requests_per_second': round(len(latencies) / options['duration'], 1),
+            'latency': summarize(latencies),
+            'statuses': {str(status): count for status, count in statuses.items()},
+        }
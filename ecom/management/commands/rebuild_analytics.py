@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ecom.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the sales and order-status rollups from the orders. Only "
+        "needed after orders were written without going through the API, "
+        "e.g. by bulk imports or raw SQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Analytics rollups rebuilt.'))
@@ -0,0 +1,35 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from ecom.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (order notifications, stock alerts) from the job "
+        "table. Start as many workers as needed: each job is claimed by one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Jobs run at the same time by this worker.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls when idle.")
+        parser.add_argument('--lease', type=int, help="Seconds before a claimed job may be claimed again "
+                                                      "(default JOBS_LEASE_SECONDS).")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due, e.g. from cron.")
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'], poll_interval=options['poll_interval'], lease=options['lease'],
+        )
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running jobs...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"Running jobs with concurrency {options['concurrency']}.")
+        counts = worker.run(once=options['once'])
+        self.stdout.write(f"{counts['done']} done, {counts['pending']} to retry, {counts['failed']} failed.")
@@ -0,0 +1,233 @@
+"""
+Per-request instrumentation.
+
+MetricsMiddleware times every request and, through a context variable the
+other hooks read, counts its queries and their time (an execute wrapper
+installed on every database connection) and the time the project's
+serializers (TimedSerializerMixin) spend building their representation.
+Totals go into per-route histograms, which the admin metrics endpoint
+renders in the Prometheus text format, and, for admins or with DEBUG on,
+a `Server-Timing` header.
+
+The context variable follows the request into `sync_to_async` threads, so
+async views are measured too. Histograms live in each process: scrape
+every worker, as with any per-process Prometheus exporter.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16_384, 65_536, 262_144, 1_048_576, 4_194_304)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, values, amount):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series.setdefault(values, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, amount)] += 1
+        series[-1] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for values, series in sorted(self.series.items()):
+            labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, values))
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                total += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {total}'
+            yield f'{self.name}_sum{{{labels}}} {series[-1]}'
+            yield f'{self.name}_count{{{labels}}} {total}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values):
+        self.series[values] = self.series.get(values, 0) + 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for values, count in sorted(self.series.items()):
+            labels = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, values))
+            yield f'{self.name}{{{labels}}} {count}'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        route = ('route', 'method')
+        self.requests = Counter('http_requests_total', 'Requests by route, method and status.',
+                                ('route', 'method', 'status'))
+        self.duration = Histogram('http_request_duration_seconds', 'Wall time of the request.',
+                                  route, DURATION_BUCKETS)
+        self.queries = Histogram('http_request_db_queries', 'Database queries run by the request.',
+                                 route, QUERY_BUCKETS)
+        self.db_duration = Histogram('http_request_db_duration_seconds', 'Time spent in database queries.',
+                                     route, DURATION_BUCKETS)
+        self.serializer_duration = Histogram('http_request_serializer_duration_seconds',
+                                             'Time spent building serializer data, queries included.',
+                                             route, DURATION_BUCKETS)
+        self.response_size = Histogram('http_response_size_bytes', 'Size of non-streaming response bodies.',
+                                       route, SIZE_BUCKETS)
+
+    def record(self, route, method, status, duration, stats, size):
+        labels = (route, method)
+        with self.lock:
+            self.requests.inc((route, method, str(status)))
+            self.duration.observe(labels, duration)
+            self.queries.observe(labels, stats.queries)
+            self.db_duration.observe(labels, stats.db_time)
+            self.serializer_duration.observe(labels, stats.serializer_time)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def render(self):
+        metrics = (self.requests, self.duration, self.queries, self.db_duration,
+                   self.serializer_duration, self.response_size)
+        with self.lock:
+            return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the current request's stats."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver; reconnects reuse the same wrapper list."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedSerializerMixin:
+    """
+    Adds the serializer's `to_representation()` time to the request's stats.
+    Serializers nested in a timed one run inside it and aren't counted
+    again; with many=True each row is timed unless the list serializer is
+    timed too.
+    """
+
+    def to_representation(self, instance):
+        stats = _current.get()
+        if stats is None or stats.serializing:
+            return super().to_representation(instance)
+        stats.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializing = False
+            stats.serializer_time += time.perf_counter() - start
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name if match.url_name else match.route
+
+
+def shows_server_timing(request):
+    """Timings and query counts are for the operators: admins, or anyone under DEBUG."""
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and (user.is_staff or user.is_admin))
+
+
+class MetricsMiddleware:
+    """
+    Records each request into `registry` and, with SERVER_TIMING on, adds
+    a Server-Timing header for admins (or under DEBUG): total, db (with the
+    query count) and serialize.
+    Runs as sync or async middleware to match the stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, start = RequestStats(), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, start = RequestStats(), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def finish(self, request, response, stats, start):
+        duration = time.perf_counter() - start
+        size = None if response.streaming else len(response.content)
+        registry.record(route_name(request), request.method, response.status_code, duration, stats, size)
+        if settings.SERVER_TIMING and shows_server_timing(request):
+            response['Server-Timing'] = (
+                f'total;dur={duration * 1000:.1f}, '
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'serialize;dur={stats.serializer_time * 1000:.1f}'
+            )
+        return response
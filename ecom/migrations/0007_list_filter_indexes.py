@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+# `?search=` is a case-insensitive prefix match (name__istartswith). Neither
+# backend can serve it from a plain index on name, and the index each one
+# needs can't be expressed portably in Meta.indexes.
+NAME_PREFIX_INDEX = {
+    'postgresql': 'CREATE INDEX product_name_prefix_idx ON ecom_product (UPPER(name) text_pattern_ops)',
+    'sqlite': 'CREATE INDEX product_name_prefix_idx ON ecom_product (name COLLATE NOCASE, id)',
+}
+
+
+def create_name_prefix_index(apps, schema_editor):
+    sql = NAME_PREFIX_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_name_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor in NAME_PREFIX_INDEX:
+        schema_editor.execute('DROP INDEX IF EXISTS product_name_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock'], name='product_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['id'], name='product_inactive_id_idx'),
+        ),
+        migrations.RunPython(create_name_prefix_index, drop_name_prefix_index),
+    ]
@@ -0,0 +1,40 @@
+from django.db import DatabaseError, migrations, transaction
+
+
+# The GIN indexes behind the PostgreSQL search backend (ecom/search.py).
+# Other databases search an in-process index and need nothing here.
+# pg_trgm may not be installable without superuser rights; typo tolerance
+# is then skipped at query time rather than failing the migration.
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    Product = apps.get_model('ecom', 'Product')
+    schema_editor.add_index(Product, GinIndex(SearchVector('name', config='simple'), name='product_name_search_idx'))
+
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    schema_editor.add_index(Product, GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+        schema_editor.execute('DROP INDEX IF EXISTS product_name_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0007_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
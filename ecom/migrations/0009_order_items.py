@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_order_items(apps, schema_editor):
+    # Existing orders get one item each. The price they were placed at was
+    # never recorded, so the product's current price stands in for it.
+    Order = apps.get_model('ecom', 'Order')
+    OrderItem = apps.get_model('ecom', 'OrderItem')
+    batch_size = 2000
+
+    orders = Order.objects.select_related('product').order_by('pk')
+    last = 0
+    while True:
+        batch = list(orders.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        for order in batch:
+            order.total_price = order.quantity * order.product.price
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=order.product, quantity=order.quantity, unit_price=order.product.price)
+            for order in batch
+        )
+        Order.objects.bulk_update(batch, ['total_price'])
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecom', '0008_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='ecom.product'),
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='ecom.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='ecom.product')),
+            ],
+        ),
+        migrations.RunPython(backfill_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,270 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from . import exports, routers
+from .authentication import aauthenticate
+from .cache import aget_catalog_version, catalog_cache_key, get_catalog_cache, get_catalog_version
+
+
+class RelatedQuerysetMixin:
+    """
+    Join or prefetch the relations the active serializer declares through
+    `select_related_fields` / `prefetch_related_fields`, so a list costs
+    the same number of queries whatever the number of rows. Serializers of
+    `.values()` rows declare `values_fields` instead.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+
+        values_fields = getattr(serializer_class, 'values_fields', ())
+        if values_fields:
+            return queryset.values(*values_fields)
+
+        select_related = getattr(serializer_class, 'select_related_fields', ())
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+
+        prefetch_related = getattr(serializer_class, 'prefetch_related_fields', ())
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        return queryset
+
+
+class ExportMixin:
+    """
+    An `export` action streaming every row of the list endpoint, with its
+    filters and ordering, as CSV or NDJSON (`?output=csv|ndjson`). Views
+    provide `get_export_records(queryset)` and the exported field names.
+    """
+    export_filename = None
+    export_fields = []
+    # For records with nested 'items': CSV gets one line per item.
+    export_item_fields = None
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in exports.CONTENT_TYPES:
+            return Response({'detail': f"'output' must be one of: {', '.join(exports.CONTENT_TYPES)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            # The list's ordering, backed by the same index.
+            queryset = queryset.order_by(*self.paginator.get_ordering(request, queryset, self))
+        return exports.stream(
+            self.get_export_records(queryset), output, self.export_filename or self.basename,
+            self.export_fields, self.export_item_fields,
+        )
+
+    def get_export_records(self, queryset):
+        raise NotImplementedError
+
+
+class ReplicaReadMixin:
+    """
+    Serve GET list/retrieve from a read replica (see ecom/routers.py), unless
+    the user wrote within the replication lag window; other actions use the
+    primary. Successful writes through the view start that window.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def use_replica(self, request):
+        return (bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS
+                and self.action in self.replica_actions and not routers.wrote_recently(request.user))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Decided once the user is authenticated; that lookup used the primary.
+        if self.use_replica(request):
+            self._replica_token = routers.use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            self._replica_token = None
+            routers.release(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            routers.record_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class CatalogCacheMixin:
+    """
+    Read-through cache of list/retrieve response data. Admins and customers
+    get separate entries since customers only see active products; every
+    entry expires when the catalog version is bumped or after
+    `CATALOG_CACHE_TTL` seconds.
+    """
+
+    def get_cache_scope(self):
+        return 'admin' if self.request.user.is_admin else 'customer'
+
+    def use_replica(self, request):
+        # A replica still behind a catalog write would have its rows cached
+        # under the new version until they expire; the version is the time of
+        # the last write.
+        return (super().use_replica(request)
+                and not routers.within_lag_window(get_catalog_version() / 10**9))
+
+    def get_validators(self):
+        return self.validators_for(get_catalog_version())
+
+    async def aget_validators(self):
+        return self.validators_for(await aget_catalog_version())
+
+    def validators_for(self, version):
+        # The catalog version changes with every write, so it identifies the
+        # representation as well as hashing the body would.
+        key = f'{version}:{self.get_cache_scope()}:{self.request.get_full_path()}'
+        return quote_etag(hashlib.md5(key.encode()).hexdigest()), version // 10**9
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = catalog_cache_key(request, self.get_cache_scope())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TTL)
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(super().aretrieve, request, *args, **kwargs)
+
+    async def acached_response(self, view, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = catalog_cache_key(request, self.get_cache_scope(), await aget_catalog_version())
+        data = await cache.aget(key)
+        if data is not None:
+            return Response(data)
+
+        response = await view(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, settings.CATALOG_CACHE_TTL)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Add `ETag` / `Last-Modified` to list and retrieve responses and answer
+    304 Not Modified when the client's copy is current, before the queryset
+    is serialized. Views implement `get_validators()`, returning a quoted
+    ETag and a Last-Modified Unix timestamp (either may be None).
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        return self.add_validators(response, etag, last_modified)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional_response(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aconditional_response(super().aretrieve, request, *args, **kwargs)
+
+    async def aconditional_response(self, view, request, *args, **kwargs):
+        etag, last_modified = await self.aget_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+        return self.add_validators(response, etag, last_modified)
+
+    async def aget_validators(self):
+        return await sync_to_async(self.get_validators)()
+
+    def add_validators(self, response, etag, last_modified):
+        if response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        # Representations differ by user, so shared caches must key on the token.
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AsyncReadMixin:
+    """
+    Async list and retrieve, served on the event loop under ASGI (see
+    ecom/async_views.py). `adispatch()` follows `APIView.dispatch()`, with
+    authentication and every query awaited instead of run inline. The checks
+    in `initial()` (throttle stores, the catalog version and read-your-writes
+    lookups behind the replica choice) block, so they run in a worker thread.
+    """
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await aauthenticate(request)
+            # Permissions, throttles and content negotiation; the user is set.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (ObjectDoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
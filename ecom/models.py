@@ -16,6 +16,7 @@ class User(AbstractUser):
 class Category(models.Model):
     name        = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated_at  = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -23,10 +24,26 @@ class Category(models.Model):
 
 class Product(models.Model):
     name      = models.CharField(max_length=200)
-    category  = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
+    # Indexed through the leading column of the (category, name) constraint.
+    category  = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', db_index=False)
     stock     = models.PositiveIntegerField(default=0)
     price     = models.DecimalField(max_digits=10, decimal_places=2)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name'], name='product_unique_name_per_category'),
+        ]
+        indexes = [
+            # Keyset pagination over active products for customers.
+            models.Index(fields=['id'], condition=models.Q(is_active=True), name='product_active_id_idx'),
+            # List filters (ecom/filters.py), keyset ordered on id or price.
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['stock'], name='product_stock_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_active=False), name='product_inactive_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -46,11 +63,134 @@ class Order(models.Model):
         (STATUS_CANCELLED, 'Cancelled'),
     ]
 
-    customer   = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    product    = models.ForeignKey(Product, on_delete=models.PROTECT)
+    # Indexed through the leading column of the customer composite indexes.
+    customer   = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_index=False)
+    # Legacy single-product orders: the product and quantity of their only
+    # item. Orders placed with several items leave product empty and carry
+    # the total number of units. The lines themselves are OrderItem rows.
+    product    = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, blank=True)
     quantity   = models.PositiveIntegerField(default=1)
+    # Sum of the items' quantity * unit_price, stored when the order is placed.
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     status     = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: (created_at, id) for admins, per customer otherwise.
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='order_customer_created_id_idx'),
+            # Status filters, for everyone and per customer, newest first.
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_id_idx'),
+            models.Index(fields=['customer', 'status', 'created_at', 'id'], name='order_customer_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} by {self.customer.username}"
+
+
+class OrderItem(models.Model):
+    order      = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product    = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='order_items')
+    quantity   = models.PositiveIntegerField()
+    # The product's price when the order was placed.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in order #{self.order_id}"
+
+
+# Rollups behind the analytics endpoints (ecom/analytics.py). They are kept
+# up to date as orders are placed, cancelled or change status, so reports
+# read a few rows per day instead of aggregating orders. Cancelled orders
+# don't count towards sales. Counters are signed: removals are upserted as
+# negative increments.
+
+class DailyCategorySales(models.Model):
+    day      = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', db_index=False)
+    orders   = models.IntegerField(default=0)
+    units    = models.IntegerField(default=0)
+    revenue  = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='daily_category_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'day'], name='daily_category_sales_idx'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    day     = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    orders  = models.IntegerField(default=0)
+    units   = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_product_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'day'], name='daily_product_sales_idx'),
+        ]
+
+
+class DailyOrderStatus(models.Model):
+    day    = models.DateField()
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='daily_order_status_unique'),
+        ]
+
+
+class Job(models.Model):
+    """
+    A unit of background work run by `manage.py run_jobs` (ecom/jobs.py).
+    Jobs are inserted in the transaction of the change that caused them, so
+    they exist exactly when that change was committed.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE    = 'done'
+    STATUS_FAILED  = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE,    'Done'),
+        (STATUS_FAILED,  'Failed'),
+    ]
+
+    name         = models.CharField(max_length=100)
+    payload      = models.JSONField(default=dict)
+    status       = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts     = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Not picked up before this time; pushed back after each failure.
+    run_at       = models.DateTimeField()
+    # The claim holding a running job, and when its lease runs out. A job
+    # whose worker died is claimed again once the lease has expired.
+    claimed_by   = models.CharField(max_length=64, blank=True)
+    lease_until  = models.DateTimeField(null=True, blank=True)
+    last_error   = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    updated_at   = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due jobs, oldest first, per status.
+            models.Index(fields=['status', 'run_at', 'id'], name='job_status_run_at_idx'),
+        ]
 
     def __str__(self):
-        return f"Order #{self.id} by {self.customer.username}"
\ No newline at end of file
+        return f"Job #{self.id} {self.name} ({self.status})"
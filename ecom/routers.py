@@ -0,0 +1,80 @@
+"""
+Read replicas.
+
+Replicas are configured with DATABASE_REPLICA_URLS and become the database
+aliases in settings.DATABASE_REPLICAS. ReplicaRouter sends a read to one of
+them only while a view has picked a replica for the current request
+(ReplicaReadMixin: GET list/retrieve of categories, products and orders).
+Everything else stays on the primary: writes, select_for_update() (Django
+routes it as a write), reads inside a transaction and reads of every other
+request.
+
+Replicas lag behind the primary, so a user who wrote within the last
+READ_YOUR_WRITES_SECONDS reads from the primary. The marker lives in the
+READ_YOUR_WRITES_CACHE_ALIAS cache, which has to be shared by the workers
+for a write on one of them to be seen by the others.
+"""
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_read_database = contextvars.ContextVar('read_database', default=None)
+
+
+def _write_key(user):
+    return f'replica:wrote:{user.pk}'
+
+
+def record_write(user):
+    """Keep `user`'s reads on the primary for READ_YOUR_WRITES_SECONDS."""
+    if settings.DATABASE_REPLICAS and user.is_authenticated:
+        caches[settings.READ_YOUR_WRITES_CACHE_ALIAS].set(_write_key(user), 1, settings.READ_YOUR_WRITES_SECONDS)
+
+
+def wrote_recently(user):
+    return user.is_authenticated and caches[settings.READ_YOUR_WRITES_CACHE_ALIAS].get(_write_key(user)) is not None
+
+
+def within_lag_window(timestamp):
+    """Whether a write at `timestamp` may not have reached the replicas yet."""
+    return time.time() - timestamp < settings.READ_YOUR_WRITES_SECONDS
+
+
+def use_replica():
+    """
+    Send the rest of this request's reads to a replica. Returns a token for
+    `release()`, or None when no replica is configured.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return _read_database.set(random.choice(settings.DATABASE_REPLICAS))
+
+
+def release(token):
+    # Not reset(): under async views the token was made in sync_to_async's
+    # copy of the context, and only its value came back.
+    _read_database.set(None if token.old_value is token.MISSING else token.old_value)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_database.get()
+        # A transaction on the primary must see its own writes.
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication.
+        return db == DEFAULT_DB_ALIAS
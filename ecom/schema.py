@@ -0,0 +1,117 @@
+"""
+The OpenAPI schema, generated once per code version rather than on every
+request to /api/schema/.
+
+`manage.py build_schema` (run at build time, after collectstatic) writes the
+YAML and JSON documents to STATIC_ROOT/schema/, with gzip and Brotli
+variants made by WhiteNoise's compressor and a VERSION file naming the code
+they were built from. Each process loads them once, at warm-up; when they
+are missing or stale it generates the documents itself and keeps them in
+memory. WhiteNoise also serves the files as static files.
+
+The code version is CODE_VERSION when set (e.g. the deployed commit),
+otherwise a hash of the project's source, the settings that shape the
+schema and the versions of the packages that generate it.
+"""
+import hashlib
+import threading
+from importlib import metadata
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.http import quote_etag
+from drf_spectacular.drainage import GENERATOR_STATS
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from whitenoise.compress import Compressor
+
+RENDERERS = {'yaml': OpenApiYamlRenderer, 'json': OpenApiJsonRenderer}
+# Content-Encoding -> file suffix, in order of preference.
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+SOURCE_DIRS = ('config', 'ecom')
+PACKAGES = ('Django', 'djangorestframework', 'djangorestframework_simplejwt', 'django-filter', 'drf-spectacular')
+
+_lock = threading.Lock()
+_schema = None
+
+
+def code_version():
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = hashlib.sha256()
+    for package in PACKAGES:
+        digest.update(f'{package}=={metadata.version(package)}\n'.encode())
+    digest.update(repr((settings.REST_FRAMEWORK, getattr(settings, 'SPECTACULAR_SETTINGS', None))).encode())
+    base = Path(settings.BASE_DIR)
+    for directory in SOURCE_DIRS:
+        for path in sorted((base / directory).rglob('*.py')):
+            digest.update(path.relative_to(base).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def schema_dir():
+    return Path(settings.STATIC_ROOT) / 'schema'
+
+
+class Schema:
+    """Rendered documents by (format, encoding), None being uncompressed."""
+
+    def __init__(self, version, bodies):
+        self.version = version
+        self.bodies = bodies
+        self.etags = {key: quote_etag(hashlib.md5(body).hexdigest()) for key, body in bodies.items()}
+
+    def encodings(self, format):
+        return [encoding for encoding in ENCODINGS if (format, encoding) in self.bodies]
+
+
+def generate(version):
+    with GENERATOR_STATS.silence():
+        data = SchemaGenerator().get_schema(request=None, public=True)
+    compressor = Compressor(quiet=True)
+    bodies = {}
+    for format, renderer_class in RENDERERS.items():
+        body = bodies[format, None] = renderer_class().render(data, renderer_context={})
+        if compressor.use_brotli:
+            bodies[format, 'br'] = compressor.compress_brotli(body)
+        if compressor.use_gzip:
+            bodies[format, 'gzip'] = compressor.compress_gzip(body)
+    return Schema(version, bodies)
+
+
+def write(schema, directory):
+    """Write the documents and their compressed variants, VERSION last."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for (format, encoding), body in schema.bodies.items():
+        (directory / f'openapi.{format}{ENCODINGS.get(encoding, "")}').write_bytes(body)
+    (directory / 'VERSION').write_text(schema.version)
+
+
+def load(version, directory):
+    """The documents written for `version`, or None."""
+    try:
+        if (directory / 'VERSION').read_text().strip() != version:
+            return None
+        bodies = {}
+        for format in RENDERERS:
+            path = directory / f'openapi.{format}'
+            bodies[format, None] = path.read_bytes()
+            for encoding, suffix in ENCODINGS.items():
+                variant = path.with_name(path.name + suffix)
+                if variant.exists():
+                    bodies[format, encoding] = variant.read_bytes()
+    except FileNotFoundError:
+        return None
+    return Schema(version, bodies)
+
+
+def get_schema():
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                version = code_version()
+                _schema = load(version, schema_dir()) or generate(version)
+    return _schema
+
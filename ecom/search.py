@@ -0,0 +1,270 @@
+"""
+Product name search.
+
+On PostgreSQL names are matched through a GIN-indexed `to_tsvector` with
+prefix queries, plus pg_trgm word similarity for typos when the extension
+is installed. Elsewhere an in-process inverted index over name tokens is
+used, with a trigram index over the vocabulary for typo tolerance; it is
+built lazily and kept current by the Product save/delete signals once the
+write commits. A change made by another process reaches the index through
+the search version in the catalog cache when that cache is shared, and
+otherwise at the latest when the index is rebuilt, SEARCH_INDEX_MAX_AGE
+seconds after it was built.
+"""
+import bisect
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .cache import get_catalog_cache
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+')
+SEARCH_VERSION_KEY = 'catalog:search-version'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def get_search_version():
+    cache = get_catalog_cache()
+    version = cache.get(SEARCH_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(SEARCH_VERSION_KEY, version, timeout=None):
+            version = cache.get(SEARCH_VERSION_KEY, version)
+    return version
+
+
+def bump_search_version():
+    get_catalog_cache().set(SEARCH_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+class LocalSearchIndex:
+    """
+    Inverted index from name tokens to product ids. Query tokens match
+    index terms exactly, by prefix, or by trigram similarity; every query
+    token has to match for a product to be returned.
+    """
+    exact_weight = 1.0
+    prefix_weight = 0.8
+    fuzzy_weight = 0.6
+    min_similarity = 0.4
+    max_expansions = 50
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.built_at = None
+        self.clear()
+
+    def clear(self):
+        self.documents = {}   # product id -> (name, is_active, tokens)
+        self.postings = {}    # token -> set of product ids
+        self.vocabulary = []  # sorted tokens, for prefix ranges
+        self.grams = {}       # trigram -> set of tokens
+
+    def rebuild(self, version=None):
+        with self.lock:
+            self.clear()
+            rows = Product.objects.values_list('id', 'name', 'is_active').iterator(chunk_size=5000)
+            for product_id, name, is_active in rows:
+                self._add(product_id, name, is_active)
+            self.version = get_search_version() if version is None else version
+            self.built_at = time.monotonic()
+
+    def ensure_current(self):
+        version = get_search_version()
+        if version != self.version or time.monotonic() - self.built_at > settings.SEARCH_INDEX_MAX_AGE:
+            self.rebuild(version)
+
+    def update(self, product_id, name, is_active):
+        with self.lock:
+            self._remove(product_id)
+            self._add(product_id, name, is_active)
+
+    def remove(self, product_id):
+        with self.lock:
+            self._remove(product_id)
+
+    def _add(self, product_id, name, is_active):
+        tokens = set(tokenize(name))
+        self.documents[product_id] = (name, is_active, tokens)
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                bisect.insort(self.vocabulary, token)
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            self.postings[token].add(product_id)
+
+    def _remove(self, product_id):
+        document = self.documents.pop(product_id, None)
+        if document is None:
+            return
+        for token in document[2]:
+            postings = self.postings[token]
+            postings.discard(product_id)
+            if not postings:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                for gram in trigrams(token):
+                    self.grams[gram].discard(token)
+
+    def expand(self, token):
+        """Index terms matching a query token, with their weights."""
+        terms = {}
+        start = bisect.bisect_left(self.vocabulary, token)
+        for term in self.vocabulary[start:start + self.max_expansions]:
+            if not term.startswith(token):
+                break
+            terms[term] = self.exact_weight if term == token else self.prefix_weight
+
+        query_grams = trigrams(token)
+        shared = {}
+        for gram in query_grams:
+            for term in self.grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        for term, count in shared.items():
+            similarity = count / len(query_grams | trigrams(term))
+            if similarity >= self.min_similarity and term not in terms:
+                terms[term] = self.fuzzy_weight * similarity
+        return terms
+
+    def search(self, query, limit, include_inactive=False):
+        with self.lock:
+            scores = None
+            for token in set(tokenize(query)):
+                token_scores = {}
+                for term, weight in self.expand(token).items():
+                    for product_id in self.postings[term]:
+                        if weight > token_scores.get(product_id, 0):
+                            token_scores[product_id] = weight
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+                if not scores:
+                    return []
+
+            if scores is None:
+                return []
+            if not include_inactive:
+                scores = {pid: score for pid, score in scores.items() if self.documents[pid][1]}
+            ranked = sorted(scores, key=lambda pid: (-scores[pid], len(self.documents[pid][0]), pid))
+            return ranked[:limit]
+
+
+class LocalSearchBackend:
+    def __init__(self):
+        self.index = LocalSearchIndex()
+
+    def search(self, query, limit, include_inactive=False):
+        self.index.ensure_current()
+        return self.index.search(query, limit, include_inactive)
+
+    def product_saved(self, product):
+        product_id, name, is_active = product.pk, product.name, product.is_active
+        transaction.on_commit(lambda: self.changed(lambda: self.index.update(product_id, name, is_active)))
+
+    def product_deleted(self, product):
+        product_id = product.pk
+        transaction.on_commit(lambda: self.changed(lambda: self.index.remove(product_id)))
+
+    def changed(self, apply):
+        # Apply the change here and publish a new version so other processes
+        # rebuild; an index that was already stale is left for its rebuild.
+        with self.index.lock:
+            current = self.index.version == get_search_version()
+            apply()
+            bump_search_version()
+            if current:
+                self.index.version = get_search_version()
+
+
+class PostgresSearchBackend:
+    """
+    Full-text prefix matching ranked with ts_rank, served by the GIN index on
+    the name's tsvector (migration 0008). Typo tolerance comes from pg_trgm
+    word similarity when the extension is available.
+    """
+    config = 'simple'
+    min_similarity = 0.4
+
+    def __init__(self):
+        self.has_trigrams = None
+
+    def search(self, query, limit, include_inactive=False):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+        from django.db.models import F, Q, Value
+        from django.db.models.functions import Greatest
+
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        vector = SearchVector('name', config=self.config)
+        prefix_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), config=self.config, search_type='raw')
+        # Match with @@ on the indexed vector; the rank only orders the matches.
+        queryset = Product.objects.annotate(search=vector, rank=SearchRank(vector, prefix_query))
+        matches = Q(search=prefix_query)
+
+        if self.trigrams_available():
+            text = ' '.join(tokens)
+            queryset = queryset.annotate(similarity=TrigramWordSimilarity(Value(text), 'name'))
+            matches |= Q(name__trigram_word_similar=text, similarity__gte=self.min_similarity)
+            queryset = queryset.annotate(score=Greatest(F('rank'), F('similarity')))
+        else:
+            queryset = queryset.annotate(score=F('rank'))
+
+        if not include_inactive:
+            queryset = queryset.filter(is_active=True)
+        return list(queryset.filter(matches).order_by('-score', 'id').values_list('id', flat=True)[:limit])
+
+    def trigrams_available(self):
+        if self.has_trigrams is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                self.has_trigrams = cursor.fetchone() is not None
+        return self.has_trigrams
+
+    def product_saved(self, product):
+        pass
+
+    def product_deleted(self, product):
+        pass
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        name = settings.PRODUCT_SEARCH_BACKEND
+        if name == 'auto':
+            name = 'postgres' if connection.vendor == 'postgresql' else 'local'
+        _backend = PostgresSearchBackend() if name == 'postgres' else LocalSearchBackend()
+    return _backend
+
+
+def search_products(query, limit=20, include_inactive=False):
+    """Ids of the best matching products, best first."""
+    return get_search_backend().search(query, limit, include_inactive)
+
+
+def product_saved(sender, instance, **kwargs):
+    get_search_backend().product_saved(instance)
+
+
+def product_deleted(sender, instance, **kwargs):
+    get_search_backend().product_deleted(instance)
@@ -1,8 +1,22 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from .models import User, Category, Product, Order
+from django.db.models import Prefetch, prefetch_related_objects
+from .models import User, Category, Product, Order, OrderItem
+from . import analytics, tasks
+from .metrics import TimedSerializerMixin
+from .inventory import InsufficientStock, reserve_stock, reserve_stock_lines
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-class RegisterSerializer(serializers.ModelSerializer):
+CENT = Decimal('0.01')
+
+
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -17,17 +31,32 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     def get_token(cls, user):
         token = super().get_token(user)
         token['role'] = user.role
+        token['username'] = user.username
         return token
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description']
         
 
 
-class ProductSerializer(serializers.ModelSerializer):
+def is_unique_name_violation(exc):
+    """Whether an IntegrityError is the product (category, name) constraint."""
+    diag = getattr(exc.__cause__, 'diag', None)
+    if diag is not None:
+        # PostgreSQL reports the constraint by name.
+        return diag.constraint_name == 'product_unique_name_per_category'
+    # SQLite reports the columns:
+    # "UNIQUE constraint failed: ecom_product.category_id, ecom_product.name"
+    table = Product._meta.db_table
+    return str(exc) == f'UNIQUE constraint failed: {table}.category_id, {table}.name'
+
+
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    select_related_fields = ['category']
+
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -38,19 +67,28 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'stock', 'is_active', 'category', 'category_id']
+        # Uniqueness is enforced by the database constraint, see create()/update().
+        validators = []
 
-    def validate(self, attrs):
-        name = attrs.get('name')
-        category = attrs.get('category')
-        
-        if self.instance is None:
-            if Product.objects.filter(name=name, category=category).exists():
-                raise serializers.ValidationError("Product with this name and category already exists.")
-        else:
-            if Product.objects.filter(name=name, category=category).exclude(id=self.instance.id).exists():
-                raise serializers.ValidationError("Another product with this name and category already exists.")
+    def create(self, validated_data):
+        # The (category, name) unique constraint decides; checking with a
+        # query first would race with concurrent writes anyway.
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError as exc:
+            if not is_unique_name_violation(exc):
+                raise
+            raise serializers.ValidationError("Product with this name and category already exists.")
 
-        return attrs
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError as exc:
+            if not is_unique_name_violation(exc):
+                raise
+            raise serializers.ValidationError("Another product with this name and category already exists.")
 
 
 class ProductInOrderSerializer(serializers.ModelSerializer):
@@ -61,13 +99,51 @@ class ProductInOrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'price', 'category']
 
 
-class OrderWriteSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-    quantity = serializers.IntegerField()
+def availability_error(product, qty):
+    """Why `qty` units of `product` can't be ordered, or None if they can."""
+    if not product.is_active:
+        return "Cannot order an inactive product."
+    if product.stock < qty:
+        return f"Only {product.stock} item(s) left in stock, you requested {qty}."
+    return None
+
+
+def stock_taken_error(lines):
+    """
+    After InsufficientStock, with the transaction rolled back: why the
+    `(product, quantity)` lines can't be ordered now.
+    """
+    for product, qty in lines:
+        product.refresh_from_db(fields=['stock', 'is_active'])
+        error = availability_error(product, qty)
+        if error:
+            return error
+    return "Product is no longer available."
+
+
+class OrderItemWriteSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class OrderWriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Takes either `{items: [{product, quantity}, ...]}` or the original
+    single-product `{product, quantity}`. Either way the order and its items
+    are written in one transaction and stock is reserved for every item or
+    for none.
+    """
+    max_items = 100
+
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), required=False)
+    quantity = serializers.IntegerField(required=False)
+    items = OrderItemWriteSerializer(many=True, required=False, allow_empty=False,
+                                     max_length=max_items, write_only=True)
 
     class Meta:
         model = Order
-        fields = ['product', 'quantity']
+        fields = ['id', 'product', 'quantity', 'items']
+        read_only_fields = ['id']
 
     def validate_quantity(self, value):
         if value <= 0:
@@ -75,42 +151,357 @@ class OrderWriteSerializer(serializers.ModelSerializer):
         return value
 
     def validate(self, data):
-        product = data['product']
-        qty = data['quantity']
+        if 'items' in data:
+            if 'product' in data or 'quantity' in data:
+                raise serializers.ValidationError("Send either items or product and quantity, not both.")
+            return data
 
-        if not product.is_active:
-            raise serializers.ValidationError("Cannot order an inactive product.")
-
-        if product.stock < qty:
-            raise serializers.ValidationError(
-                f"Only {product.stock} item(s) left in stock, you requested {qty}."
-            )
+        if 'product' not in data or 'quantity' not in data:
+            raise serializers.ValidationError("Either items or product and quantity are required.")
 
+        # Fail fast on the row we already loaded; create() re-checks atomically.
+        self.check_availability(data['product'], data['quantity'])
         return data
 
+    def check_availability(self, product, qty):
+        error = availability_error(product, qty)
+        if error:
+            raise serializers.ValidationError(error)
+
     def create(self, validated_data):
-        order = Order.objects.create(
-            customer=self.context['request'].user,
-            **validated_data
-        )
-        product = order.product
-        product.stock -= order.quantity
-        product.save(update_fields=['stock'])
+        # request.user may be a token-backed stand-in, so assign by id.
+        customer_id = validated_data.get('customer_id') or self.context['request'].user.id
+        if 'items' in validated_data:
+            return self.create_with_items(customer_id, validated_data['items'])
+
+        product = validated_data['product']
+        qty = validated_data['quantity']
+
+        with transaction.atomic():
+            if not reserve_stock(product, qty):
+                # Another checkout got there first; report the fresh numbers.
+                product.refresh_from_db(fields=['stock', 'is_active'])
+                self.check_availability(product, qty)
+                raise serializers.ValidationError("Product is no longer available.")
+            order = Order.objects.create(
+                customer_id=customer_id, product=product, quantity=qty, total_price=qty * product.price,
+            )
+            item = OrderItem.objects.create(order=order, product=product, quantity=qty, unit_price=product.price)
+            analytics.order_placed([order], [item])
+            product.stock -= qty
+            tasks.order_placed([order], [product])
+        return order
+
+    def create_with_items(self, customer_id, items):
+        """
+        One query fetches and locks the products, one UPDATE reserves their
+        stock and one bulk_create inserts the items, whatever their number.
+        """
+        try:
+            with transaction.atomic():
+                products = (
+                    Product.objects
+                    .select_for_update(of=('self',))
+                    .in_bulk({item['product'] for item in items})
+                )
+
+                lines = []
+                for item in items:
+                    product = products.get(item['product'])
+                    if product is None:
+                        raise serializers.ValidationError({'items': [f'Invalid pk "{item["product"]}" - object does not exist.']})
+                    lines.append((product, item['quantity']))
+
+                prices = [product.price for product, _ in lines]
+                for (product, qty), reserved in zip(lines, reserve_stock_lines(lines)):
+                    if not reserved:
+                        # Leaving the atomic block undoes the stock UPDATE.
+                        raise serializers.ValidationError(availability_error(product, qty))
+
+                order = Order.objects.create(
+                    customer_id=customer_id,
+                    quantity=sum(qty for _, qty in lines),
+                    total_price=sum(qty * price for (_, qty), price in zip(lines, prices)),
+                )
+                created = OrderItem.objects.bulk_create(
+                    OrderItem(order=order, product=product, quantity=qty, unit_price=price)
+                    for (product, qty), price in zip(lines, prices)
+                )
+                analytics.order_placed([order], created)
+                # reserve_stock_lines() left the products' stock as reserved.
+                tasks.order_placed([order], products.values())
+        except InsufficientStock as exc:
+            # Another checkout took the stock after it was read.
+            raise serializers.ValidationError(stock_taken_error(exc.lines))
         return order
 
 
-class OrderReadSerializer(serializers.ModelSerializer):
+class OrderItemReadSerializer(serializers.ModelSerializer):
+    product = ProductInOrderSerializer(read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ['product', 'quantity', 'unit_price', 'line_total']
+
+
+class OrderReadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    select_related_fields = ['product__category']
+    # One query for the items of every order on the page.
+    prefetch_related_fields = [
+        Prefetch('items', queryset=OrderItem.objects.select_related('product__category').order_by('id')),
+    ]
+
     product = ProductInOrderSerializer(read_only=True)
+    items = OrderItemReadSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
-        fields = ['id', 'product', 'quantity', 'status', 'created_at', 'total_price']
+        fields = ['id', 'product', 'quantity', 'items', 'status', 'created_at', 'total_price']
         read_only_fields = ['id', 'status', 'created_at', 'total_price']
 
     def get_total_price(self, obj):
-        return obj.quantity * obj.product.price
+        return obj.total_price
+
+
+def decimal_string(value):
+    """A DecimalField(decimal_places=2) value; database values already have two places."""
+    if value.as_tuple().exponent != -2:
+        value = value.quantize(CENT)
+    return f'{value:f}'
+
+
+class ValuesSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    Read-only serializer of `.values()` rows. RelatedQuerysetMixin selects
+    `values_fields` instead of loading model instances, and
+    to_representation() builds the output dict directly instead of going
+    through a field object per value. Subclasses reproduce the output of
+    the ModelSerializer they stand in for exactly; the tests compare the
+    rendered bytes.
+    """
+    values_fields = ()
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    """ProductSerializer's output."""
+    values_fields = ('id', 'name', 'price', 'stock', 'is_active', 'category_id', 'category__name',
+                     'category__description')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'price': decimal_string(row['price']),
+            'stock': row['stock'],
+            'is_active': row['is_active'],
+            'category': {
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'description': row['category__description'],
+            },
+        }
+
+
+class OrderValuesListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    def to_representation(self, data):
+        rows = list(data)
+        self.child.load_items(rows)
+        return [self.child.to_representation(row) for row in rows]
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    """
+    OrderReadSerializer's output. The items of all the rows are read with
+    one more query.
+    """
+    values_fields = ('id', 'quantity', 'status', 'created_at', 'total_price', 'product_id', 'product__name',
+                     'product__price', 'product__category__name')
+    item_fields = ('order_id', 'quantity', 'unit_price', 'product_id', 'product__name', 'product__price',
+                   'product__category__name')
+    # What a single order's ETag covers (OrderViewSet.get_validators()).
+    stamp_fields = ('updated_at', 'product__updated_at', 'product__category__updated_at')
+
+    class Meta:
+        list_serializer_class = OrderValuesListSerializer
+
+    @cached_property
+    def datetime_field(self):
+        # The active time zone, looked up once instead of for every row.
+        return serializers.DateTimeField(default_timezone=timezone.get_current_timezone())
+
+    @classmethod
+    def load_items(cls, rows, stamps=False):
+        """
+        Set each row's 'items' to its item rows, unless already loaded;
+        with `stamps`, the items' product and category updated_at too.
+        """
+        rows = [row for row in rows if 'items' not in row]
+        for row in rows:
+            row['items'] = []
+        by_id = {row['id']: row for row in rows}
+        if not by_id:
+            return
+        fields = cls.item_fields + (cls.stamp_fields[1:] if stamps else ())
+        items = OrderItem.objects.filter(order_id__in=by_id).order_by('id').values(*fields)
+        for item in items:
+            by_id[item['order_id']]['items'].append(item)
+
+    @staticmethod
+    def product(row):
+        if row['product_id'] is None:
+            return None
+        return {
+            'id': row['product_id'],
+            'name': row['product__name'],
+            'price': decimal_string(row['product__price']),
+            'category': row['product__category__name'],
+        }
+
+    def to_representation(self, row):
+        if 'items' not in row:
+            self.load_items([row])
+        product = self.product
+        return {
+            'id': row['id'],
+            'product': product(row),
+            'quantity': row['quantity'],
+            'items': [
+                {
+                    'product': product(item),
+                    'quantity': item['quantity'],
+                    'unit_price': decimal_string(item['unit_price']),
+                    'line_total': decimal_string(item['quantity'] * item['unit_price']),
+                }
+                for item in row['items']
+            ],
+            'status': row['status'],
+            'created_at': self.datetime_field.to_representation(row['created_at']),
+            # A Decimal, as OrderReadSerializer.get_total_price() returns it.
+            'total_price': row['total_price'],
+        }
+
+
+class OrderBulkCreateSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Places one order per item. Products are fetched and locked with a single
+    query, stock for every item is reserved with a single UPDATE and the
+    orders and their items are inserted with one bulk_create each, whatever
+    the item count.
+    Items that can't be fulfilled are reported instead of failing the batch.
+    """
+    max_items = 100
+
+    items = OrderItemWriteSerializer(many=True, allow_empty=False, max_length=max_items)
+
+    def create(self, validated_data):
+        items = validated_data['items']
+        customer_id = validated_data.get('customer_id') or self.context['request'].user.id
+        results = [{'index': index} for index in range(len(items))]
+
+        try:
+            with transaction.atomic():
+                products = (
+                    Product.objects
+                    .select_for_update(of=('self',))
+                    .select_related('category')
+                    .in_bulk({item['product'] for item in items})
+                )
+
+                lines, positions = [], []
+                for result, item in zip(results, items):
+                    product = products.get(item['product'])
+                    if product is None:
+                        result['errors'] = [f'Invalid pk "{item["product"]}" - object does not exist.']
+                    else:
+                        lines.append((product, item['quantity']))
+                        positions.append(result)
+
+                orders = []
+                for result, (product, qty), reserved in zip(positions, lines, reserve_stock_lines(lines)):
+                    if not reserved:
+                        result['errors'] = [availability_error(product, qty)]
+                        continue
+                    result['order'] = Order(
+                        customer_id=customer_id, product=product, quantity=qty, total_price=qty * product.price,
+                    )
+                    orders.append(result['order'])
+
+                Order.objects.bulk_create(orders)
+                created = OrderItem.objects.bulk_create(
+                    OrderItem(order=order, product=order.product, quantity=order.quantity, unit_price=order.product.price)
+                    for order in orders
+                )
+                analytics.order_placed(orders, created)
+                tasks.order_placed(orders, products.values())
+        except InsufficientStock as exc:
+            # Another checkout took the stock after it was read.
+            raise serializers.ValidationError(stock_taken_error(exc.lines))
+
+        # The representation lists each order's items: one query for all of them.
+        prefetch_related_objects(orders, *OrderReadSerializer.prefetch_related_fields)
+        return results
+
+    def to_representation(self, results):
+        return {
+            'results': [
+                {'index': result['index'], 'status': 'created', 'order': OrderReadSerializer(result['order']).data}
+                if 'order' in result else
+                {'index': result['index'], 'status': 'rejected', 'errors': result['errors']}
+                for result in results
+            ]
+        }
 
 
 class OrderChangeStatusSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+
+class AnalyticsRangeSerializer(serializers.Serializer):
+    """A day range, defaulting to the last `default_days` days."""
+    default_days = 30
+    max_days = 366
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=self.default_days - 1))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("'start' must not be after 'end'.")
+        if (data['end'] - data['start']).days >= self.max_days:
+            raise serializers.ValidationError(f"The range can span at most {self.max_days} days.")
+        return data
+
+
+class SalesQuerySerializer(AnalyticsRangeSerializer):
+    group_by = serializers.ChoiceField(choices=['day', 'category', 'product'], default='day')
+    # Applies to the category and product groupings.
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+
+class SalesRowSerializer(TimedSerializerMixin, serializers.Serializer):
+    day = serializers.DateField(required=False)
+    category = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+    name = serializers.CharField(required=False)
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class LowStockQuerySerializer(serializers.Serializer):
+    threshold = serializers.IntegerField(min_value=0, default=settings.LOW_STOCK_THRESHOLD)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
+
+class LowStockProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    select_related_fields = ['category']
+
+    category = serializers.CharField(source='category.name', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'category', 'stock', 'is_active']
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .authentication import forget_user_state
+from .cache import invalidate_catalog
+from .models import User, Category, Product
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+post_save.connect(forget_user_state, sender=User)
+post_delete.connect(forget_user_state, sender=User)
+
+
+post_save.connect(search.product_saved, sender=Product)
+post_delete.connect(search.product_deleted, sender=Product)
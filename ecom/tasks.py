@@ -0,0 +1,79 @@
+"""
+Order side effects, run by the job worker instead of in the request.
+
+The views and serializers call `order_placed()` / `status_changed()` inside
+the transaction that changes the order; those only insert Job rows. The
+handlers below do the work, and may run more than once.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .jobs import enqueue, enqueue_many, job
+from .models import Order, Product, User
+
+
+def order_placed(orders, products):
+    """
+    Queue a confirmation for each of `orders` and, with the same INSERT, a
+    low-stock alert if any of `products` (with their stock after the
+    reservation) is down to LOW_STOCK_THRESHOLD.
+    """
+    jobs = [('orders.confirmation', {'order_id': order.pk}) for order in orders]
+    low = sorted({product.pk for product in products if product.stock <= settings.LOW_STOCK_THRESHOLD})
+    if low:
+        jobs.append(('catalog.low_stock', {'product_ids': low}))
+    enqueue_many(jobs)
+
+
+def status_changed(order):
+    enqueue('orders.status_changed', {'order_id': order.pk, 'status': order.status})
+
+
+@job('orders.confirmation')
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('customer').filter(pk=order_id).first()
+    if order is None or not order.customer.email:
+        return
+    lines = [
+        f'{item.quantity} x {item.product.name} at {item.unit_price}'
+        for item in order.items.select_related('product').order_by('id')
+    ]
+    send_mail(
+        f'Order #{order.pk} received',
+        '\n'.join([f'Hi {order.customer.username},', '', 'We received your order:', *lines, '',
+                   f'Total: {order.total_price}']),
+        None,
+        [order.customer.email],
+    )
+
+
+@job('orders.status_changed')
+def send_status_update(order_id, status):
+    order = Order.objects.select_related('customer').filter(pk=order_id).first()
+    # Skip updates overtaken by a later change; that one has its own job.
+    if order is None or order.status != status or not order.customer.email:
+        return
+    send_mail(
+        f'Order #{order.pk} is {order.get_status_display().lower()}',
+        f'Hi {order.customer.username},\n\nYour order #{order.pk} is now {order.get_status_display().lower()}.',
+        None,
+        [order.customer.email],
+    )
+
+
+@job('catalog.low_stock')
+def alert_low_stock(product_ids):
+    products = list(
+        Product.objects.filter(pk__in=product_ids, stock__lte=settings.LOW_STOCK_THRESHOLD).order_by('stock', 'id')
+    )
+    admins = list(
+        User.objects.filter(role=User.ROLE_ADMIN, is_active=True).exclude(email='').values_list('email', flat=True)
+    )
+    if not products or not admins:
+        return
+    send_mail(
+        f'{len(products)} product(s) low on stock',
+        '\n'.join(f'{product.name} (#{product.pk}): {product.stock} left' for product in products),
+        None,
+        admins,
+    )
@@ -1,3 +1,1588 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from . import analytics, async_views, compression, jobs, metrics, routers, schema, warmup
+from .bench import find_regressions
+from .authentication import StatelessJWTAuthentication
+from .cache import CATALOG_VERSION_KEY, get_catalog_cache
+from .models import (
+    User, Category, Product, Order, OrderItem, DailyCategorySales, DailyOrderStatus, DailyProductSales, Job,
+)
+from .inventory import InsufficientStock, reserve_stock_lines
+from .pagination import OrderPagination
+from .search import LocalSearchIndex
+from .serializers import (
+    CategorySerializer, MyTokenObtainPairSerializer, OrderReadSerializer, ProductSerializer, is_unique_name_violation,
+)
+from .throttling import CacheStore, MemoryStore, SQLiteStore, UserRateThrottle
+
+
+class EcomTestCase(TestCase):
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ROLE_ADMIN)
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.category = Category.objects.create(name='Books')
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.force_authenticate(user=user)
+
+    def assertListQueries(self, url, num, seed):
+        """
+        Assert listing `url` runs exactly `num` queries, both after `seed(1)`
+        and after `seed(10)` has added more rows.
+        """
+        for rows in (1, 10):
+            seed(rows)
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def create_product(self, name='Novel', price='9.99', stock=100, **kwargs):
+        return Product.objects.create(name=name, category=self.category, price=Decimal(price), stock=stock, **kwargs)
+
+    def create_orders(self, count, product=None, customer=None):
+        product = product or self.create_product(name=f'Product {Product.objects.count()}')
+        orders = Order.objects.bulk_create(
+            Order(customer=customer or self.customer, product=product, quantity=1, total_price=product.price)
+            for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, unit_price=product.price) for order in orders
+        )
+        return orders
+
+
+class KeysetPaginationTests(EcomTestCase):
+    def collect(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_orders_walk_newest_first_without_gaps(self):
+        orders = self.create_orders(7)
+        # Identical timestamps must still page deterministically on id.
+        Order.objects.update(created_at=orders[0].created_at)
+        self.login(self.admin)
+
+        ids, pages = self.collect(reverse('order-list') + '?page_size=3')
+
+        self.assertEqual(ids, sorted((order.id for order in orders), reverse=True))
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_the_prior_page(self):
+        self.create_orders(5)
+        self.login(self.admin)
+        first = self.client.get(reverse('order-list') + '?page_size=2')
+        second = self.client.get(first.data['next'])
+
+        previous = self.client.get(second.data['previous'])
+
+        self.assertEqual(previous.data['results'], first.data['results'])
+        self.assertIsNone(previous.data['previous'])
+
+    def test_products_ordered_by_id_and_customers_see_active_only(self):
+        active = [self.create_product(name=f'P{i}') for i in range(3)]
+        self.create_product(name='Hidden', is_active=False)
+        self.login(self.customer)
+
+        ids, _ = self.collect(reverse('product-list') + '?page_size=2')
+
+        self.assertEqual(ids, [product.id for product in active])
+
+    def test_page_size_is_capped(self):
+        self.create_orders(3)
+        self.login(self.admin)
+        with mock.patch.object(OrderPagination, 'max_page_size', 2):
+            response = self.client.get(reverse('order-list') + '?page_size=1000')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.login(self.admin)
+        response = self.client.get(reverse('order-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryCountTests(EcomTestCase):
+    def seed_products(self, rows):
+        for _ in range(rows):
+            category = Category.objects.create(name=f'Category {Category.objects.count()}')
+            Product.objects.create(name='Item', category=category, price=Decimal('1.00'))
+
+    # Orders, then one prefetch for all of their items.
+    def test_order_list_is_two_queries(self):
+        self.login(self.customer)
+        self.assertListQueries(reverse('order-list'), 2, lambda rows: self.create_orders(rows))
+
+    def test_admin_order_list_is_two_queries(self):
+        self.login(self.admin)
+        self.assertListQueries(reverse('order-list'), 2, lambda rows: self.create_orders(rows))
+
+    def test_product_list_is_a_single_query(self):
+        self.login(self.customer)
+        self.assertListQueries(reverse('product-list'), 1, self.seed_products)
+
+
+class ValuesSerializerTests(EcomTestCase):
+    """The `.values()` serializers render the same bytes as the ModelSerializers."""
+
+    def setUp(self):
+        super().setUp()
+        self.category.description = 'Caf\u00e9 \u201cnew\u201d releases\u2028line two'
+        self.category.save()
+        other = Category.objects.create(name='Games')
+        first = self.create_product(name='Novel', price='1234.50')
+        second = Product.objects.create(name='Chess', category=other, price=Decimal('0.05'), stock=1)
+        self.create_product(name='Old', price='3.00', is_active=False)
+        self.create_orders(2, product=first)
+        self.login(self.customer)
+        response = self.client.post(reverse('order-list'), {
+            'items': [{'product': first.pk, 'quantity': 3}, {'product': second.pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.order_id = response.data['id']
+        self.first = first
+
+    def assertSameBytes(self, url):
+        responses = []
+        for fast in (True, False):
+            get_catalog_cache().clear()
+            with self.settings(FAST_READ_SERIALIZERS=fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses.append(response)
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual(responses[0].get('ETag'), responses[1].get('ETag'))
+        return responses[0]
+
+    @mock.patch('ecom.mixins.get_catalog_version', return_value=1)
+    def test_products(self, version):
+        for user in (self.customer, self.admin):
+            self.login(user)
+            self.assertSameBytes(reverse('product-list'))
+            self.assertSameBytes(f"{reverse('product-list')}?ordering=-price&page_size=1")
+            self.assertSameBytes(reverse('product-detail', args=[self.first.pk]))
+
+    def test_orders(self):
+        for user in (self.customer, self.admin):
+            self.login(user)
+            response = self.assertSameBytes(f"{reverse('order-list')}?page_size=2")
+            self.assertSameBytes(response.data['next'])
+            response = self.assertSameBytes(reverse('order-detail', args=[self.order_id]))
+
+        self.assertIsNone(response.data['product'])
+        self.assertEqual([item['line_total'] for item in response.data['items']], ['3703.50', '0.05'])
+
+    def test_schema_documents_the_model_serializers(self):
+        response = self.client.get(reverse('schema'), {'format': 'json'})
+
+        self.assertEqual(response.status_code, 200)
+        components = json.loads(response.content)['components']['schemas']
+        self.assertIn('items', components['OrderRead']['properties'])
+
+
+class OrderCreateTests(EcomTestCase):
+    def test_create_reserves_stock(self):
+        product = self.create_product(stock=5)
+        self.login(self.customer)
+
+        response = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 3})
+
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 2)
+        self.assertEqual(Order.objects.get().customer, self.customer)
+
+    def test_create_rejects_more_than_stock(self):
+        product = self.create_product(stock=2)
+        self.login(self.customer)
+
+        response = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 3})
+
+        self.assertEqual(response.status_code, 400)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_reservation_lost_after_validation_is_rejected(self):
+        product = self.create_product(stock=3)
+        self.login(self.customer)
+        # Simulate a concurrent checkout draining stock between validate() and create().
+        with mock.patch('ecom.serializers.reserve_stock', return_value=False):
+            Product.objects.filter(pk=product.pk).update(stock=1)
+            response = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 3})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_single_product_payload_creates_one_item(self):
+        product = self.create_product(price='4.50', stock=5)
+        self.login(self.customer)
+
+        response = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 2})
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('9.00'))
+        self.assertEqual(list(order.items.values_list('product', 'quantity', 'unit_price')),
+                         [(product.id, 2, Decimal('4.50'))])
+
+
+class OrderItemsTests(EcomTestCase):
+    def post_items(self, items):
+        return self.client.post(reverse('order-list'), {'items': items}, format='json')
+
+    def test_create_with_items_reserves_stock_and_stores_total(self):
+        novel = self.create_product(name='Novel', price='10.00', stock=5)
+        poems = self.create_product(name='Poems', price='2.50', stock=5)
+        self.login(self.customer)
+
+        response = self.post_items([{'product': novel.id, 'quantity': 1}, {'product': poems.id, 'quantity': 4}])
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertIsNone(order.product)
+        self.assertEqual(order.quantity, 5)
+        self.assertEqual(order.total_price, Decimal('20.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Novel': 4, 'Poems': 1})
+
+    def test_items_are_all_or_nothing(self):
+        novel = self.create_product(name='Novel', stock=5)
+        poems = self.create_product(name='Poems', stock=1)
+        self.login(self.customer)
+
+        response = self.post_items([{'product': novel.id, 'quantity': 1}, {'product': poems.id, 'quantity': 2}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ['Only 1 item(s) left in stock, you requested 2.'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Novel': 5, 'Poems': 1})
+
+    def test_stock_taken_after_it_was_read_is_rejected(self):
+        novel = self.create_product(name='Novel', stock=5)
+        poems = self.create_product(name='Poems', stock=5)
+        self.login(self.customer)
+
+        def racing(lines):
+            # Another checkout takes most of the Poems once they were read;
+            # SQLite doesn't lock the rows.
+            Product.objects.filter(pk=poems.pk).update(stock=1)
+            return reserve_stock_lines(lines)
+
+        with mock.patch('ecom.serializers.reserve_stock_lines', racing):
+            response = self.post_items([{'product': novel.id, 'quantity': 1}, {'product': poems.id, 'quantity': 3}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        # Rolled back with the order; outside a test the other checkout's
+        # write would stay and be reported.
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Novel': 5, 'Poems': 5})
+
+    def test_reserve_stock_lines_rechecks_stock_in_the_update(self):
+        product = self.create_product(stock=5)
+        Product.objects.filter(pk=product.pk).update(stock=2)
+
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            reserve_stock_lines([(product, 3)])
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 2)
+
+    def test_items_and_product_are_exclusive(self):
+        product = self.create_product()
+        self.login(self.customer)
+
+        response = self.client.post(
+            reverse('order-list'),
+            {'product': product.id, 'quantity': 1, 'items': [{'product': product.id, 'quantity': 1}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_orders_cannot_be_edited(self):
+        product = self.create_product(price='2.00', stock=5)
+        self.login(self.customer)
+        order_id = self.post_items([{'product': product.id, 'quantity': 1}]).data['id']
+        url = reverse('order-detail', args=[order_id])
+
+        for user in (self.customer, self.admin):
+            self.login(user)
+            patch = self.client.patch(url, {'product': product.id, 'quantity': 3}, format='json')
+            put = self.client.put(url, {'items': [{'product': product.id, 'quantity': 3}]}, format='json')
+            self.assertEqual((patch.status_code, put.status_code), (405, 405))
+
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual((order.quantity, order.total_price), (1, Decimal('2.00')))
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [1])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 4)
+
+    def test_read_uses_price_at_purchase(self):
+        product = self.create_product(price='3.00', stock=5)
+        self.login(self.customer)
+        order_id = self.post_items([{'product': product.id, 'quantity': 2}]).data['id']
+
+        product.price = Decimal('5.00')
+        product.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-detail', args=[order_id]))
+
+        self.assertEqual(response.data['total_price'], Decimal('6.00'))
+        self.assertEqual(response.data['items'][0]['unit_price'], '3.00')
+        self.assertEqual(response.data['items'][0]['line_total'], '6.00')
+
+
+class OrderBulkCreateTests(EcomTestCase):
+    def post_bulk(self, items):
+        return self.client.post(reverse('order-bulk'), {'items': items}, format='json')
+
+    def test_bulk_create_runs_constant_queries(self):
+        products = [self.create_product(name=f'P{i}', stock=10) for i in range(3)]
+        self.login(self.customer)
+
+        # Savepoint, product fetch + lock, stock UPDATE, order INSERT, item
+        # INSERT, one upsert per analytics rollup, the job INSERT, release,
+        # then the item prefetch for the response.
+        for count in (3, 30):
+            items = [{'product': products[i % 3].id, 'quantity': 1} for i in range(count)]
+            Product.objects.update(stock=10)
+            with self.assertNumQueries(11):
+                response = self.post_bulk(items)
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(Order.objects.count(), 33)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {0})
+
+    def test_bulk_create_reports_each_item(self):
+        available = self.create_product(name='Available', stock=3)
+        inactive = self.create_product(name='Inactive', is_active=False)
+        self.login(self.customer)
+
+        response = self.post_bulk([
+            {'product': available.id, 'quantity': 2},
+            {'product': available.id, 'quantity': 2},
+            {'product': inactive.id, 'quantity': 1},
+            {'product': 9999, 'quantity': 1},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(results[0]['order']['product']['id'], available.id)
+        self.assertEqual(results[1]['errors'], ['Only 1 item(s) left in stock, you requested 2.'])
+        self.assertEqual(results[2]['errors'], ['Cannot order an inactive product.'])
+        available.refresh_from_db()
+        self.assertEqual(available.stock, 1)
+        self.assertEqual(Order.objects.get().customer, self.customer)
+
+    def test_bulk_create_with_nothing_fulfilled_is_bad_request(self):
+        product = self.create_product(stock=0)
+        self.login(self.customer)
+
+        response = self.post_bulk([{'product': product.id, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_taken_after_it_was_read_is_rejected(self):
+        product = self.create_product(stock=5)
+        self.login(self.customer)
+
+        def racing(lines):
+            Product.objects.filter(pk=product.pk).update(stock=1)
+            return reserve_stock_lines(lines)
+
+        with mock.patch('ecom.serializers.reserve_stock_lines', racing):
+            response = self.post_bulk([{'product': product.id, 'quantity': 3}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class AnalyticsTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.novel = self.create_product(name='Novel', price='10.00', stock=50)
+        self.poems = self.create_product(name='Poems', price='2.50', stock=50)
+
+    def place(self, items):
+        self.login(self.customer)
+        response = self.client.post(reverse('order-list'), {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data['id'])
+
+    def report(self, name, query=''):
+        self.login(self.admin)
+        response = self.client.get(reverse(f'analytics-{name}') + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_sales_follow_creates_and_cancellations(self):
+        self.place([{'product': self.novel.id, 'quantity': 2}, {'product': self.poems.id, 'quantity': 4}])
+        cancelled = self.place([{'product': self.novel.id, 'quantity': 1}])
+        self.login(self.customer)
+        self.client.post(reverse('order-cancel', args=[cancelled.id]))
+
+        days = self.report('sales')
+        self.assertEqual(len(days), 1)
+        self.assertEqual((days[0]['orders'], days[0]['units'], days[0]['revenue']), (1, 6, '30.00'))
+
+        products = self.report('sales', '?group_by=product')
+        self.assertEqual([(row['name'], row['units'], row['revenue']) for row in products],
+                         [('Novel', 2, '20.00'), ('Poems', 4, '10.00')])
+        self.assertEqual(self.report('sales', '?group_by=category')[0]['orders'], 1)
+        self.assertEqual(self.report('order-status')['cancelled'], 1)
+
+    def test_rollups_match_a_rebuild(self):
+        self.place([{'product': self.novel.id, 'quantity': 2}])
+        self.login(self.customer)
+        self.client.post(reverse('order-bulk'), {'items': [
+            {'product': self.novel.id, 'quantity': 1}, {'product': self.poems.id, 'quantity': 3},
+        ]}, format='json')
+        order = Order.objects.first()
+        self.login(self.admin)
+        self.client.post(reverse('order-change-status', args=[order.id]), {'status': 'cancelled'})
+        self.client.post(reverse('order-change-status', args=[order.id]), {'status': 'shipped'})
+        self.client.delete(reverse('order-detail', args=[Order.objects.last().id]))
+
+        def snapshot():
+            return (
+                sorted(DailyCategorySales.objects.filter(units__gt=0).values_list('category', 'orders', 'units', 'revenue')),
+                sorted(DailyProductSales.objects.filter(units__gt=0).values_list('product', 'orders', 'units', 'revenue')),
+                sorted(DailyOrderStatus.objects.filter(orders__gt=0).values_list('status', 'orders')),
+            )
+        incremental = snapshot()
+        analytics.rebuild_rollups()
+        self.assertEqual(incremental, snapshot())
+
+    def test_reports_read_rollups_only(self):
+        self.place([{'product': self.novel.id, 'quantity': 1}])
+        self.login(self.admin)
+        for name, query in (('sales', ''), ('sales', '?group_by=product'), ('order-status', '')):
+            with self.subTest(name=name, query=query), CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse(f'analytics-{name}') + query)
+            self.assertFalse([q['sql'] for q in queries if '"ecom_order"' in q['sql'] or 'ecom_orderitem' in q['sql']])
+
+    def test_stale_status_change_is_ignored(self):
+        order = self.place([{'product': self.novel.id, 'quantity': 1}])
+        # Another request ships the order after this one loaded it.
+        Order.objects.filter(pk=order.pk).update(status=Order.STATUS_SHIPPED)
+
+        self.assertFalse(analytics.change_status(order, Order.STATUS_CANCELLED))
+
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.STATUS_SHIPPED)
+        self.assertEqual(self.report('sales')[0]['units'], 1)
+
+    def test_low_stock_orders_by_stock(self):
+        self.create_product(name='Last copies', stock=1)
+        self.create_product(name='Sold out', stock=0)
+
+        rows = self.report('low-stock', '?threshold=1')
+
+        self.assertEqual([(row['name'], row['stock']) for row in rows], [('Sold out', 0), ('Last copies', 1)])
+
+    def test_reports_are_admin_only_and_validate_ranges(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('analytics-sales')).status_code, 403)
+        self.login(self.admin)
+        response = self.client.get(reverse('analytics-sales') + '?start=2026-02-01&end=2026-01-01')
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch.dict(jobs.registry)
+class JobQueueTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+        @jobs.job('tests.flaky', max_attempts=2)
+        def flaky(fail):
+            self.calls.append(fail)
+            if fail:
+                raise RuntimeError('boom')
+
+    def run_due(self):
+        return [jobs.execute(claimed) for claimed in jobs.claim(10)]
+
+    def test_orders_queue_their_side_effects(self):
+        self.customer.email = 'customer@example.com'
+        self.customer.save()
+        product = self.create_product(stock=6)
+        self.login(self.customer)
+        order_id = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 1}).data['id']
+
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')),
+                         [('orders.confirmation', {'order_id': order_id}),
+                          ('catalog.low_stock', {'product_ids': [product.id]})])
+        self.assertEqual(mail.outbox, [])
+
+        self.run_due()
+        self.assertEqual([message.to for message in mail.outbox], [['customer@example.com']])
+
+    def test_failed_orders_queue_nothing(self):
+        product = self.create_product(stock=1)
+        self.login(self.customer)
+        self.client.post(reverse('order-list'), {'items': [{'product': product.id, 'quantity': 2}]}, format='json')
+        self.assertFalse(Job.objects.exists())
+
+    def test_status_change_is_queued(self):
+        order = self.create_orders(1)[0]
+        self.login(self.admin)
+        self.client.post(reverse('order-change-status', args=[order.id]), {'status': 'shipped'})
+        self.assertEqual(Job.objects.get().payload, {'order_id': order.id, 'status': 'shipped'})
+
+    def test_failures_back_off_then_fail(self):
+        queued = jobs.enqueue('tests.flaky', {'fail': True})
+
+        with self.assertLogs('ecom.jobs', 'WARNING'):
+            self.assertEqual(self.run_due(), [Job.STATUS_PENDING])
+        queued.refresh_from_db()
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertEqual(self.run_due(), [])
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('ecom.jobs', 'ERROR'):
+            self.assertEqual(self.run_due(), [Job.STATUS_FAILED])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_expired_lease_is_claimed_again(self):
+        jobs.enqueue('tests.flaky', {'fail': False})
+        stale = jobs.claim(10)[0]
+        self.assertEqual(jobs.claim(10), [])
+
+        Job.objects.update(lease_until=timezone.now() - timedelta(seconds=1))
+        fresh = jobs.claim(10)[0]
+
+        # The first worker lost its claim and can't record an outcome.
+        self.assertIsNone(jobs.execute(stale))
+        self.assertEqual(jobs.execute(fresh), Job.STATUS_DONE)
+        self.assertEqual(Job.objects.get().attempts, 2)
+
+    def test_job_that_keeps_losing_its_lease_fails(self):
+        queued = jobs.enqueue('tests.flaky', {'fail': False})
+        for _ in range(queued.max_attempts):
+            self.assertEqual(len(jobs.claim(10)), 1)
+            Job.objects.update(lease_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertLogs('ecom.jobs', 'ERROR'):
+            self.assertEqual(jobs.claim(10), [])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.STATUS_FAILED, 2))
+        self.assertIn('lease expired', queued.last_error)
+
+    def test_purge_keeps_recently_finished_jobs(self):
+        old, recent = jobs.enqueue('tests.flaky'), jobs.enqueue('tests.flaky')
+        week_ago = timezone.now() - timedelta(days=8)
+        # Both were due long ago; only one finished long ago.
+        Job.objects.update(status=Job.STATUS_DONE, run_at=week_ago)
+        Job.objects.filter(pk=old.pk).update(updated_at=week_ago)
+
+        self.assertEqual(jobs.purge(days=7), 1)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+class ExportTests(EcomTestCase):
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_has_a_line_per_item(self):
+        novel = self.create_product(name='Novel', price='10.00')
+        poems = self.create_product(name='Poems', price='2.50')
+        self.login(self.customer)
+        self.client.post(reverse('order-list'), {'items': [
+            {'product': novel.id, 'quantity': 1}, {'product': poems.id, 'quantity': 2},
+        ]}, format='json')
+        self.login(self.admin)
+
+        rows = list(csv.DictReader(io.StringIO(self.export(reverse('order-export')))))
+
+        self.assertEqual([(row['item_product'], row['item_line_total']) for row in rows],
+                         [('Novel', '10.00'), ('Poems', '5.00')])
+        self.assertEqual({row['total_price'] for row in rows}, {'15.00'})
+
+    def test_orders_ndjson_applies_list_filters_and_ordering(self):
+        orders = self.create_orders(3)
+        Order.objects.filter(pk=orders[0].pk).update(status=Order.STATUS_CANCELLED)
+        self.login(self.admin)
+
+        lines = self.export(reverse('order-export') + '?output=ndjson&status=pending').splitlines()
+
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['id'] for record in records], [orders[2].id, orders[1].id])
+        self.assertEqual(records[0]['items'][0]['unit_price'], '9.99')
+
+    def test_export_queries_do_not_grow_with_rows(self):
+        self.login(self.admin)
+        for count in (1, 10):
+            self.create_orders(count)
+            # Orders with their customer, then one items prefetch per chunk.
+            with self.assertNumQueries(2):
+                self.export(reverse('order-export'))
+
+    def test_products_export_is_admin_only(self):
+        self.create_product(name='Novel')
+        other = Category.objects.create(name='Music')
+        Product.objects.create(name='Album', category=other, price=Decimal('5.00'), stock=1)
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('product-export')).status_code, 403)
+        self.login(self.admin)
+
+        rows = list(csv.DictReader(io.StringIO(self.export(reverse('product-export') + f'?category={other.id}'))))
+
+        self.assertEqual([(row['name'], row['category']) for row in rows], [('Album', 'Music')])
+        response = self.client.get(reverse('product-export') + '?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class ListFilterTests(EcomTestCase):
+    def names(self, query):
+        response = self.client.get(reverse('product-list') + query)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data['results']]
+
+    def setUp(self):
+        super().setUp()
+        films = Category.objects.create(name='Films')
+        self.create_product(name='Atlas', price='5.00', stock=0)
+        self.create_product(name='atlas of birds', price='15.00')
+        self.create_product(name='Birds', price='25.00', is_active=False)
+        Product.objects.create(name='Alien', category=films, price=Decimal('10.00'), stock=3)
+        self.films = films
+
+    def test_product_filters(self):
+        self.login(self.customer)
+
+        self.assertEqual(self.names(f'?category={self.films.id}'), ['Alien'])
+        self.assertEqual(self.names('?min_price=6&max_price=15'), ['atlas of birds', 'Alien'])
+        self.assertEqual(self.names('?in_stock=false'), ['Atlas'])
+        self.assertEqual(self.names('?search=ATL'), ['Atlas', 'atlas of birds'])
+
+    def test_ordering_pages_by_price(self):
+        self.login(self.customer)
+        response = self.client.get(reverse('product-list') + '?ordering=-price&page_size=2')
+        following = self.client.get(response.data['next'])
+
+        names = [row['name'] for row in response.data['results'] + following.data['results']]
+        self.assertEqual(names, ['atlas of birds', 'Alien', 'Atlas'])
+
+    def test_is_active_filter_is_admin_only(self):
+        self.login(self.customer)
+        self.assertEqual(len(self.names('?is_active=false')), 3)
+
+        self.login(self.admin)
+        self.assertEqual(self.names('?is_active=false'), ['Birds'])
+
+    def test_order_filters(self):
+        pending, shipped = self.create_orders(2)
+        shipped.status = Order.STATUS_SHIPPED
+        shipped.save()
+        Order.objects.filter(pk=pending.pk).update(created_at='2020-01-01T00:00:00Z')
+        self.login(self.customer)
+
+        def ids(query):
+            return [row['id'] for row in self.client.get(reverse('order-list') + query).data['results']]
+
+        self.assertEqual(ids('?status=shipped'), [shipped.id])
+        self.assertEqual(ids('?created_before=2021-01-01T00:00:00Z'), [pending.id])
+        self.assertEqual(ids('?created_after=2021-01-01T00:00:00Z'), [shipped.id])
+        self.assertEqual(ids('?ordering=created_at'), [pending.id, shipped.id])
+
+
+class CatalogCacheTests(EcomTestCase):
+    def test_repeated_list_is_served_from_cache(self):
+        self.create_product()
+        self.login(self.customer)
+        first = self.client.get(reverse('product-list'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('product-list'))
+
+        self.assertEqual(second.data, first.data)
+
+    def test_product_save_invalidates(self):
+        product = self.create_product(price='1.00')
+        self.login(self.customer)
+        self.client.get(reverse('product-detail', args=[product.id]))
+
+        product.price = Decimal('2.00')
+        product.save()
+        response = self.client.get(reverse('product-detail', args=[product.id]))
+
+        self.assertEqual(response.data['price'], '2.00')
+
+    def test_order_invalidates_stock(self):
+        product = self.create_product(stock=5)
+        self.login(self.customer)
+        self.client.get(reverse('product-list'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 2})
+        response = self.client.get(reverse('product-list'))
+
+        self.assertEqual(response.data['results'][0]['stock'], 3)
+
+    def test_admin_and_customer_are_cached_separately(self):
+        self.create_product(name='Hidden', is_active=False)
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('product-list')).data['results'], [])
+
+        self.login(self.admin)
+        self.assertEqual(len(self.client.get(reverse('product-list')).data['results']), 1)
+
+
+class ProductUniquenessTests(EcomTestCase):
+    def test_duplicate_name_in_category_is_rejected(self):
+        self.create_product(name='Novel')
+        self.login(self.admin)
+
+        response = self.client.post(
+            reverse('product-list'),
+            {'name': 'Novel', 'price': '5.00', 'stock': 1, 'category_id': self.category.id},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ['Product with this name and category already exists.'])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_rename_onto_existing_name_is_rejected(self):
+        self.create_product(name='Novel')
+        other = self.create_product(name='Poems')
+        self.login(self.admin)
+
+        response = self.client.patch(reverse('product-detail', args=[other.id]), {'name': 'Novel'})
+
+        self.assertEqual(response.status_code, 400)
+        other.refresh_from_db()
+        self.assertEqual(other.name, 'Poems')
+
+    def test_same_name_in_another_category_is_allowed(self):
+        self.create_product(name='Novel')
+        other = Category.objects.create(name='Films')
+        self.login(self.admin)
+
+        response = self.client.post(
+            reverse('product-list'),
+            {'name': 'Novel', 'price': '5.00', 'stock': 1, 'category_id': other.id},
+        )
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_other_integrity_errors_are_raised(self):
+        product = self.create_product(name='Novel')
+        with self.assertRaises(IntegrityError) as duplicate, transaction.atomic():
+            self.create_product(name='Novel')
+        with self.assertRaises(IntegrityError) as negative_stock, transaction.atomic():
+            Product.objects.filter(pk=product.pk).update(stock=-1)
+
+        self.assertTrue(is_unique_name_violation(duplicate.exception))
+        self.assertFalse(is_unique_name_violation(negative_stock.exception))
+        serializer = ProductSerializer(product, data={'name': 'Poems'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with mock.patch('rest_framework.serializers.ModelSerializer.update', side_effect=negative_stock.exception):
+            with self.assertRaises(IntegrityError):
+                serializer.save()
+
+
+class CatalogImportTests(EcomTestCase):
+    def post_rows(self, rows, query=''):
+        self.login(self.admin)
+        return self.client.post(reverse('product-import') + query, rows, format='json')
+
+    def test_upserts_and_reports_bad_rows(self):
+        existing = self.create_product(name='Novel', price='5.00', stock=7)
+
+        response = self.post_rows([
+            {'name': 'Novel', 'category': 'Books', 'price': '6.50'},
+            {'name': 'Poems', 'category_id': self.category.id, 'price': '2.00', 'stock': 3, 'is_active': 'false'},
+            {'name': 'Atlas', 'category': 'Maps', 'price': '9.00'},
+            {'name': 'Essays', 'category': 'Books', 'price': 'cheap'},
+            {'name': 'Poems', 'category': 'Books', 'price': '2.50'},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual({key: response.data[key] for key in ('processed', 'created', 'updated', 'rejected')},
+                         {'processed': 5, 'created': 1, 'updated': 1, 'rejected': 3})
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 3, 5])
+        self.assertEqual(response.data['errors'][2]['errors'], ['Duplicate of row 2.'])
+        existing.refresh_from_db()
+        # Stock wasn't in the row, so it keeps its value.
+        self.assertEqual((existing.price, existing.stock), (Decimal('6.50'), 7))
+        self.assertFalse(Product.objects.get(name='Poems').is_active)
+
+    def test_queries_do_not_grow_with_rows(self):
+        for count in (5, 50):
+            rows = [{'name': f'P{count}-{i}', 'category': 'Books', 'price': '1.00'} for i in range(count)]
+            # Savepoint, categories, existing products, upsert, release.
+            with self.assertNumQueries(5):
+                response = self.post_rows(rows)
+            self.assertEqual(response.data['created'], count)
+
+    def test_csv_upload_refreshes_cache_and_search(self):
+        self.login(self.customer)
+        self.client.get(reverse('product-list'))
+        upload = SimpleUploadedFile('feed.csv', b'name,category,price,stock\nGarden Birds,Nature,4.00,2\n')
+
+        self.login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('product-import') + '?create_categories=1', {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.login(self.customer)
+        self.assertEqual([row['name'] for row in self.client.get(reverse('product-list')).data['results']],
+                         ['Garden Birds'])
+        results = self.client.get(reverse('product-search'), {'q': 'garden'}).data['results']
+        self.assertEqual([row['name'] for row in results], ['Garden Birds'])
+
+    def test_command_streams_ndjson(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        feed, errors = os.path.join(directory.name, 'feed.ndjson'), os.path.join(directory.name, 'errors.json')
+        with open(feed, 'w') as fh:
+            fh.write('{"name": "Novel", "category": "Books", "price": "3.00"}\n\nnot json\n'
+                     '{"name": "Poems", "category": "Books", "price": "1.00"}\n')
+
+        call_command('import_catalog', feed, '--chunk-size', '1', '--errors', errors, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Novel', 'Poems'])
+        with open(errors) as fh:
+            self.assertEqual([error['row'] for error in json.load(fh)], [3])
+
+    def test_customers_cannot_import(self):
+        self.login(self.customer)
+        response = self.client.post(reverse('product-import'), [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductSearchTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_product(name='Atlas of Birds')
+        self.create_product(name='Bird Feeders')
+        self.create_product(name='Cooking Basics')
+        self.login(self.customer)
+
+    def search(self, query):
+        response = self.client.get(reverse('product-search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.data['results']]
+
+    def test_prefix_match_ranks_exact_terms_first(self):
+        self.assertEqual(self.search('bir'), ['Bird Feeders', 'Atlas of Birds'])
+        self.assertEqual(self.search('birds'), ['Atlas of Birds', 'Bird Feeders'])
+
+    def test_every_query_term_must_match(self):
+        self.assertEqual(self.search('atlas bird'), ['Atlas of Birds'])
+        self.assertEqual(self.search('atlas cooking'), [])
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(self.search('cookng'), ['Cooking Basics'])
+
+    def test_index_follows_saves_and_deletes_without_rebuilding(self):
+        self.search('bird')
+        with mock.patch.object(LocalSearchIndex, 'rebuild') as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = self.create_product(name='Garden Birds')
+            self.assertIn('Garden Birds', self.search('garden'))
+
+            product.name = 'Garden Tools'
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+            self.assertEqual(self.search('garden birds'), [])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                product.delete()
+            self.assertEqual(self.search('garden'), [])
+        rebuild.assert_not_called()
+
+    def test_rolled_back_writes_leave_the_index_alone(self):
+        self.search('bird')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.create_product(name='Garden Birds')
+                raise RuntimeError
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.search('garden'), [])
+
+    def test_index_is_rebuilt_when_it_is_too_old(self):
+        self.search('bird')
+        # Written by another process: no signal here, and no version bump
+        # in this process's cache.
+        Product.objects.bulk_create([Product(name='Garden Birds', category=self.category, price=1, stock=1)])
+        self.assertEqual(self.search('garden'), [])
+
+        with self.settings(SEARCH_INDEX_MAX_AGE=0):
+            self.assertEqual(self.search('garden'), ['Garden Birds'])
+
+    def test_inactive_products_are_only_found_by_admins(self):
+        self.create_product(name='Hidden Birds', is_active=False)
+        self.assertNotIn('Hidden Birds', self.search('hidden'))
+
+        self.login(self.admin)
+        self.assertEqual(self.search('hidden'), ['Hidden Birds'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(reverse('product-search')).status_code, 400)
+
+
+class ConditionalGetTests(EcomTestCase):
+    def test_product_list_not_modified(self):
+        self.create_product()
+        self.login(self.customer)
+        first = self.client.get(reverse('product-list'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Last-Modified', first)
+
+    def test_product_change_changes_etag(self):
+        product = self.create_product()
+        self.login(self.customer)
+        etag = self.client.get(reverse('product-list'))['ETag']
+
+        product.save()
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_detail_not_modified_skips_serialization(self):
+        order, = self.create_orders(1)
+        self.login(self.customer)
+        url = reverse('order-detail', args=[order.id])
+        etag = self.client.get(url)['ETag']
+
+        # The order and its item prefetch, which the ETag covers.
+        with mock.patch.object(OrderReadSerializer, 'to_representation') as to_representation:
+            with self.assertNumQueries(2):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+
+    def test_order_detail_etag_follows_product(self):
+        order, = self.create_orders(1)
+        self.login(self.customer)
+        url = reverse('order-detail', args=[order.id])
+        etag = self.client.get(url)['ETag']
+
+        order.product.name = 'Renamed'
+        order.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['product']['name'], 'Renamed')
+
+
+class AsyncCatalogViewTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.products = [self.create_product(name=f'P{i}') for i in range(3)]
+        self.create_product(name='Hidden', is_active=False)
+
+    def headers(self, user, **extra):
+        return {'Authorization': f'Bearer {MyTokenObtainPairSerializer.get_token(user).access_token}', **extra}
+
+    async def get(self, view, path, user, **headers):
+        return await view(self.factory.get(path, headers=self.headers(user, **headers)), **self.path_kwargs(path))
+
+    def path_kwargs(self, path):
+        pk = path.rstrip('/').rsplit('/', 1)[-1]
+        return {'pk': int(pk)} if pk.isdigit() else {}
+
+    async def test_list_matches_sync_view(self):
+        url = reverse('product-list') + '?page_size=2'
+        for user in (self.customer, self.admin):
+            self.login(user)
+            expected = (await self.sync_get(url)).json()
+            get_catalog_cache().clear()
+
+            response = await self.get(async_views.product_list, url, user)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), expected)
+
+    async def test_retrieve_and_missing_product(self):
+        url = reverse('product-detail', args=[self.products[0].id])
+        response = await self.get(async_views.product_detail, url, self.customer)
+        self.assertEqual(json.loads(response.content)['name'], 'P0')
+
+        response = await self.get(async_views.product_detail, reverse('product-detail', args=[9999]), self.customer)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_not_modified(self):
+        url = reverse('category-list')
+        etag = (await self.get(async_views.category_list, url, self.customer))['ETag']
+
+        response = await self.get(async_views.category_list, url, self.customer, **{'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
+    async def test_requires_authentication(self):
+        response = await async_views.product_list(self.factory.get(reverse('product-list')))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_use_sync_viewset(self):
+        request = self.factory.post(
+            reverse('category-list'), {'name': 'Films'}, content_type='application/json', headers=self.headers(self.admin),
+        )
+        response = await async_views.category_list(request)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Category.objects.filter(name='Films').aexists())
+
+    async def test_checks_run_off_the_event_loop(self):
+        threads = []
+        with mock.patch.object(APIView, 'check_throttles', lambda view, request: threads.append(threading.get_ident())):
+            response = await self.get(async_views.product_list, reverse('product-list'), self.customer)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def sync_get(self, url):
+        return await sync_to_async(self.client.get)(url)
+
+
+class SlidingWindowThrottleTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(self.customer)
+        self.now = 0.0
+        patches = [
+            mock.patch('ecom.throttling._store', MemoryStore()),
+            mock.patch.object(UserRateThrottle, 'THROTTLE_RATES', {'user': '3/min'}),
+            mock.patch.object(UserRateThrottle, 'timer', staticmethod(lambda: self.now)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get_at(self, now):
+        self.now = now
+        return self.client.get(reverse('category-list'))
+
+    def test_stores_roll_windows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for store in (MemoryStore(), SQLiteStore(os.path.join(directory.name, 'throttle.sqlite3')), CacheStore('default')):
+            with self.subTest(store=type(store).__name__):
+                hits = [store.hit('k', window, 60, window * 60) for window in (10, 10, 10, 11, 13)]
+                self.assertEqual(hits, [(0, 1), (0, 2), (0, 3), (3, 1), (0, 1)])
+
+    def test_limit_and_retry_after(self):
+        statuses = [self.get_at(90).status_code for _ in range(3)]
+        response = self.get_at(90)
+
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(response.status_code, 429)
+        # Back under the limit once a quarter of the next window has passed.
+        self.assertEqual(response['Retry-After'], '45')
+
+    def test_previous_window_decays(self):
+        for _ in range(3):
+            self.get_at(59)
+
+        # Half of the previous window still counts: 1.5 + 1, then 1.5 + 2.
+        self.assertEqual(self.get_at(90).status_code, 200)
+        self.assertEqual(self.get_at(90).status_code, 429)
+
+
+@mock.patch('ecom.metrics.registry', new_callable=metrics.Registry)
+class MetricsTests(EcomTestCase):
+    def test_server_timing_counts_queries(self, registry):
+        self.create_product()
+        self.login(self.admin)
+
+        response = self.client.get(reverse('product-list'))
+
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'total', 'db', 'serialize'})
+        self.assertIn('desc="1 queries"', timing['db'])
+
+    def test_server_timing_is_for_admins_or_debug(self, registry):
+        self.login(self.customer)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('category-list')))
+        self.client.logout()
+        self.assertNotIn('Server-Timing', self.client.get(reverse('category-list')))
+
+        with self.settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('category-list')))
+
+    def test_only_project_serializers_are_timed(self, registry):
+        class Plain(serializers.Serializer):
+            name = serializers.CharField()
+
+        stats = metrics.RequestStats()
+        token = metrics._current.set(stats)
+        try:
+            Plain({'name': 'Books'}).data
+            self.assertEqual(stats.serializer_time, 0)
+            CategorySerializer([Category(name='Books')], many=True).data
+        finally:
+            metrics._current.reset(token)
+        self.assertGreater(stats.serializer_time, 0)
+
+    def test_histograms_per_route_in_prometheus_format(self, registry):
+        self.login(self.customer)
+        for _ in range(3):
+            self.client.get(reverse('category-list'))
+        self.login(self.admin)
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_requests_total{route="category-list",method="GET",status="200"} 3', body)
+        self.assertIn('http_request_db_queries_bucket{route="category-list",method="GET",le="+Inf"} 3', body)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+
+    def test_metrics_are_admin_only(self, registry):
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_histogram_buckets_are_cumulative(self, registry):
+        histogram = metrics.Histogram('h', 'Test.', ('route',), (1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(('r',), value)
+
+        lines = list(histogram.render())
+
+        self.assertEqual(lines[2:], [
+            'h_bucket{route="r",le="1"} 2', 'h_bucket{route="r",le="5"} 3', 'h_bucket{route="r",le="+Inf"} 4',
+            'h_sum{route="r"} 13.0', 'h_count{route="r"} 4',
+        ])
+
+    async def test_async_stack_is_measured(self, registry):
+        async def view(request):
+            await sync_to_async(list)(Category.objects.all())
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(view)
+        with self.settings(DEBUG=True):
+            response = await middleware(AsyncRequestFactory().get('/'))
+
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class PasswordHashingTests(EcomTestCase):
+    def login_request(self, password='pass'):
+        return self.client.post(reverse('token_obtain_pair'), {'username': 'customer', 'password': password},
+                                format='json')
+
+    def test_login_upgrades_old_hashes(self):
+        self.customer.password = make_password('pass', hasher='pbkdf2_sha256')
+        self.customer.save(update_fields=['password'])
+
+        self.assertEqual(self.login_request().status_code, 200)
+
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.password.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+        self.assertEqual(self.login_request().status_code, 200)
+
+
+class WarmupTests(EcomTestCase):
+    def test_warm_up_runs_every_step(self):
+        messages = []
+        timings = warmup.warm_up(log=messages.append)
+
+        self.assertEqual(list(timings), ['database', 'urls', 'schema', 'password hashing'])
+        self.assertTrue(messages[0].startswith('Warmed up in'))
+
+
+class SchemaTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(schema, '_schema', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_same_documents_as_spectacular(self):
+        factory = APIRequestFactory()
+        for query in ('', '?format=json'):
+            expected = SpectacularAPIView.as_view()(factory.get(f"{reverse('schema')}{query}")).render()
+            response = self.client.get(f"{reverse('schema')}{query}")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected.content)
+            for header in ('Content-Type', 'Content-Disposition'):
+                self.assertEqual(response[header], expected[header])
+
+    def test_compressed_variants_and_etag(self):
+        url = reverse('schema')
+        plain = self.client.get(url)
+        gzipped = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        brotli = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(brotli['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+        self.assertNotEqual(gzipped['ETag'], plain['ETag'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_processes_load_the_built_schema(self):
+        with tempfile.TemporaryDirectory() as static_root, self.settings(STATIC_ROOT=static_root):
+            call_command('build_schema', stdout=io.StringIO())
+            with mock.patch.object(schema, 'generate') as generate:
+                response = self.client.get(reverse('schema'))
+            generate.assert_not_called()
+            self.assertEqual(response.status_code, 200)
+
+            # Other code regenerates it.
+            with self.settings(CODE_VERSION='next'):
+                self.assertIsNone(schema.load(schema.code_version(), schema.schema_dir()))
+
+
+class CompressionTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(30):
+            self.create_product(name=f'Product {i}')
+        self.login(self.customer)
+
+    def test_negotiates_the_preferred_encoding(self):
+        url = reverse('product-list')
+        plain = self.client.get(url)
+        gzipped = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity')
+        preferred = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br, zstd')
+
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(gzipped['Content-Length'], str(len(gzipped.content)))
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+        self.assertEqual(gzipped['ETag'], f"W/{plain['ETag']}")
+        self.assertEqual(preferred['Content-Encoding'], compression.available_encodings()[0].name)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_bodies_are_sent_as_they_are(self):
+        response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_no_transform_and_html_are_sent_as_they_are(self):
+        def view(request):
+            return HttpResponse(b'{}' * 2048, content_type='application/json', headers={
+                'Cache-Control': 'private, no-transform',
+            })
+
+        middleware = compression.CompressionMiddleware(view)
+        response = middleware(APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertNotIn('Content-Encoding', response)
+
+        # The browsable API: BREACH could read its CSRF token through the
+        # compressed length.
+        response = self.client.get(reverse('product-list'), HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_exports_are_compressed_as_they_stream(self):
+        self.login(self.admin)
+        plain = b''.join(self.client.get(reverse('product-export')).streaming_content)
+        response = self.client.get(reverse('product-export'), HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_messagepack(self):
+        url = reverse('product-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.client.get(url).content))
+
+        product = Product.objects.first()
+        response = self.client.post(reverse('order-list'), msgpack.packb({'product': product.pk, 'quantity': 2}),
+                                    content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['quantity'], 2)
+        self.assertEqual(Order.objects.get().quantity, 2)
+
+        response = self.client.post(reverse('order-list'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkBaselineTests(SimpleTestCase):
+    @staticmethod
+    def report(p50_ms, queries, rps=None):
+        return {'scenarios': [{
+            'scenario': 'order list', 'queries': {'max': queries},
+            'latency': {'p50_ms': p50_ms}, 'requests_per_second': rps or round(1000 / p50_ms, 1),
+        }]}
+
+    def test_slower_or_more_queries_regress(self):
+        baseline = self.report(10, 3)
+
+        self.assertEqual(find_regressions(self.report(11.5, 3), baseline, 0.2), [])
+        self.assertEqual(find_regressions(self.report(13, 3), baseline, 0.2), [
+            'order list: p50 13.00 ms, was 10.00 ms', 'order list: 76.9 req/s, was 100.0 req/s',
+        ])
+        self.assertEqual(find_regressions(self.report(9, 4), baseline, 0.2),
+                         ['order list: 4 queries per request, was 3'])
+
+    def test_differences_within_noise_and_missing_scenarios(self):
+        self.assertEqual(find_regressions(self.report(0.6, 1), self.report(0.2, 1), 0.2), [])
+        self.assertEqual(find_regressions({'scenarios': []}, self.report(1, 1), 0.2),
+                         ['order list: in the baseline but not run'])
+
+
+@mock.patch.object(APIView, 'authentication_classes', [StatelessJWTAuthentication])
+class StatelessAuthenticationTests(EcomTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def login(self, user):
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_user_row_is_not_loaded(self):
+        self.create_orders(2)
+        self.login(self.customer)
+        self.client.get(reverse('order-list'))
+
+        # Orders and their items, no user lookup.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('order-list'))
+
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_customer_can_order(self):
+        product = self.create_product(stock=1)
+        self.login(self.customer)
+
+        response = self.client.post(reverse('order-list'), {'product': product.id, 'quantity': 1})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().customer, self.customer)
+
+    def test_customer_can_cancel_own_order(self):
+        order, = self.create_orders(1)
+        self.login(self.customer)
+
+        response = self.client.post(reverse('order-cancel', args=[order.id]))
+
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_CANCELLED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.login(self.customer)
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, 200)
+
+        self.customer.is_active = False
+        self.customer.save()
+
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, 401)
+
+    def test_role_change_applies_to_existing_tokens(self):
+        self.login(self.customer)
+        self.customer.role = User.ROLE_ADMIN
+        self.customer.save()
+
+        response = self.client.post(reverse('category-list'), {'name': 'Films'})
+
+        self.assertEqual(response.status_code, 201)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A second connection to the test database stands in for the replica, so
+    each query can be traced to the alias that ran it. Transactional, since
+    the replica connection only sees committed rows.
+    """
+    # Resolved in setUpClass, once the alias exists.
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings['replica'] = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        settings = self.settings(DATABASE_REPLICAS=['replica'], DATABASE_ROUTERS=['ecom.routers.ReplicaRouter'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        get_catalog_cache().clear()
+        self.admin = User.objects.create_user(username='admin', password='pass', role=User.ROLE_ADMIN)
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(name='Novel', category=self.category, price=Decimal('5.00'), stock=10)
+        # As if the catalog was last written well before the lag window.
+        version = int((timezone.now() - timedelta(minutes=1)).timestamp() * 10**9)
+        get_catalog_cache().set(CATALOG_VERSION_KEY, version, None)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def request(self, method, url, data=None):
+        """The response and the number of queries run on the primary and the replica."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, len(primary), len(replica)
+
+    def test_catalog_and_order_reads_use_the_replica(self):
+        Order.objects.create(customer=self.customer, product=self.product, total_price=self.product.price)
+        for url in (reverse('category-list'), reverse('category-detail', args=[self.category.pk]),
+                    reverse('product-list'), reverse('product-detail', args=[self.product.pk]),
+                    reverse('order-list')):
+            response, primary, replica = self.request('get', url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+    async def test_replica_chosen_in_a_worker_thread_is_released(self):
+        token = await sync_to_async(routers.use_replica)()
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Product), 'replica')
+
+        routers.release(token)
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Product), 'default')
+
+    def test_writes_and_other_actions_use_the_primary(self):
+        # The order takes its stock with a conditional UPDATE on the product.
+        response, primary, replica = self.request('post', reverse('order-list'),
+                                                  {'product': self.product.pk, 'quantity': 1})
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        response, primary, replica = self.request('get', f"{reverse('product-search')}?q=novel")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+
+    def test_reads_after_a_write_stick_to_the_primary(self):
+        self.request('post', reverse('order-list'), {'product': self.product.pk, 'quantity': 1})
+
+        response, primary, replica = self.request('get', reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual((primary > 0, replica), (True, 0))
+
+        # Another customer hasn't written.
+        self.client.force_authenticate(user=self.admin)
+        response, primary, replica = self.request('get', reverse('order-list'))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+        # Once the marker has expired with the window.
+        self.client.force_authenticate(user=self.customer)
+        self.assertTrue(routers.wrote_recently(self.customer))
+        get_catalog_cache().clear()
+        response, primary, replica = self.request('get', reverse('order-list'))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+    def test_catalog_reads_use_the_primary_right_after_a_catalog_write(self):
+        self.product.save()  # Bumps the catalog version.
+        response, primary, replica = self.request('get', reverse('product-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((primary > 0, replica), (True, 0))
+
+        response, primary, replica = self.request('get', reverse('order-list'))
+        self.assertEqual((primary, replica > 0), (0, True))
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    threads = 8
+    attempts = 10
+
+    def test_concurrent_checkouts_never_oversell(self):
+        customer = User.objects.create_user(username='customer', password='pass')
+        category = Category.objects.create(name='Books')
+        product = Product.objects.create(name='Novel', category=category, price=Decimal('5.00'), stock=25)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def checkout():
+            client = APIClient()
+            client.force_authenticate(user=customer)
+            barrier.wait()
+            try:
+                for _ in range(self.attempts):
+                    response = client.post(reverse('order-list'), {'product': product.id, 'quantity': 1})
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(statuses.count(201), 25)
+        self.assertEqual(statuses.count(400), self.threads * self.attempts - 25)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), 25)
+
+
+class JobWorkerTests(TransactionTestCase):
+    def test_worker_drains_the_queue_concurrently(self):
+        customer = User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+        category = Category.objects.create(name='Books')
+        product = Product.objects.create(name='Novel', category=category, price=Decimal('5.00'), stock=100)
+        orders = Order.objects.bulk_create(
+            Order(customer=customer, product=product, total_price=product.price) for _ in range(12)
+        )
+        jobs.enqueue_many(('orders.confirmation', {'order_id': order.id}) for order in orders)
+
+        counts = jobs.Worker(concurrency=4, poll_interval=0.05).run(once=True)
+
+        self.assertEqual(counts[Job.STATUS_DONE], 12)
+        self.assertEqual(len(mail.outbox), 12)
+        self.assertFalse(Job.objects.exclude(status=Job.STATUS_DONE).exists())
@@ -0,0 +1,202 @@
+"""
+Rate limiting with sliding-window counters.
+
+DRF's throttles keep a list of request timestamps per client and rewrite it
+on every request. Here each client has two counters, for the current and the
+previous fixed window, and the request rate is estimated as
+
+    previous * (time left of the previous window's overlap) + current
+
+which needs O(1) memory per client and one atomic increment per request.
+Every request is counted, including rejected ones, so a client that keeps
+retrying past its limit stays limited.
+
+The counters live in a store chosen by THROTTLE_STORE:
+
+- 'memory': a dict in each process. Limits are per process, like DRF's
+  throttles on the local-memory cache.
+- 'sqlite': a SQLite file (THROTTLE_SQLITE_PATH) shared by every worker on
+  the host; each request is one upsert.
+- 'cache': the THROTTLE_CACHE_ALIAS cache, shared across hosts when that
+  is Redis or memcached.
+"""
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+
+
+class MemoryStore:
+    """Counters in a dict, guarded by a lock."""
+    # Expired entries are dropped whenever the dict grows past this size.
+    max_keys = 100_000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # key -> [window, previous, current, expires]
+
+    def hit(self, key, window, duration, now):
+        with self.lock:
+            entry = self.counters.get(key)
+            if entry is None:
+                if len(self.counters) >= self.max_keys:
+                    self.sweep(now)
+                entry = self.counters[key] = [window, 0, 0, 0]
+            elif entry[0] != window:
+                entry[1] = entry[2] if entry[0] == window - 1 else 0
+                entry[2] = 0
+                entry[0] = window
+            entry[2] += 1
+            entry[3] = (window + 2) * duration
+            return entry[1], entry[2]
+
+    def sweep(self, now):
+        self.counters = {key: entry for key, entry in self.counters.items() if entry[3] > now}
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+
+
+class SQLiteStore:
+    """
+    Counters in a SQLite file, one row per client. The window roll-over and
+    the increment happen in a single upsert, which SQLite serializes across
+    processes.
+    """
+    # One request in this many also deletes expired rows.
+    sweep_every = 1000
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS throttle ('
+        ' key TEXT PRIMARY KEY, win INTEGER NOT NULL, previous INTEGER NOT NULL,'
+        ' current INTEGER NOT NULL, expires REAL NOT NULL'
+        ') WITHOUT ROWID'
+    )
+    # SET expressions all see the row as it was before the update.
+    upsert = (
+        'INSERT INTO throttle (key, win, previous, current, expires) VALUES (?, ?, 0, 1, ?) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        ' previous = CASE WHEN win = excluded.win THEN previous'
+        '                 WHEN win = excluded.win - 1 THEN current ELSE 0 END,'
+        ' current = CASE WHEN win = excluded.win THEN current + 1 ELSE 1 END,'
+        ' win = excluded.win, expires = excluded.expires '
+        'RETURNING previous, current'
+    )
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+        self.hits = 0
+
+    @property
+    def connection(self):
+        # One connection per thread, opened lazily so forked workers don't
+        # share the parent's.
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Losing the last counts on a power cut is fine for a rate limit.
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(self.schema)
+            self.local.connection = connection
+        return connection
+
+    def hit(self, key, window, duration, now):
+        connection = self.connection
+        previous, current = connection.execute(self.upsert, (key, window, (window + 2) * duration)).fetchone()
+        self.hits += 1
+        if self.hits % self.sweep_every == 0:
+            connection.execute('DELETE FROM throttle WHERE expires < ?', (now,))
+        return previous, current
+
+    def clear(self):
+        self.connection.execute('DELETE FROM throttle')
+
+
+class CacheStore:
+    """One cache key per client and window, incremented with `incr()`."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def hit(self, key, window, duration, now):
+        cache = caches[self.alias]
+        current_key = f'{key}:{window}'
+        # add() is a no-op if the key exists; incr() is atomic on Redis and
+        # memcached.
+        cache.add(current_key, 0, timeout=2 * duration)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.add(current_key, 1, timeout=2 * duration)
+            current = 1
+        return cache.get(f'{key}:{window - 1}', 0), current
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        name = settings.THROTTLE_STORE
+        if name == 'sqlite':
+            _store = SQLiteStore(settings.THROTTLE_SQLITE_PATH)
+        elif name == 'cache':
+            _store = CacheStore(settings.THROTTLE_CACHE_ALIAS)
+        else:
+            _store = MemoryStore()
+    return _store
+
+
+class SlidingWindowThrottleMixin:
+    """
+    Replaces SimpleRateThrottle's timestamp history with sliding-window
+    counters from `get_store()`. The cache key, rate and scope handling are
+    DRF's.
+    """
+    store = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        self.previous, self.current = (self.store or get_store()).hit(self.key, window, self.duration, self.now)
+
+        estimate = self.previous * (1 - self.elapsed / self.duration) + self.current
+        return estimate <= self.num_requests
+
+    def wait(self):
+        """Seconds until the estimated rate is back under the limit."""
+        if self.current > self.num_requests:
+            # Not in this window: wait for the next one, where this window's
+            # count is the previous one and decays linearly.
+            return (self.duration - self.elapsed) + self.duration * (1 - self.num_requests / self.current)
+        if not self.previous:
+            return self.duration - self.elapsed
+        # previous * (1 - t / duration) + current = num_requests
+        decayed = self.duration * (1 - (self.num_requests - self.current) / self.previous)
+        return max(decayed - self.elapsed, 0)
+
+
+class UserRateThrottle(SlidingWindowThrottleMixin, throttling.UserRateThrottle):
+    pass
+
+
+class AnonRateThrottle(SlidingWindowThrottleMixin, throttling.AnonRateThrottle):
+    pass
@@ -2,7 +2,10 @@ from rest_framework import viewsets, status, generics, permissions
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from .serializers import MyTokenObtainPairSerializer
 
 
@@ -11,13 +14,38 @@ from .serializers import (
     RegisterSerializer,
     CategorySerializer,
     ProductSerializer,
+    ProductValuesSerializer,
     OrderWriteSerializer,
     OrderReadSerializer,
+    OrderValuesSerializer,
+    OrderBulkCreateSerializer,
     OrderChangeStatusSerializer,
+    SalesQuerySerializer,
+    SalesRowSerializer,
+    AnalyticsRangeSerializer,
+    LowStockQuerySerializer,
+    LowStockProductSerializer,
 )
 from .permissions import IsAdminRole, IsCustomerRole
+from .pagination import OrderPagination, ProductPagination
+from .filters import OrderFilter, ProductFilter
+from .mixins import (
+    AsyncReadMixin, CatalogCacheMixin, ConditionalGetMixin, ExportMixin, RelatedQuerysetMixin, ReplicaReadMixin,
+)
+from .imports import CatalogImport, read_rows
+from .search import search_products
+from . import analytics, compression, exports, metrics, schema, tasks
 # ecom/views.py
+import hashlib
+import io
+
+from django.conf import settings
+from django.db import transaction
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
 
 def api_home(request):
     html = """
@@ -70,6 +98,9 @@ def api_home(request):
             <ul>
                 <li><code>GET /api/v1/products/</code> — List active products (customers), all (admin)</li>
                 <li><code>POST /api/v1/products/</code> — Create (admin only) <span class="badge">ADMIN</span></li>
+                <li><code>GET /api/v1/products/search/?q=</code> — Ranked name search with prefix and typo matching</li>
+                <li><code>POST /api/v1/products/import/</code> — Create or update products from a CSV/JSON file or array (admin) <span class="badge">ADMIN</span></li>
+                <li><code>GET /api/v1/products/export/?output=csv|ndjson</code> — Stream the filtered list (admin) <span class="badge">ADMIN</span></li>
                 <li><code>GET /api/v1/products/&lt;id&gt;/</code> — Retrieve</li>
                 <li><code>PUT,PATCH /api/v1/products/&lt;id&gt;/</code> — Update (admin) <span class="badge">ADMIN</span></li>
                 <li><code>DELETE /api/v1/products/&lt;id&gt;/</code> — Delete (admin) <span class="badge">ADMIN</span></li>
@@ -77,13 +108,27 @@ def api_home(request):
 
             <h2>🛒 Orders</h2>
             <ul>
-                <li><code>POST /api/v1/orders/</code> — Create order (customer only) <span class="badge">CUSTOMER</span></li>
+                <li><code>POST /api/v1/orders/</code> — Create an order with one or more items (customer only) <span class="badge">CUSTOMER</span></li>
+                <li><code>POST /api/v1/orders/bulk/</code> — Create one order per item (customer only) <span class="badge">CUSTOMER</span></li>
                 <li><code>GET /api/v1/orders/</code> — List own orders (customer) or all (admin)</li>
+                <li><code>GET /api/v1/orders/export/?output=csv|ndjson</code> — Stream the filtered list, one CSV line per item (admin) <span class="badge">ADMIN</span></li>
                 <li><code>GET /api/v1/orders/&lt;id&gt;/</code> — Retrieve order</li>
                 <li><code>POST /api/v1/orders/&lt;id&gt;/cancel/</code> — Cancel pending order (customer) <span class="badge">CUSTOMER</span></li>
                 <li><code>POST /api/v1/orders/&lt;id&gt;/change_status/</code> — Update status (admin) <span class="badge">ADMIN</span></li>
             </ul>
 
+            <h2>📈 Analytics</h2>
+            <ul>
+                <li><code>GET /api/v1/analytics/sales/?group_by=day|category|product</code> — Orders, units and revenue <span class="badge">ADMIN</span></li>
+                <li><code>GET /api/v1/analytics/order-status/</code> — Order counts by status <span class="badge">ADMIN</span></li>
+                <li><code>GET /api/v1/analytics/low-stock/?threshold=</code> — Products at or below a stock level <span class="badge">ADMIN</span></li>
+            </ul>
+
+            <h2>⏱️ Metrics</h2>
+            <ul>
+                <li><code>GET /api/v1/metrics/</code> — Per-route request histograms, Prometheus format <span class="badge">ADMIN</span></li>
+            </ul>
+
             <footer>
                 <p>Powered by Shubham Nirmal • JWT Auth • drf-spectacular</p>
             </footer>
@@ -150,7 +195,7 @@ class RefreshTokenView(TokenRefreshView):
     permission_classes = [permissions.AllowAny]
     
     
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CatalogCacheMixin, AsyncReadMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
@@ -160,67 +205,212 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated(), IsAdminRole()]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CatalogCacheMixin, RelatedQuerysetMixin, AsyncReadMixin, ExportMixin,
+                     ReplicaReadMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['id', 'price']
+    export_filename = 'products'
+    export_fields = exports.PRODUCT_FIELDS
+
+    def get_export_records(self, queryset):
+        return exports.product_records(queryset)
+
+    def get_serializer_class(self):
+        # drf-spectacular can't introspect the values serializer; the schema
+        # documents ProductSerializer, which renders the same.
+        fast = settings.FAST_READ_SERIALIZERS and not getattr(self, 'swagger_fake_view', False)
+        if self.action in ['list', 'retrieve'] and fast:
+            return ProductValuesSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
-        qs = Product.objects.all()
+        qs = super().get_queryset()
         if not self.request.user.is_admin:
             return qs.filter(is_active=True)
         return qs
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             return [IsAuthenticated()]
         return [IsAuthenticated(), IsAdminRole()]
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': "The 'q' query parameter is required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({'detail': "'limit' must be an integer."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ids = search_products(query, limit=limit, include_inactive=request.user.is_admin)
+        products = self.get_queryset().in_bulk(ids)
+        ranked = [products[pk] for pk in ids if pk in products]
+        return Response({'count': len(ranked), 'results': self.get_serializer(ranked, many=True).data})
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import')
+    def import_catalog(self, request):
+        """
+        Upsert products from an uploaded CSV/NDJSON/JSON `file`, or from a
+        JSON array body, reporting the rows that were rejected.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            fmt = 'csv' if upload.name.lower().endswith('.csv') else 'json'
+            rows = read_rows(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), fmt)
+        elif isinstance(request.data, list):
+            rows = enumerate(request.data, start=1)
+        else:
+            return Response({'detail': "Upload a CSV or JSON 'file', or send a JSON array of products."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        importer = CatalogImport(
+            create_categories=request.query_params.get('create_categories', '').lower() in ('1', 'true', 'yes'),
+        )
+        try:
+            report = importer.run(rows)
+        except ValueError as exc:
+            return Response({'detail': f'Could not read the file: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        imported = report['created'] + report['updated']
+        if not report['rejected']:
+            response_status = status.HTTP_200_OK
+        elif imported:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, RelatedQuerysetMixin, ExportMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     - Customers:
       • create (validated by OrderWriteSerializer)
+      • bulk-create one order per item (validated by OrderBulkCreateSerializer)
       • list/retrieve own orders
       • cancel own pending orders
     - Admins:
       • list/retrieve all orders
       • change_status on any order (validated by OrderChangeStatusSerializer)
+      • export the filtered list as CSV/NDJSON
+    Orders aren't edited with PUT/PATCH: their items, total_price, reserved
+    stock and the analytics rollups are only kept consistent by create,
+    cancel, change_status and delete.
     """
+    queryset = Order.objects.all()
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = OrderFilter
+    ordering_fields = ['created_at']
+    export_filename = 'orders'
+    export_fields = exports.ORDER_FIELDS
+    export_item_fields = exports.ORDER_ITEM_FIELDS
 
     def get_queryset(self):
         user = self.request.user
-        return Order.objects.all() if user.is_admin else Order.objects.filter(customer=user)
+        qs = super().get_queryset()
+        if self.action == 'retrieve' and self.get_serializer_class() is OrderValuesSerializer:
+            qs = qs.values(*OrderValuesSerializer.values_fields, *OrderValuesSerializer.stamp_fields)
+        return qs if user.is_admin else qs.filter(customer_id=user.id)
+
+    def get_object(self):
+        # get_validators() loads the order before retrieve() does.
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def get_validators(self):
+        if self.action != 'retrieve':
+            return None, None
+        order = self.get_object()
+        # The representation embeds each product and its category name; the
+        # items come from the prefetch retrieve() serializes anyway.
+        if isinstance(order, dict):
+            OrderValuesSerializer.load_items([order], stamps=True)
+            products = [(row['product__updated_at'], row['product__category__updated_at'])
+                        for row in [*order['items'], order] if row['product_id'] is not None]
+            pk, stamps = order['id'], [order['updated_at']]
+        else:
+            products = [(item.product.updated_at, item.product.category.updated_at) for item in order.items.all()]
+            if order.product is not None:
+                products.append((order.product.updated_at, order.product.category.updated_at))
+            pk, stamps = order.pk, [order.updated_at]
+        for product_stamps in products:
+            stamps += product_stamps
+        key = ':'.join([str(pk)] + [stamp.isoformat() for stamp in stamps])
+        return quote_etag(hashlib.md5(key.encode()).hexdigest()), int(max(stamps).timestamp())
 
     def get_serializer_class(self):
         if self.action == 'change_status':
             return OrderChangeStatusSerializer
+        if self.action == 'bulk':
+            return OrderBulkCreateSerializer
         if self.action in ['list', 'retrieve']:
-            return OrderReadSerializer
+            # As for products, the schema documents OrderReadSerializer.
+            fast = settings.FAST_READ_SERIALIZERS and not getattr(self, 'swagger_fake_view', False)
+            return OrderValuesSerializer if fast else OrderReadSerializer
         return OrderWriteSerializer
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ['create', 'bulk']:
             return [IsAuthenticated(), IsCustomerRole()]
         if self.action == 'cancel':
             return [IsAuthenticated(), IsCustomerRole()]
-        if self.action == 'change_status':
+        if self.action in ['change_status', 'export']:
             return [IsAuthenticated(), IsAdminRole()]
         return [IsAuthenticated()]
 
+    def get_export_records(self, queryset):
+        return exports.order_records(queryset)
+
     def perform_create(self, serializer):
-        serializer.save(customer=self.request.user)
+        serializer.save(customer_id=self.request.user.id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            analytics.order_removed(instance)
+            instance.delete()
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(customer_id=request.user.id)
+
+        results = serializer.data['results']
+        created = sum(1 for result in results if result['status'] == 'created')
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(serializer.data, status=response_status)
 
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel(self, request, pk=None):
         order = self.get_object()
-        if order.customer != request.user:
+        if order.customer_id != request.user.id:
             return Response({'detail': "You can only cancel your own orders."},
                             status=status.HTTP_403_FORBIDDEN)
         if order.status != Order.STATUS_PENDING:
             return Response({'detail': "Only pending orders can be cancelled."},
                             status=status.HTTP_400_BAD_REQUEST)
-        order.status = Order.STATUS_CANCELLED
-        order.save(update_fields=['status'])
+        with transaction.atomic():
+            if not analytics.change_status(order, Order.STATUS_CANCELLED):
+                # Its status changed since we loaded it.
+                return Response({'detail': "Only pending orders can be cancelled."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            tasks.status_changed(order)
         return Response({'status': 'cancelled'})
 
     @action(detail=True, methods=['post'], url_path='change_status')
@@ -228,6 +418,99 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         order = self.get_object()
-        order.status = serializer.validated_data['status']
-        order.save(update_fields=['status'])
+        with transaction.atomic():
+            if not analytics.change_status(order, serializer.validated_data['status']):
+                return Response({'detail': "The order's status was changed by another request; reload it and retry."},
+                                status=status.HTTP_409_CONFLICT)
+            tasks.status_changed(order)
         return Response({'status': order.status})
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Admin reports. Sales and status counts come from the rollup tables that
+    ecom.analytics keeps up to date as orders are placed and change status,
+    so no request aggregates the orders table.
+    """
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def get_query(self, serializer_class):
+        serializer = serializer_class(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    @action(detail=False, methods=['get'], url_path='sales')
+    def sales(self, request):
+        query = self.get_query(SalesQuerySerializer)
+        rows = analytics.sales_report(query['start'], query['end'], query['group_by'], query['limit'])
+        return Response({
+            'start': query['start'],
+            'end': query['end'],
+            'group_by': query['group_by'],
+            'results': SalesRowSerializer(rows, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path='order-status')
+    def order_status(self, request):
+        query = self.get_query(AnalyticsRangeSerializer)
+        return Response({
+            'start': query['start'],
+            'end': query['end'],
+            'results': analytics.status_counts(query['start'], query['end']),
+        })
+
+    @action(detail=False, methods=['get'], url_path='low-stock')
+    def low_stock(self, request):
+        query = self.get_query(LowStockQuerySerializer)
+        # Walks product_stock_idx from the lowest stock up.
+        products = (
+            Product.objects.select_related(*LowStockProductSerializer.select_related_fields)
+            .filter(stock__lte=query['threshold']).order_by('stock', 'id')[:query['limit']]
+        )
+        return Response({
+            'threshold': query['threshold'],
+            'results': LowStockProductSerializer(products, many=True).data,
+        })
+
+
+class MetricsView(APIView):
+    """Request metrics of this process, in the Prometheus text format."""
+    permission_classes = [IsAuthenticated, IsAdminRole]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SchemaView(SpectacularAPIView):
+    """
+    The OpenAPI schema from memory (ecom/schema.py), in the format the
+    client negotiated and the best encoding it accepts, with an ETag.
+    Translated (?lang=) or versioned (?version=) schemas and media type
+    parameters such as indent are still generated per request.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        media_type = request.accepted_media_type
+        if request.GET.get('lang') or request.GET.get('version') or ';' in media_type:
+            return super().get(request, *args, **kwargs)
+
+        cached = schema.get_schema()
+        format = request.accepted_renderer.format
+        accepted = compression.accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = next((encoding for encoding in cached.encodings(format) if encoding in accepted), None)
+        etag = cached.etags[format, encoding]
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            charset = request.accepted_renderer.charset
+            response = HttpResponse(
+                cached.bodies[format, encoding],
+                content_type=f'{media_type}; charset={charset}' if charset else media_type,
+                headers={'Content-Disposition': f'inline; filename="{self._get_filename(request, None)}"'},
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
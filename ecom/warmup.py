@@ -0,0 +1,54 @@
+"""
+Worker warm-up, run by gunicorn in each worker before it accepts requests
+(gunicorn.conf.py). Without it the first requests a worker serves open its
+database connections, import the views and serializers through the
+URLconf, load DRF's and simplejwt's lazily imported classes and load the
+password hasher's library.
+"""
+import time
+
+from django.db import connections
+from django.urls import get_resolver
+
+from . import hashers, schema
+
+
+def open_connections():
+    """Fill each database's pool, or open this thread's persistent connection."""
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool:
+            pool.open(wait=True, timeout=pool.timeout)
+        else:
+            connection.ensure_connection()
+
+
+def load_urlconf():
+    # Importing the URLconf imports every view and serializer; the reverse
+    # lookup tables are built on first use.
+    get_resolver().reverse_dict
+
+
+STEPS = (
+    ('database', open_connections),
+    ('urls', load_urlconf),
+    # Loads the schema built for this code, or generates it, which
+    # instantiates every view and serializer the way requests do.
+    ('schema', schema.get_schema),
+    ('password hashing', hashers.load_hasher),
+)
+
+
+def warm_up(log=None):
+    """Run every step; returns the seconds each took."""
+    timings = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    if log is not None:
+        log('Warmed up in %.0f ms (%s)' % (
+            sum(timings.values()) * 1000,
+            ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in timings.items()),
+        ))
+    return timings
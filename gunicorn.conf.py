@@ -0,0 +1,16 @@
+"""
+gunicorn settings, read from the working directory unless -c names another
+file. Command-line options still apply on top.
+"""
+
+
+def post_worker_init(worker):
+    # Runs in each worker once it has loaded the application and before it
+    # accepts connections. post_fork would be too early: the worker hasn't
+    # imported Django yet.
+    from django.conf import settings
+
+    if settings.WORKER_WARMUP:
+        from ecom.warmup import warm_up
+
+        warm_up(log=worker.log.info)